@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026
+# @Author  : WangHaoyu
+# @E-mail  : wanghy0707@gmail.com
+# @Github  :
+# @desc    :
+
+
+import os
+import gzip
+import struct
+import zlib
+
+
+class BgzfReader:
+    """
+    BGZF（分块gzip）文件读取：按块解压，支持以虚拟偏移（块在压缩文件中的偏移<<16 | 块内解压后偏移）进行定位
+    //2026.10.18 新增：用于直接读取BAM文件（及bgzip压缩的vcf文件），无需依赖外部工具
+    """
+
+    def __init__(self, path):
+        """
+        path: BGZF文件的路径
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.block_coffset = 0  # 当前块在压缩文件中的偏移
+        self.block_next = 0  # 下一块在压缩文件中的偏移
+        self.block_data = b""  # 当前块解压后的内容
+        self.block_pos = 0  # 当前块内的读取位置
+        self._load_block(0)
+
+    def _load_block(self, coffset):
+        """
+        读取并解压位于coffset处的块（若已是当前块则不再重复解压）
+        """
+        if coffset == self.block_coffset and self.block_next > coffset:
+            return
+
+        self.file.seek(coffset)
+        header = self.file.read(18)
+        if len(header) < 18:  # 文件末尾
+            self.block_coffset, self.block_next, self.block_data = coffset, coffset, b""
+            return
+        if header[:4] != b"\x1f\x8b\x08\x04":
+            raise ValueError('"{}" is not a BGZF file'.format(self.path))
+
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = header[12:18] + self.file.read(xlen - 6)
+        bsize = None
+        i = 0
+        while i < xlen:  # 在额外字段中查找BC子字段（块大小-1）
+            si1, si2, slen = extra[i], extra[i + 1], struct.unpack("<H", extra[i + 2:i + 4])[0]
+            if si1 == 66 and si2 == 67:
+                bsize = struct.unpack("<H", extra[i + 4:i + 6])[0]
+            i += 4 + slen
+        if bsize is None:
+            raise ValueError('"{}" is not a BGZF file'.format(self.path))
+
+        cdata = self.file.read(bsize - xlen - 19)
+        self.file.read(8)  # CRC32与ISIZE
+        self.block_coffset = coffset
+        self.block_next = coffset + bsize + 1
+        self.block_data = zlib.decompress(cdata, -15)
+        self.block_pos = 0
+
+    def seek(self, voffset):
+        """
+        定位至虚拟偏移voffset
+        """
+        self._load_block(voffset >> 16)
+        self.block_pos = voffset & 0xFFFF
+
+    def tell(self):
+        """
+        输出当前读取位置的虚拟偏移
+        """
+        if self.block_pos == len(self.block_data) and self.block_data:  # 当前块已读完，则位置等价于下一块起始
+            return self.block_next << 16
+        return (self.block_coffset << 16) | self.block_pos
+
+    def read(self, size):
+        """
+        读取size个字节（解压后），到达文件末尾时输出的字节数可少于size
+        """
+        ls_data = []
+        while size > 0:
+            if self.block_pos >= len(self.block_data):
+                if self.block_next == self.block_coffset:  # 文件末尾
+                    break
+                self._load_block(self.block_next)
+                continue
+
+            data = self.block_data[self.block_pos:self.block_pos + size]
+            self.block_pos += len(data)
+            size -= len(data)
+            ls_data.append(data)
+        return b"".join(ls_data)
+
+    def readline(self):
+        """
+        读取一行（解压后，包含行尾的换行符）
+        """
+        ls_data = []
+        while True:
+            if self.block_pos >= len(self.block_data):
+                if self.block_next == self.block_coffset:
+                    break
+                self._load_block(self.block_next)
+                continue
+
+            index = self.block_data.find(b"\n", self.block_pos)
+            if index >= 0:
+                ls_data.append(self.block_data[self.block_pos:index + 1])
+                self.block_pos = index + 1
+                break
+            ls_data.append(self.block_data[self.block_pos:])
+            self.block_pos = len(self.block_data)
+        return b"".join(ls_data)
+
+    def close(self):
+        self.file.close()
+
+
+class BinIndex:
+    """
+    BAM（.bai）与tabix（.tbi）共用的分箱索引：按区间计算可能包含目标记录的分箱，输出需读取的虚拟偏移区间（chunk）
+    //2026.10.18 新增
+    """
+
+    def __init__(self, ls_ref_bin, ls_ref_intv):
+        """
+        ls_ref_bin: 每条参考序列的分箱字典 {bin: [(chunk_beg, chunk_end), ...]}
+        ls_ref_intv: 每条参考序列的线性索引（每16kb窗口中第一条记录的虚拟偏移）
+        """
+        self.ls_ref_bin = ls_ref_bin
+        self.ls_ref_intv = ls_ref_intv
+
+    @classmethod
+    def _read_ref(cls, data, off, n_ref):
+        """
+        从索引内容的off处起读取n_ref条参考序列的分箱与线性索引，输出(ls_ref_bin, ls_ref_intv, 读取结束的位置)
+        """
+        ls_ref_bin = []
+        ls_ref_intv = []
+        for _ in range(n_ref):
+            n_bin = struct.unpack_from("<i", data, off)[0]
+            off += 4
+            dict_bin = {}
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from("<Ii", data, off)
+                off += 8
+                chunks = struct.unpack_from("<{}Q".format(n_chunk * 2), data, off)
+                off += 16 * n_chunk
+                if bin_id != 37450:  # 跳过记录统计信息的伪分箱
+                    dict_bin[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            n_intv = struct.unpack_from("<i", data, off)[0]
+            off += 4
+            ls_ref_intv.append(struct.unpack_from("<{}Q".format(n_intv), data, off))
+            off += 8 * n_intv
+            ls_ref_bin.append(dict_bin)
+        return ls_ref_bin, ls_ref_intv, off
+
+    @classmethod
+    def load_bai(cls, path):
+        """
+        读取BAM索引文件（.bai）
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        if data[:4] != b"BAI\x01":
+            raise ValueError('"{}" is not a BAI file'.format(path))
+
+        n_ref = struct.unpack_from("<i", data, 4)[0]
+        ls_ref_bin, ls_ref_intv, _ = cls._read_ref(data, 8, n_ref)
+        return cls(ls_ref_bin, ls_ref_intv)
+
+    @classmethod
+    def _reg2bins(cls, beg, end):
+        """
+        计算与区间[beg, end)（0起始）可能重叠的所有分箱
+        """
+        end -= 1
+        ls_bin = [0]
+        for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+            ls_bin.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+        return ls_bin
+
+    def chunks(self, tid, beg, end):
+        """
+        输出第tid条参考序列上区间[beg, end)（0起始）需读取的、已排序合并的虚拟偏移区间
+        """
+        if tid >= len(self.ls_ref_bin):
+            return []
+        dict_bin = self.ls_ref_bin[tid]
+        ls_intv = self.ls_ref_intv[tid]
+
+        min_offset = 0  # 线性索引：区间起始所在窗口之前的记录均无需读取
+        if ls_intv:
+            min_offset = ls_intv[min(beg >> 14, len(ls_intv) - 1)]
+
+        ls_chunk = sorted(chunk for bin_id in self._reg2bins(beg, end) for chunk in dict_bin.get(bin_id, [])
+                          if chunk[1] > min_offset)
+
+        ls_merge = []
+        for chunk_beg, chunk_end in ls_chunk:
+            if ls_merge and chunk_beg <= ls_merge[-1][1]:
+                ls_merge[-1][1] = max(ls_merge[-1][1], chunk_end)
+            else:
+                ls_merge.append([chunk_beg, chunk_end])
+        return ls_merge
+
+
+class BamReader:
+    """
+    BAM文件读取：将每条记录转化为与sam文件一行相同的列表（QNAME, FLAG, RNAME, POS, MAPQ, CIGAR, RNEXT, PNEXT, TLEN, SEQ,
+    QUAL），可直接交由PreSam进行过滤
+    //2026.10.18 新增：支持按.bai索引仅读取与指定区间重叠的记录
+    //bam_reader = BamReader("C:/Users/Hao_Yu/Desktop/use/bamfile/S1.bam")
+    //for line in bam_reader.fetch_regions({"NC_000001.11": [(247032239, 247032300)]}): ...
+    """
+
+    CIGAR_OP = "MIDNSHP=X"
+    SEQ_BASE = "=ACMGRSVTWYHKDBN"
+
+    def __init__(self, path, index_path=None):
+        """
+        path: BAM文件路径
+        index_path: BAM索引文件路径，为None时自动查找"xx.bam.bai"或"xx.bai"
+        """
+        self.path = path
+        self.bgzf = BgzfReader(path)
+
+        if self.bgzf.read(4) != b"BAM\x01":
+            raise ValueError('"{}" is not a BAM file'.format(path))
+        l_text = struct.unpack("<i", self.bgzf.read(4))[0]
+        self.header_text = self.bgzf.read(l_text).rstrip(b"\x00").decode("utf-8")
+
+        n_ref = struct.unpack("<i", self.bgzf.read(4))[0]
+        self.ls_ref_name = []  # 参考序列名称（按tid顺序）
+        for _ in range(n_ref):
+            l_name = struct.unpack("<i", self.bgzf.read(4))[0]
+            self.ls_ref_name.append(self.bgzf.read(l_name)[:-1].decode("utf-8"))
+            self.bgzf.read(4)
+        self.record_voffset = self.bgzf.tell()  # 第一条记录的虚拟偏移
+
+        if index_path is None:
+            for index_path_try in (path + ".bai", os.path.splitext(path)[0] + ".bai"):
+                if os.path.exists(index_path_try):
+                    index_path = index_path_try
+                    break
+        self.index = BinIndex.load_bai(index_path) if index_path else None
+
+        """预先生成4位编码碱基对（1字节）到两个碱基的转换表"""
+        self.ls_byte_base = [self.SEQ_BASE[i >> 4] + self.SEQ_BASE[i & 15] for i in range(256)]
+
+    def header(self):
+        """
+        输出头文件（每行为一个列表）
+        """
+        return [line.split("\t") for line in self.header_text.split("\n") if line]
+
+    def _read_record(self):
+        """
+        读取当前位置的一条记录，输出(tid, pos(0起始), 参考序列上的终止位置(不含), sam行列表)，文件末尾时输出None
+        """
+        data = self.bgzf.read(4)
+        if len(data) < 4:
+            return None
+        block_size = struct.unpack("<i", data)[0]
+        data = self.bgzf.read(block_size)
+
+        (tid, pos, l_read_name, mapq, _, n_cigar_op, flag, l_seq,
+         next_tid, next_pos, tlen) = struct.unpack_from("<iiBBHHHiiii", data, 0)
+        off = 32
+        read_name = data[off:off + l_read_name - 1].decode("utf-8")
+        off += l_read_name
+
+        ls_cigar = struct.unpack_from("<{}I".format(n_cigar_op), data, off)
+        off += 4 * n_cigar_op
+        cigar = "".join("{}{}".format(op >> 4, self.CIGAR_OP[op & 15]) for op in ls_cigar) or "*"
+        end = pos + sum(op >> 4 for op in ls_cigar if self.CIGAR_OP[op & 15] in "MDN=X")
+
+        seq = "".join(self.ls_byte_base[b] for b in data[off:off + (l_seq + 1) // 2])[:l_seq] or "*"
+        off += (l_seq + 1) // 2
+        qual = data[off:off + l_seq]
+        qual = "*" if not l_seq or qual[0] == 255 else "".join(chr(q + 33) for q in qual)
+
+        ref_name = self.ls_ref_name[tid] if tid >= 0 else "*"
+        if next_tid < 0:
+            next_ref_name = "*"
+        else:
+            next_ref_name = "=" if next_tid == tid else self.ls_ref_name[next_tid]
+
+        line = [read_name, str(flag), ref_name, str(pos + 1), str(mapq), cigar,
+                next_ref_name, str(next_pos + 1), str(tlen), seq, qual]
+        return tid, pos, max(end, pos + 1), line
+
+    def iter_records(self):
+        """
+        按文件顺序逐条输出所有记录（先输出头文件行）
+        """
+        yield from self.header()
+
+        self.bgzf.seek(self.record_voffset)
+        while True:
+            record = self._read_record()
+            if record is None:
+                break
+            yield record[3]
+
+    def fetch_regions(self, dict_ref_region):
+        """
+        依据索引仅输出与指定区间重叠的记录（先输出头文件行），同一条记录即使与多个区间重叠也只输出一次
+        dict_ref_region: {参考序列名称: [(beg, end), ...]}，区间为0起始、左闭右开
+        """
+        if self.index is None:
+            raise ValueError('no BAM index (.bai) found for "{}"'.format(self.path))
+
+        yield from self.header()
+
+        for tid, ref_name in enumerate(self.ls_ref_name):  # 按头文件中参考序列的顺序输出，保持坐标排序
+            ls_region = self._merge_region(dict_ref_region.get(ref_name, []))
+
+            prev_end = -1
+            for beg, end in ls_region:
+                for chunk_beg, chunk_end in self.index.chunks(tid, beg, end):
+                    self.bgzf.seek(chunk_beg)
+
+                    while self.bgzf.tell() < chunk_end:
+                        record = self._read_record()
+                        if record is None:
+                            break
+                        record_tid, record_pos, record_end, line = record
+
+                        if record_tid != tid or record_pos >= end:  # 已超出当前区间
+                            break
+                        if record_end <= beg:  # 未到达当前区间
+                            continue
+                        if record_pos < prev_end:  # 该记录与上一区间重叠，已输出过
+                            continue
+                        yield line
+                prev_end = end
+
+    @classmethod
+    def _merge_region(cls, ls_region):
+        """
+        对区间排序，并合并重叠或相邻的区间
+        """
+        ls_merge = []
+        for beg, end in sorted(ls_region):
+            if ls_merge and beg <= ls_merge[-1][1]:
+                ls_merge[-1][1] = max(ls_merge[-1][1], end)
+            else:
+                ls_merge.append([beg, end])
+        return ls_merge
+
+    def close(self):
+        self.bgzf.close()
+
+
+class TabixReader:
+    """
+    bgzip压缩、tabix索引（.tbi）的文本文件读取（如vcf.gz）：按区间仅读取对应的行
+    //2026.10.18 新增
+    """
+
+    def __init__(self, path, index_path=None):
+        """
+        path: bgzip压缩文件的路径
+        index_path: tabix索引路径，为None时使用"xx.gz.tbi"
+        """
+        self.path = path
+        self.bgzf = BgzfReader(path)
+
+        if index_path is None:
+            index_path = path + ".tbi"
+        with gzip.open(index_path, "rb") as file:  # tbi本身为BGZF压缩格式
+            data = file.read()
+        if data[:4] != b"TBI\x01":
+            raise ValueError('"{}" is not a tabix index'.format(index_path))
+
+        n_ref, _, self.col_seq, self.col_beg, _, meta, _, l_nm = struct.unpack_from("<8i", data, 4)
+        self.meta = chr(meta)  # 注释行的起始字符
+        self.ls_ref_name = data[36:36 + l_nm].rstrip(b"\x00").decode("utf-8").split("\x00") if l_nm else []
+        ls_ref_bin, ls_ref_intv, _ = BinIndex._read_ref(data, 36 + l_nm, n_ref)
+        self.index = BinIndex(ls_ref_bin, ls_ref_intv)
+
+    def fetch_lines(self, ref_name, beg, end):
+        """
+        输出参考序列ref_name上起始位置（1起始）在(beg, end]内的所有行（字符串，不含换行符）
+        """
+        if ref_name not in self.ls_ref_name:
+            return
+        tid = self.ls_ref_name.index(ref_name)
+
+        for chunk_beg, chunk_end in self.index.chunks(tid, beg, end):
+            self.bgzf.seek(chunk_beg)
+
+            while self.bgzf.tell() < chunk_end:
+                line = self.bgzf.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8").rstrip("\n")
+                if not line or line.startswith(self.meta):
+                    continue
+
+                ls_line = line.split("\t", self.col_beg)
+                if ls_line[self.col_seq - 1] != ref_name:
+                    continue
+                pos = int(ls_line[self.col_beg - 1])
+                if pos > end:  # 已超出区间
+                    break
+                if pos > beg:
+                    yield line
+
+    def close(self):
+        self.bgzf.close()
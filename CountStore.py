@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026
+# @Author  : WangHaoyu
+# @E-mail  : wanghy0707@gmail.com
+# @Github  :
+# @desc    :
+
+
+import abc
+import collections.abc
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+"""
+MH匹配结果的紧凑计数表：每个MH一个扁平字典，键为整数编码，不再为每个primer、allele、UMI各建一层字典
+序列编码（64位）：
+    仅含A/C/G/T且长度不超过31的序列以2bit编码（高位在前），并在最高位前加1作为长度标记，即 (1 << 2*len) | 碱基编码
+    其余序列（含N等其他字符、过长或为空）在编码表中登记，编码为 (1 << 63) | 登记序号
+匹配计数表（MatchCount）的键：primer序号 << 128 | allele编码 << 64 | UMI编码，值为count
+purity计数表（PurityCount）的键：UMI编码，值为 count << 65 | 重新计数标记 << 64 | allele编码
+按MH ID取值时转化为原先的嵌套字典格式（仅转化该MH），因此可直接用于MHMatch.match_filter、Toolsbox.FileTools.save_file_match
+也可按MH输出列式的编码数组（columns），用于向量化过滤
+计数表可溢写（spill）：内存中的计数按(MH序号, 键)排序后写入临时文件（有序计数段）并清空，按MH取值时将各段及内存中的
+计数归并，归并结果（含顺序）与不溢写时一致，内存占用仅为单个MH的计数
+UMI纠错聚类：UMIIndex（汉明距离为1的邻居索引）、umi_directional（directional adjacency聚类）
+//2026.10.18 新增
+"""
+
+_BIT = 64
+_MASK = (1 << _BIT) - 1
+_ESCAPE = 1 << (_BIT - 1)  # 登记序列编码的标记位
+_MAX_PACK_LEN = (_BIT - 2) // 2  # 以2bit编码的最大序列长度
+
+_TRANS = str.maketrans("ACGT", "0123")
+_DECODE_PAIR = {"00": "A", "01": "C", "10": "G", "11": "T"}
+
+_PURITY_RESET = 1 << _BIT  # purity计数表中的重新计数标记
+_PURITY_COUNT_SHIFT = _BIT + 1
+_PURITY_ONE = 1 << _PURITY_COUNT_SHIFT
+
+"""有序计数段的记录：MH序号、键（高位至低位3段）、值（高位、低位2段）、所在段序号、在该段MH扁平字典中的位置"""
+_RUN_DTYPE = np.dtype([("mh", np.int64), ("k0", np.uint64), ("k1", np.uint64), ("k2", np.uint64),
+                       ("v0", np.uint64), ("v1", np.uint64), ("run", np.int64), ("pos", np.int64)])
+
+
+def _first_index(array):
+    """
+    对二维数组的每一行，输出与其相同的行首次出现的位置
+    """
+    if len(array) == 0:
+        return np.zeros(0, dtype=np.int64)
+    _, array_first, array_inverse = np.unique(array, axis=0, return_index=True, return_inverse=True)
+    return array_first[array_inverse.reshape(-1)]
+
+
+class SeqCode:
+    """
+    序列与64位整数编码的相互转化（详见模块说明）
+    //seq_code = SeqCode()
+    //seq_code.decode(seq_code.encode("ACGTAC"))
+    //>>> 'ACGTAC'
+    """
+
+    def __init__(self):
+        self.dict_seq = {}  # 登记的序列 -> 登记序号
+        self.ls_seq = []  # 登记的序列
+
+    def encode(self, seq):
+        """
+        输出序列的编码
+        """
+        if len(seq) <= _MAX_PACK_LEN and seq.isalpha():
+            digit = seq.translate(_TRANS)
+            if digit.isdigit():  # 仅含A/C/G/T（其他字母不会被转化为数字）
+                return (1 << 2 * len(digit)) | int(digit, 4)
+
+        index = self.dict_seq.get(seq)
+        if index is None:
+            index = self.dict_seq[seq] = len(self.ls_seq)
+            self.ls_seq.append(seq)
+        return _ESCAPE | index
+
+    def decode(self, code):
+        """
+        输出编码对应的序列
+        """
+        if code & _ESCAPE:
+            return self.ls_seq[code & ~_ESCAPE]
+        bits = bin(code)[3:]  # 去掉"0b"及长度标记
+        return "".join([_DECODE_PAIR[bits[i:i + 2]] for i in range(0, len(bits), 2)])
+
+
+class _MHCount(collections.abc.Mapping):
+    """
+    按MH储存的计数表基类：ls_id中的每个MH对应一个扁平字典；作为只读映射使用时，按MH ID输出该MH的嵌套字典
+    """
+
+    ENTRY_SIZE = 160  # 单条计数估计占用的内存（字节）：扁平字典的表项及整数键、值
+
+    def __init__(self, ls_id, seq_code=None, spill_dir=None):
+        """
+        ls_id: 储存所有MH ID的列表（输出顺序与其一致，重复的ID仅保留一个）
+        seq_code: 序列编码表（SeqCode），可在多个计数表之间共用
+        spill_dir: 溢写时有序计数段的储存文件夹，为None时使用系统临时文件夹
+        """
+        self.dict_mh_index = {}  # MH ID -> 序号
+        for id in ls_id:
+            self.dict_mh_index.setdefault(id, len(self.dict_mh_index))
+        self.ls_mh_count = [{} for _ in self.dict_mh_index]  # 每个MH的扁平计数字典
+        self.seq_code = seq_code if seq_code is not None else SeqCode()
+        self._view = None  # 最近一次转化的(MH ID, 嵌套字典)
+        self.spill_dir = spill_dir  # 有序计数段的储存文件夹（为None时使用系统临时文件夹）
+        self.ls_run = []  # 已溢写的有序计数段（文件路径）
+        self._ls_run_array = []  # 有序计数段（内存映射）
+        self._run_dir = None
+
+    def __getitem__(self, id):
+        if self._view is None or self._view[0] != id:
+            self._view = (id, self._nested(self._mh_count(self.dict_mh_index[id])))
+        return self._view[1]
+
+    def __iter__(self):
+        return iter(self.dict_mh_index)
+
+    def __len__(self):
+        return len(self.dict_mh_index)
+
+    @abc.abstractmethod
+    def _nested(self, dict_count):
+        """
+        将单个MH的扁平计数字典转化为嵌套字典
+        """
+
+    def to_dict(self):
+        """
+        转化为完整的嵌套字典
+        """
+        return {id: self._nested(self._mh_count(index)) for id, index in self.dict_mh_index.items()}
+
+    def memory_size(self):
+        """
+        估计内存中计数的大小（字节，不含已溢写的计数）
+        """
+        return sum(map(len, self.ls_mh_count)) * self.ENTRY_SIZE
+
+    def spill(self):
+        """
+        将内存中的计数按(MH序号, 键)排序后写入临时文件（有序计数段），并清空内存中的计数
+        """
+        array_run = self._run_array(self.ls_mh_count, range(len(self.ls_mh_count)), len(self.ls_run))
+        if len(array_run) == 0:
+            return
+        if self._run_dir is None:
+            self._run_dir = tempfile.mkdtemp(prefix="mh_count_", dir=self.spill_dir)
+        path = os.path.join(self._run_dir, "{}.npy".format(len(self.ls_run)))
+        np.save(path, array_run)
+        self.ls_run.append(path)
+        self._ls_run_array.append(np.load(path, mmap_mode="r"))
+        self.ls_mh_count = [{} for _ in self.dict_mh_index]
+        self._view = None
+
+    def close(self):
+        """
+        删除溢写的有序计数段（删除后不再包含已溢写的计数）
+        """
+        self._ls_run_array = []
+        self.ls_run = []
+        self._view = None
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+
+    def _run_array(self, ls_dict_count, ls_index, run):
+        """
+        将多个MH的扁平计数字典转化为有序计数段（按MH序号、键排序的记录数组）
+        """
+        ls_length = [len(dict_count) for dict_count in ls_dict_count]
+        n = sum(ls_length)
+        array_run = np.empty(n, dtype=_RUN_DTYPE)
+        if n == 0:
+            return array_run
+        array_run["mh"] = np.repeat(np.fromiter(ls_index, dtype=np.int64, count=len(ls_length)), ls_length)
+        array_run["k0"] = np.fromiter((key >> (2 * _BIT) for dict_count in ls_dict_count for key in dict_count),
+                                      dtype=np.uint64, count=n)
+        array_run["k1"] = np.fromiter((key >> _BIT & _MASK for dict_count in ls_dict_count for key in dict_count),
+                                      dtype=np.uint64, count=n)
+        array_run["k2"] = np.fromiter((key & _MASK for dict_count in ls_dict_count for key in dict_count),
+                                      dtype=np.uint64, count=n)
+        array_run["v0"] = np.fromiter((value >> _BIT for dict_count in ls_dict_count for value in dict_count.values()),
+                                      dtype=np.uint64, count=n)
+        array_run["v1"] = np.fromiter((value & _MASK for dict_count in ls_dict_count for value in dict_count.values()),
+                                      dtype=np.uint64, count=n)
+        array_run["run"] = run
+        array_run["pos"] = np.concatenate([np.arange(length) for length in ls_length])
+        return array_run[np.lexsort((array_run["k2"], array_run["k1"], array_run["k0"], array_run["mh"]))]
+
+    def _mh_count(self, index):
+        """
+        输出单个MH的扁平计数字典。未溢写时即为内存中的字典；溢写后将各有序计数段及内存中的计数（作为最后一段）归并：
+        同一键的记录按段的先后合并（见_merge_value），各键按首次出现的(段序号, 位置)插入，与不溢写时的插入顺序一致
+        """
+        if not self.ls_run:
+            return self.ls_mh_count[index]
+
+        ls_array = []
+        for array_run in self._ls_run_array:
+            beg, end = np.searchsorted(array_run["mh"], [index, index + 1])
+            ls_array.append(np.asarray(array_run[beg:end]))
+        ls_array.append(self._run_array([self.ls_mh_count[index]], [index], len(self.ls_run)))
+        array = np.concatenate(ls_array)
+        if len(array) == 0:
+            return {}
+
+        """k个有序段按键归并（同一键按段的先后排列）"""
+        array = array[np.lexsort((array["run"], array["k2"], array["k1"], array["k0"]))]
+        array_start = np.flatnonzero(np.r_[True, (array["k0"][1:] != array["k0"][:-1]) |
+                                           (array["k1"][1:] != array["k1"][:-1]) | (array["k2"][1:] != array["k2"][:-1])])
+        array_v0, array_v1 = self._merge_value(array, array_start)
+        array_first = array[array_start]  # 每个键首次出现的记录
+        array_order = np.lexsort((array_first["pos"], array_first["run"]))
+
+        dict_count = {}
+        for k0, k1, k2, v0, v1 in zip(array_first["k0"][array_order].tolist(), array_first["k1"][array_order].tolist(),
+                                      array_first["k2"][array_order].tolist(), array_v0[array_order].tolist(),
+                                      array_v1[array_order].tolist()):
+            dict_count[k0 << (2 * _BIT) | k1 << _BIT | k2] = v0 << _BIT | v1
+        return dict_count
+
+    @abc.abstractmethod
+    def _merge_value(self, array, array_start):
+        """
+        合并同一键在各段中的值：array为按键、段序号排序的记录，array_start为每个键的起始位置，输出合并后值的高位、低位
+        """
+
+
+class MatchCount(_MHCount):
+    """
+    匹配结果计数表：MH ID - primer - allele - UMI - count
+    按MH ID取值时输出{primer: {allele: {umi: count}}}，顺序与逐层嵌套字典的插入顺序一致
+    //match_count = MatchCount(ls_id)
+    //match_count.add("CHBCHR01_0674112", "ACGT...", "ACGTACGTACGT", "ACGTAC")
+    //match_count["CHBCHR01_0674112"]
+    //>>> {'ACGT...': {'ACGTAC': {'ACGTACGTACGT': 1}}}
+    """
+
+    def __init__(self, ls_id, seq_code=None, spill_dir=None):
+        super().__init__(ls_id, seq_code, spill_dir)
+        self.dict_primer = {}  # primer序列 -> 序号
+        self.ls_primer = []  # primer序列
+
+    def _primer_index(self, primer):
+        """
+        输出primer序列的序号（首次出现时登记）
+        """
+        index = self.dict_primer.get(primer)
+        if index is None:
+            index = self.dict_primer[primer] = len(self.ls_primer)
+            self.ls_primer.append(primer)
+        return index
+
+    def add(self, mh_id, primer, umi, seq_extract_mh, count=1):
+        """
+        对单条匹配结果进行计数
+        """
+        self.add_code(mh_id, primer, self.seq_code.encode(seq_extract_mh), self.seq_code.encode(umi), count)
+
+    def add_code(self, mh_id, primer, allele_code, umi_code, count=1):
+        """
+        以allele、UMI的编码进行计数（编码需来自同一编码表seq_code）
+        """
+        dict_count = self.ls_mh_count[self.dict_mh_index[mh_id]]
+        key = self._primer_index(primer) << (2 * _BIT) | allele_code << _BIT | umi_code
+        dict_count[key] = dict_count.get(key, 0) + count
+        self._view = None
+
+    def columns(self, id):
+        """
+        输出该MH的列式计数表：(primer序号, allele编码, UMI编码, count)四个数组，行顺序与嵌套字典逐层展开的顺序一致
+        （即Toolsbox.FormatTools._match_dict_to_list的顺序：primer、allele按首次出现的顺序分组，组内按UMI首次出现的顺序）
+        """
+        dict_count = self._mh_count(self.dict_mh_index[id])
+        n = len(dict_count)
+        array_primer = np.fromiter((key >> (2 * _BIT) for key in dict_count), dtype=np.int64, count=n)
+        array_allele = np.fromiter((key >> _BIT & _MASK for key in dict_count), dtype=np.uint64, count=n)
+        array_umi = np.fromiter((key & _MASK for key in dict_count), dtype=np.uint64, count=n)
+        array_count = np.fromiter(dict_count.values(), dtype=np.int64, count=n)
+
+        array_rank_primer = _first_index(array_primer.astype(np.uint64)[:, None])  # primer首次出现的位置
+        array_rank_allele = _first_index(np.stack([array_primer.astype(np.uint64), array_allele], axis=1))
+        array_order = np.lexsort((np.arange(n), array_rank_allele, array_rank_primer))
+        return array_primer[array_order], array_allele[array_order], array_umi[array_order], array_count[array_order]
+
+    def _nested(self, dict_count):
+        dict_nested = {}
+        for key, count in dict_count.items():
+            primer = self.ls_primer[key >> (2 * _BIT)]
+            allele = self.seq_code.decode(key >> _BIT & _MASK)
+            umi = self.seq_code.decode(key & _MASK)
+            dict_nested.setdefault(primer, {}).setdefault(allele, {})[umi] = count
+        return dict_nested
+
+    def _merge_value(self, array, array_start):
+        """
+        count相加
+        """
+        return np.zeros(len(array_start), dtype=np.uint64), np.add.reduceat(array["v1"], array_start)
+
+
+class PurityCount(_MHCount):
+    """
+    用于purity计算的计数表：MH ID - UMI - allele - count
+    与原先的储存方式一致：同一UMI下出现与之前不同的allele时，以新的allele重新计数（每个UMI仅保留一个allele）
+    重新计数时加以标记，溢写后归并时据此判断后一段的计数能否与前一段连续（见_merge_value）
+    按MH ID取值时输出{umi: {allele: count}}
+    """
+
+    def add(self, mh_id, umi, seq_extract_mh):
+        """
+        对单条匹配结果进行计数
+        """
+        dict_count = self.ls_mh_count[self.dict_mh_index[mh_id]]
+        umi_code = self.seq_code.encode(umi)
+        allele_code = self.seq_code.encode(seq_extract_mh)
+
+        value = dict_count.get(umi_code)
+        if value is None:
+            dict_count[umi_code] = _PURITY_ONE | allele_code
+        elif value & _MASK == allele_code:
+            dict_count[umi_code] = value + _PURITY_ONE
+        else:
+            dict_count[umi_code] = _PURITY_ONE | _PURITY_RESET | allele_code
+        self._view = None
+
+    def columns(self, id):
+        """
+        输出该MH的列式计数表：(UMI编码, allele编码, count)三个数组，行顺序与嵌套字典一致
+        """
+        dict_count = self._mh_count(self.dict_mh_index[id])
+        n = len(dict_count)
+        array_umi = np.fromiter(dict_count.keys(), dtype=np.uint64, count=n)
+        array_allele = np.fromiter((value & _MASK for value in dict_count.values()), dtype=np.uint64, count=n)
+        array_count = np.fromiter((value >> _PURITY_COUNT_SHIFT for value in dict_count.values()), dtype=np.int64,
+                                  count=n)
+        return array_umi, array_allele, array_count
+
+    def _nested(self, dict_count):
+        return {self.seq_code.decode(umi_code): {self.seq_code.decode(value & _MASK): value >> _PURITY_COUNT_SHIFT}
+                for umi_code, value in dict_count.items()}
+
+    def _merge_value(self, array, array_start):
+        """
+        按段的先后依次合并：后一段未重新计数且allele与前一段相同时count相加，否则以后一段为准
+        即每个键仅对最后一次重新计数（或allele改变）以后的各段count求和
+        """
+        array_count = array["v0"] >> np.uint64(1)
+        array_reset = (array["v0"] & np.uint64(1)).astype(bool)
+        array_allele = array["v1"]
+        array_key_start = np.zeros(len(array), dtype=bool)
+        array_key_start[array_start] = True
+
+        array_break = array_key_start | array_reset | np.r_[True, array_allele[1:] != array_allele[:-1]]
+        array_segment = np.cumsum(array_break)  # 连续计数的分段
+        array_end = np.r_[array_start[1:], len(array)] - 1  # 每个键的最后一条记录
+        array_key = np.cumsum(array_key_start) - 1
+        array_last = array_segment == array_segment[array_end][array_key]  # 处于最后一个分段的记录
+
+        array_count = np.add.reduceat(np.where(array_last, array_count, 0), array_start)
+        array_flag = np.add.reduceat(((array_break & ~array_key_start) | array_reset).astype(np.int64), array_start) > 0
+        return array_count << np.uint64(1) | array_flag.astype(np.uint64), array_allele[array_end]
+
+
+class UMIIndex:
+    """
+    UMI的汉明距离邻居索引（删除邻域哈希）：每个UMI依次将第i个位置置空后，以(i, 其余碱基)为键登记
+    两个等长UMI仅在第i个位置不同时必然共用键(i, ...)，因此同一键下的UMI互为汉明距离为1的邻居，查找时不进行两两比较
+    2bit编码的UMI直接将第i个位置的2bit置零作为键；登记编码的UMI（含N等）将第i个位置替换为A后，若其余位置均为A/C/G/T，
+    则同样以2bit编码作为键（与只在该位置不同的2bit编码UMI共用键），否则以替换后的字符串作为键
+    //2026.10.18 新增
+    """
+
+    def __init__(self, ls_umi_code, seq_code):
+        """
+        ls_umi_code: 不重复的UMI编码列表
+        seq_code: UMI编码对应的编码表（SeqCode）
+        """
+        self.seq_code = seq_code
+        self.dict_bucket = {}  # 键 -> UMI序号列表
+        self.ls_umi_key = []  # 每个UMI的键
+        for index, umi_code in enumerate(ls_umi_code):
+            ls_key = self._key(umi_code)
+            for key in ls_key:
+                self.dict_bucket.setdefault(key, []).append(index)
+            self.ls_umi_key.append(ls_key)
+
+    def _key(self, umi_code):
+        """
+        输出单个UMI的所有键
+        """
+        if not umi_code & _ESCAPE:
+            length = (umi_code.bit_length() - 1) // 2
+            return [(i, umi_code & ~(3 << 2 * (length - 1 - i))) for i in range(length)]
+
+        umi = self.seq_code.decode(umi_code)
+        ls_key = []
+        for i in range(len(umi)):
+            umi_mask = umi[:i] + "A" + umi[i + 1:]
+            code = self.seq_code.encode(umi_mask) if len(umi_mask) <= _MAX_PACK_LEN and umi_mask.isalpha() and \
+                umi_mask.translate(_TRANS).isdigit() else umi_mask
+            ls_key.append((i, code))
+        return ls_key
+
+    def neighbour(self, index):
+        """
+        输出与第index个UMI汉明距离为1的UMI序号
+        """
+        set_neighbour = set()
+        for key in self.ls_umi_key[index]:
+            set_neighbour.update(self.dict_bucket[key])
+        set_neighbour.discard(index)
+        return set_neighbour
+
+
+def umi_directional(ls_umi_code, ls_count, seq_code):
+    """
+    UMI的directional adjacency聚类：UMI a的count >= 2 * UMI b的count - 1，且a、b汉明距离为1时，b归入a所在的簇
+    按count从高到低（count相同时按输入顺序）依次以尚未归簇的UMI为代表，沿上述方向向外扩展，扩展到的UMI均归入该簇
+    ls_umi_code: 不重复的UMI编码列表
+    ls_count: 每个UMI的count
+    输出每个UMI所属簇的代表UMI的序号（列表）
+    //2026.10.18 新增
+    """
+    umi_index = UMIIndex(ls_umi_code, seq_code)
+    ls_root = [None] * len(ls_umi_code)
+
+    for index in sorted(range(len(ls_umi_code)), key=lambda i: -ls_count[i]):
+        if ls_root[index] is not None:
+            continue
+        ls_root[index] = index
+        ls_stack = [index]
+        while ls_stack:
+            index_node = ls_stack.pop()
+            for index_neighbour in umi_index.neighbour(index_node):
+                if ls_root[index_neighbour] is None and ls_count[index_node] >= 2 * ls_count[index_neighbour] - 1:
+                    ls_root[index_neighbour] = index
+                    ls_stack.append(index_neighbour)
+    return ls_root
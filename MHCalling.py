@@ -7,6 +7,7 @@
 
 
 import Toolsbox
+import PreProcessing
 
 
 class Analysis_call:
@@ -30,17 +31,25 @@ class Analysis_call:
             ls_ref_info_snp.append([id, snpstart+"_"+snpend])
         return ls_ref_info_snp
 
-    def __init__(self, info_ref_filepath):
+    def __init__(self, info_ref_filepath, panel=None):
         """
         info_ref_filepath: 进行SingleCalling或MixtureCalling时用于对含N MH进行降级的INFO参考文件路径
+        panel: 由dict_chr_info构建的PreProcessing.Panel，用于按ID直接查找MH；为None时逐一遍历dict_chr_info
+        //2026.10.18 新增panel参数
         """
         self.info_ref = Toolsbox.FileTools.open_ls_file(info_ref_filepath)
         self.ls_info_ref_snp = self._get_ref_info_snp(info_ref_filepath)  # 直接获取INFO参考文件的ID和SNP组成信息
+        self.panel = panel
 
     def _extract_mh_calling_snp_ls(self, chr, id, dict_chr_info):
         """
         提取单一样本MH Calling结果中每一个MH的SNP列表
+        //2026.10.18 存在panel时按ID直接查找
         """
+        if self.panel is not None:
+            ls_mh_info = self.panel.info_id(id, chr)
+            return ls_mh_info[2:] if ls_mh_info else None
+
         for values in dict_chr_info[chr].values():
 
             if id != values[0]:
@@ -142,19 +151,22 @@ class SingleCall:
     对单个体样本进行MH calling
     """
 
-    def __init__(self, match_filepath, info_ref_filepath, dict_chr_info, ls_id, dict_chr_relalt):
+    def __init__(self, match_filepath, info_ref_filepath, dict_chr_info, ls_id, dict_chr_relalt, panel=None):
         """
         match_filepath: 由Match.match得到的Match文件储存的路径
         info_ref_filepath: 进行SingleCalling或MixtureCalling时用于对含N MH进行降级的INFO参考文件路径
         dict_chr_info: 由PreInfo得到的结果（嵌套字典，详细格式见PreProcessing_PreInfo）
         ls_id: 储存MH ID的列表
         dict_chr_relalt: 由PreVcf得到的结果（嵌套字典，详细格式见PreProcessing_PreVcf）
+        panel: 由dict_chr_info构建的PreProcessing.Panel（用于按ID查找MH），为None时由dict_chr_info构建
+        //2026.10.18 新增panel参数
         """
         self.match_filepath = match_filepath
         self.info_ref_filepath = info_ref_filepath
         self.dict_chr_info = dict_chr_info
         self.ls_id = ls_id
         self.dict_chr_relalt = dict_chr_relalt
+        self.panel = panel if panel is not None else PreProcessing.Panel(dict_chr_info)
 
     """
     提取特定MH的列表
@@ -186,12 +198,9 @@ class SingleCall:
         """
         提取特定MH的INFO信息
             ['CHBCHR01_0674112', 12, 247032240, 247032247, 247032249, ...]
+        //2026.10.18 改为由panel按ID直接查找，不再逐一遍历该染色体上的INFO信息
         """
-        for ls_mh_info in self.dict_chr_info[mh_chr].values():  # 对于每一条INFO信息进行操作
-            if ls_mh_info[0] == id:
-                return ls_mh_info
-            else:
-                continue
+        return self.panel.info_id(id, mh_chr)
 
     def _ls_spe_mh_refalt(self, id):
         """
@@ -837,7 +846,7 @@ class SingleCall:
         //2022.02.09 未考虑到未匹配到MH match的情况，此时输出空列表
         """
         match_file = Toolsbox.FileTools.open_ls_file(self.match_filepath + filename)
-        a_call = Analysis_call(self.info_ref_filepath)  # 降级器！
+        a_call = Analysis_call(self.info_ref_filepath, self.panel)  # 降级器！
 
         ls_geno_origin_results = []  # 储存单个样本文件的结果（原始结果）
         ls_geno_new_results = []  # 储存单个样本文件的结果（将原始MH进行降级后的结果）
@@ -6,8 +6,81 @@
 # @desc    :
 
 
+import sys
+import traceback
+import collections
 import numpy as np
 import Toolsbox
+import PreProcessing
+import CountStore
+import ReadStore
+
+
+class ReadCache:
+    """
+    读段匹配结果的LRU缓存：扩增子测序中大量读段除UMI外完全相同，相同读段的MH匹配、引物判断、等位基因提取结果直接复用
+    键为(chrname, startpos, len_sequence_m, sequence_m)（匹配结果仅由这些信息决定），值为(mh_id, primer, 引物类型,
+    seq_extract_mh, seq_extract_mh_z)；UMI依据引物类型从每条读段各自的完整序列中提取，不进行缓存
+    按估计的内存占用淘汰最久未使用的结果
+    //2026.10.18 新增
+    //read_cache = ReadCache(64)
+    //read_cache.info()
+    //>>> {'hit': 0, 'miss': 0, 'hit_rate': 0.0, 'entry': 0, 'memory_mb': 0.0}
+    """
+    ENTRY_OVERHEAD = 400  # 每条缓存中除序列字符串以外的估计内存占用（键值元组、字典项、整数等，字节）
+
+    def __init__(self, memory_mb=64):
+        """
+        memory_mb: 缓存的内存上限（MB）
+        """
+        self.memory_limit = int(memory_mb * 1024 * 1024)
+        self.memory = 0  # 当前缓存的估计内存占用（字节）
+        self.dict_cache = collections.OrderedDict()
+        self.hit = 0
+        self.miss = 0
+
+    def _size(self, key, value):
+        """
+        单条缓存的估计内存占用（sequence_m为CigarWalker时键为其key()，计入其中各项）
+        """
+        size_key = sys.getsizeof(key[3]) if isinstance(key[3], str) else sum(map(sys.getsizeof, key[3]))
+        return self.ENTRY_OVERHEAD + size_key + sys.getsizeof(value[3]) + sys.getsizeof(value[4])
+
+    def get(self, key):
+        """
+        查找缓存，未命中时输出None
+        """
+        value = self.dict_cache.get(key)
+        if value is None:
+            self.miss += 1
+            return None
+        self.dict_cache.move_to_end(key)
+        self.hit += 1
+        return value
+
+    def put(self, key, value):
+        """
+        加入缓存，超出内存上限时淘汰最久未使用的结果
+        """
+        if key in self.dict_cache:
+            return
+        size = self._size(key, value)
+        if size > self.memory_limit:
+            return
+
+        self.dict_cache[key] = value
+        self.memory += size
+        while self.memory > self.memory_limit:
+            key_old, value_old = self.dict_cache.popitem(last=False)
+            self.memory -= self._size(key_old, value_old)
+
+    def info(self):
+        """
+        输出缓存的命中情况及内存占用
+        """
+        lookup = self.hit + self.miss
+        return {"hit": self.hit, "miss": self.miss, "hit_rate": self.hit / lookup if lookup else 0.0,
+                "entry": len(self.dict_cache), "memory_mb": self.memory / 1024 / 1024}
 
 
 class MHMatch:
@@ -17,17 +90,32 @@ class MHMatch:
     //2021.11.30 输出的Match文件顺序为：MH_ID、primer、Allele、UMI、count
     """
 
-    def __init__(self, dict_chr_info, ls_id, dict_chr_refalt, dict_mh_primer):
+    def __init__(self, dict_chr_info, ls_id, dict_chr_refalt, dict_mh_primer, primer_seed=12, primer_reassign=False,
+                 panel=None, read_cache_mb=64):
         """
         dict_chr_refalt: 由PreVcf得到的结果（嵌套字典，详细格式见PreProcessing_PreVcf）
         dict_chr_info: 由PreInfo得到的结果（嵌套字典，详细格式见PreProcessing_PreInfo）
         ls_id: 由PreInfo得到的结果（储存所有MH ID的列表）
         dict_mh_primer: 由PrePrimer得到的结果（储存各MH ID对应引物列表的字典）
+        primer_seed: 引物种子索引的种子长度（详见PreProcessing.PrimerIndex），为None时不使用种子索引
+        primer_reassign: 序列与匹配到的MH的引物均不匹配、但与同一染色体上其他MH的引物完全一致时，是否将该序列改为归属该MH
+                         （默认不改变，此类序列与原先一致计为引物不匹配）
+        panel: 由dict_chr_info构建的PreProcessing.Panel，为None时由dict_chr_info构建（多次使用同一panel时可传入，避免重复构建）
+        read_cache_mb: 读段匹配结果缓存（ReadCache）的内存上限（MB），为0或None时不使用缓存
+        //2026.10.18 新增primer_seed、primer_reassign、panel、read_cache_mb参数
         """
         self.dict_chr_info = dict_chr_info
         self.ls_id = ls_id
         self.dict_chr_refalt = dict_chr_refalt
         self.dict_mh_primer = dict_mh_primer
+        self.panel = panel if panel is not None else PreProcessing.Panel(dict_chr_info)  # 以数组储存的MH panel
+        self.mh_index = PreProcessing.MHIndex(self.panel)  # MH区间索引（用于有序输入的扫描线匹配）
+        self.dict_primer_plan = {(primer[0], primer[1]): self._primer_compile(primer)
+                                 for ls_primer in dict_mh_primer.values() for primer in ls_primer}  # 预先转化的引物
+        self.primer_index = PreProcessing.PrimerIndex(dict_mh_primer, primer_seed) if primer_seed else None  # 引物种子索引
+        self.primer_reassign = primer_reassign
+        self.dict_extract_plan = {}  # 各MH的等位基因提取方案（见_extract_plan），首次使用时生成
+        self.read_cache = ReadCache(read_cache_mb) if read_cache_mb else None  # 读段匹配结果缓存
 
     """
     //2021.11.15 新增：将结果储存相关函数从match函数中独立
@@ -40,39 +128,22 @@ class MHMatch:
     def _save_match(self, dict_match_results, mh_id, primer, umi, seq_extract_mh):
         """
         //2021.11.15 新增：以嵌套字典形式储存匹配结果（即1），无返回值
+        //2026.10.18 改为写入紧凑计数表（CountStore.MatchCount），按MH ID取值时仍为原嵌套字典格式
         """
-        if primer not in dict_match_results[mh_id].keys():  # 如果该MH下的primer序列未出现过
-            dict_match_results[mh_id][primer] = {seq_extract_mh: {umi: 1}}  # 创建primer字典（包括umi等）
-
-        else:  # 如果primer序列出现过，则已有了对应primer的子字典
-
-            if seq_extract_mh not in dict_match_results[mh_id][primer].keys():  # 如果primer下allele未出现过
-                dict_match_results[mh_id][primer][seq_extract_mh] = {umi: 1}
-
-            else:
-                if umi not in dict_match_results[mh_id][primer][seq_extract_mh].keys():  # 如果等位基因未出现过
-                    dict_match_results[mh_id][primer][seq_extract_mh][umi] = 1
-                else:
-                    dict_match_results[mh_id][primer][seq_extract_mh][umi] += 1
+        dict_match_results.add(mh_id, primer, umi, seq_extract_mh)
 
     def _save_for_purity(self, dict_for_purity, mh_id, umi, seq_extract_mh):
         """
         //2021.11.15 新增：以嵌套字典形式储存用于purity计算和过滤的结果（即2），无返回值
         //2022.03.15 标签格式为：ID、UMI、Allele、count
+        //2026.10.18 改为写入紧凑计数表（CountStore.PurityCount），同一UMI下出现新的Allele时重新计数的规则不变
         """
-        if umi not in dict_for_purity[mh_id].keys():  # 如果该MH下的UMI未出现过
-            dict_for_purity[mh_id][umi] = {seq_extract_mh: 1}
-
-        else:  # 如果UMI已出现过，则已有了对应UMI的子字典
-
-            if seq_extract_mh not in dict_for_purity[mh_id][umi].keys():
-                dict_for_purity[mh_id][umi] = {seq_extract_mh: 1}
-            else:
-                dict_for_purity[mh_id][umi][seq_extract_mh] = dict_for_purity[mh_id][umi][seq_extract_mh] + 1
+        dict_for_purity.add(mh_id, umi, seq_extract_mh)
 
     def _save_mismatch(self, ls_mismatch, mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z):
         """
         //2021.11.15 新增：以列表形式储存mismatch结果（即3），无返回值
+        //2026.10.18 ls_mismatch也可为Toolsbox.LineWriter（直接写入文件）
         """
         if "Z" in seq_extract_mh_z:  # 如果存在非参考基因型的碱基
             ls_mismatch.append([mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z])
@@ -82,6 +153,7 @@ class MHMatch:
     def _save_no_primer(self, ls_no_primer, primer, sequence_single):
         """
         //2021.11.15 新增：以列表形式储存no_primer结果（即4），无返回值
+        //2026.10.18 ls_no_primer也可为Toolsbox.LineWriter（直接写入文件）
         """
         if primer == "None":
             ls_no_primer.append(sequence_single)
@@ -90,21 +162,38 @@ class MHMatch:
 
     """//2021.11.30 序列信息提取：MHID、引物、UMI、匹配MH等位基因（无Z）、匹配MH等位基因（含Z）"""
     """提取MH等位基因"""
-    def _single_match_mhpos(self, sequence_startpos, dict_sequence_info):
+    def _single_match_mhpos(self, sequence_startpos, dict_sequence_info, sequence_chr=None):
         """
         对单条序列进行MH匹配：与序列所在染色体上的某条MH进行匹配
         输出结果为匹配到的MH的起始POS（用于匹配dict_sequence_info中的项）
         //2022.03.14 复核：为序列匹配MH无误（基于序列起始pos和同染色体上所有MH的起始pos的相减结果，取最小值）
+        //2026.10.18 传入sequence_chr时使用MHIndex中预先排序的起始POS进行二分查找（结果与原方法一致），不再为每条序列
+                     重新生成数组并遍历该染色体上所有MH
         """
+        if sequence_chr is not None:
+            matched_mh_startpos = self.mh_index.nearest(sequence_chr, int(sequence_startpos))
+            if matched_mh_startpos is not None:
+                return matched_mh_startpos
+
         array_mh_startpos_all = np.array(list(dict_sequence_info.keys()))  # 提取info字典中该染色体上所有MH的起始pos并储存至数组
         matched_mh_startpos = array_mh_startpos_all[np.argmin(abs(array_mh_startpos_all - int(sequence_startpos)))]
         return matched_mh_startpos
 
+    def match_mhpos_batch(self, sequence_chr, array_sequence_startpos):
+        """
+        对同一染色体上的一批序列同时进行MH匹配（向量化），输出与输入等长的、匹配到的MH起始POS数组（规则同_single_match_mhpos）
+        //2026.10.18 新增
+        """
+        array_matched_mh_startpos = self.mh_index.nearest_batch(sequence_chr, array_sequence_startpos)
+        if array_matched_mh_startpos is None:
+            raise ValueError('no MH on chromosome "{}"'.format(sequence_chr))
+        return array_matched_mh_startpos
+
     def _single_match_extract_f(self, sequence_end, sequence_seq_m, array_mh_pos, dict_sequence_refalt):
         """
         对dif_mh_seq>=0的情况（测序序列在覆盖MH之前）进行sequence等位基因提取
         sequence_end: 测序序列末尾POS
-        sequence_seq_m: 测序序列（仅保留M+填充缺失）
+        sequence_seq_m: 测序序列（仅保留M+填充缺失），可为字符串，或由PreProcessing.CigarWalker直接按位置查找碱基
         array_mh_pos: 转化为数组的、该条序列对应的MH的组成SNP POS
         dict_sequence_refalt: 该条染色体上所有MH组成SNP的参考碱基字典
         //2022.03.15 复核：提取碱基是从序列末尾POS开始数，测序序列在覆盖MH之前的碱基提取和check无问题
@@ -134,6 +223,7 @@ class MHMatch:
         """
         对dif_mh_seq<0的情况（测序序列在覆盖MH之后）进行sequence等位基因提取
         //2022.03.15 复核：提取碱基是从序列末尾POS开始数，测序序列在覆盖MH之后的碱基提取和check无问题
+        //2026.10.18 sequence_seq_m同样可为PreProcessing.CigarWalker
         """
         dif_mh_seqend = array_mh_pos - sequence_end  # 计算POS是否在sequence范围内
         dif_mh_seqstart = array_mh_pos - sequence_start  # 计算POS是否在sequence范围内
@@ -158,7 +248,63 @@ class MHMatch:
         return seq_extract_mh, seq_extract_mh_z
     
     """对测序序列的测序方向进行判断（0代表正向，1代表反向），并通过判断测序方向获取UMI提取位置（序列起始或末尾）"""
+    def _primer_compile(self, primer):
+        """
+        将单条引物预先转化为检测所需的数组：(检测长度, 允许不匹配的碱基数, 两段检测序列（uint8数组，2×检测长度）)
+        检测长度、容错率及检测序列的取法与_single_match_extract_umi_primer_check_scan一致，1引物使用其反向互补序列
+        //2026.10.18 新增
+        """
+        len_primer = len(primer[1]) - 3  # 获取用于检测的引物序列的长度（引物长度-3）
+        fault_tolerance_rate = 0.2  # 引物检测的容错率
+        primer_fault_tolerance_rate = int(len_primer * fault_tolerance_rate)  # 该引物在检测时允许不匹配的碱基数
+
+        if primer[0] == "1":
+            primer_seq = Toolsbox.FormatTools.convert_base(primer[1][::-1])
+        else:
+            primer_seq = primer[1]
+        if len_primer <= 0:
+            return len_primer, primer_fault_tolerance_rate, None
+
+        array_primer_f_b = np.frombuffer((primer_seq[:len_primer] + primer_seq[-len_primer:]).encode("ascii"),
+                                         dtype=np.uint8).reshape(2, len_primer)
+        return len_primer, primer_fault_tolerance_rate, array_primer_f_b
+
     def _single_match_extract_umi_primer_check(self, sequence_seq_m, primer):
+        """
+        对序列是否对应某引物进行判断（仅对端部，即最起始或最末尾进行判断），规则与_single_match_extract_umi_primer_check_scan
+        完全一致：0引物检测序列起始处的滑窗，1引物检测序列末尾处的滑窗，滑窗次数为检测长度，任一滑窗中不匹配的碱基数不超过
+        允许值即匹配成功。返回结果为引物种类（0或1）或None
+        //2026.10.18 引物在初始化时预先转化为数组（见_primer_compile），所有滑窗的不匹配碱基数以数组运算一次得到，前xx碱基
+                     匹配成功时不再检测后xx碱基；序列长度不足以容纳所有滑窗时使用逐碱基比对（见_single_match_extract_umi_primer_check_scan）
+        """
+        if primer[0] not in ("0", "1"):
+            return None
+
+        primer_plan = self.dict_primer_plan.get((primer[0], primer[1]))
+        if primer_plan is None:
+            primer_plan = self._primer_compile(primer)
+        len_primer, primer_fault_tolerance_rate, array_primer_f_b = primer_plan
+
+        if len_primer <= 0:  # 无可检测的滑窗
+            return None
+
+        len_check = 2 * len_primer - 1  # 所有滑窗覆盖的序列长度
+        if len(sequence_seq_m) < len_check:
+            return self._single_match_extract_umi_primer_check_scan(sequence_seq_m, primer)
+
+        if primer[0] == "0":  # 0引物：序列起始处
+            sequence_check = str(sequence_seq_m[:len_check])
+        else:  # 1引物：序列末尾处
+            sequence_check = str(sequence_seq_m[-len_check:])
+        array_window = np.lib.stride_tricks.sliding_window_view(
+            np.frombuffer(sequence_check.encode("ascii"), dtype=np.uint8), len_primer)  # 所有滑窗（检测长度×检测长度）
+
+        for array_primer in array_primer_f_b:  # 对前xx碱基和后xx碱基依次进行匹配
+            if ((array_window != array_primer).sum(axis=1) <= primer_fault_tolerance_rate).any():
+                return primer[0]
+        return None
+
+    def _single_match_extract_umi_primer_check_scan(self, sequence_seq_m, primer):
         """
         对序列是否对应某引物进行判断（仅对端部，即最起始或最末尾进行判断）
         //2021.10.19 新增对引物和UMI的match相关函数
@@ -170,6 +316,7 @@ class MHMatch:
         //2022.03.15 依据dict_mh_primer的格式修改，输入的primer变更为[0, primer]或[1, primer]，据此，更改此处的引物
                      check逻辑：如果为0引物，则只进行0引物检测；如果是1引物，则只进行1引物检测。返回结果为引物种类（0或
                      1）或None
+        //2026.10.18 改为_single_match_extract_umi_primer_check的逐碱基比对版本，仅在序列长度不足以容纳所有滑窗时使用
         """
         """引物检测参数"""
         len_primer = len(primer[1]) - 3  # 获取用于检测的引物序列的长度（引物长度-3）
@@ -248,66 +395,199 @@ class MHMatch:
             else:  # 如果1引物匹配不成功，则输出None
                 return None
 
-    def _single_match_extract_umi(self, sequence_seq, sequence_seq_m, ls_primer):
+    def _single_match_extract_umi(self, sequence_seq, sequence_seq_m, ls_primer, ls_seed_hit=None):
         """
         依据MH的引物序列列表，提取该条测序序列所对应的UMI序列及引物序列
         sequence: 完整的测序序列
         ls_primer: 该测序序列对应的MH的测序引物列表
+        ls_seed_hit: 引物种子索引的查找结果（详见PreProcessing.PrimerIndex.search），命中的引物必然匹配成功，不再进行容错检测
         //2021.10.19 新增：对引物和UMI的match相关函数
         //2022.03.15 复核：提取UMI的位置无误
+        //2026.10.18 新增ls_seed_hit参数。引物仍按原顺序依次判断，结果不变
+        //2026.10.18 引物判断拆分至_single_match_extract_primer，UMI提取拆分至_single_match_umi
         """
+        _ = self._single_match_extract_primer(sequence_seq_m, ls_primer, ls_seed_hit)
+        if _:
+            return _[0], self._single_match_umi(sequence_seq, _[1])
+
+    def _single_match_extract_primer(self, sequence_seq_m, ls_primer, ls_seed_hit=None):
+        """
+        依据MH的引物序列列表判断该条测序序列所对应的引物，输出(引物序列, 引物类型（"0"或"1"）)，均未匹配上时输出None
+        //2026.10.18 由_single_match_extract_umi中拆分而来
+        """
+        set_seed_hit = {(hit[1], hit[2]) for hit in ls_seed_hit} if ls_seed_hit else ()
+
         for primer in ls_primer:  # 对单条引物序列（包含0、1引物信息的列表）进行判断
             
-            primer_test_result = self._single_match_extract_umi_primer_check(sequence_seq_m, primer)
-            if primer_test_result:  # 如果匹配上，则输出引物序列及对应的UMI
-
-                if primer_test_result == "0":  # 如果是0引物
-                    return primer[1], sequence_seq[-12:]
-                elif primer_test_result == "1":  # 如果是1引物
-                    return primer[1], sequence_seq[:12]
+            if (primer[0], primer[1]) in set_seed_hit:  # 种子索引命中（滑窗完全一致）
+                primer_test_result = primer[0]
+            else:
+                primer_test_result = self._single_match_extract_umi_primer_check(sequence_seq_m, primer)
+            if primer_test_result in ("0", "1"):  # 如果匹配上，则输出引物序列及引物类型
+                return primer[1], primer_test_result
 
             else:  # 如果均未匹配上，则匹配另一条引物（如果存在），或输出None
                 continue
-    
+
+    def _single_match_umi(self, sequence_seq, primer_kind):
+        """
+        依据引物类型提取UMI：0引物为序列末尾12个碱基，1引物为序列起始12个碱基，未匹配上引物（None）时输出"None"
+        //2026.10.18 由_single_match_extract_umi中拆分而来
+        """
+        if primer_kind == "0":  # 如果是0引物
+            return sequence_seq[-12:]
+        elif primer_kind == "1":  # 如果是1引物
+            return sequence_seq[:12]
+        return "None"
+
+    def _single_match_reassign(self, ls_seed_hit, dict_sequence_info):
+        """
+        在种子索引命中的引物中，查找属于同一染色体上其他MH的引物，输出该MH的起始POS（无则输出None）
+        //2026.10.18 新增
+        """
+        for mh_id, _, _ in ls_seed_hit:
+            index = self.panel.index(mh_id)
+            if index is None:
+                continue
+            startpos = int(self.panel.array_key[index])  # MH ID对应的起始POS（即dict_chr_info中的key）
+            if dict_sequence_info.get(startpos, [None])[0] == mh_id:
+                return startpos
+
     """提取单条测序结果的ID、primer、UMI、Allele、wrongAllele"""
+    def _single_match_primer(self, sequence_seq_m, matched_mh_startpos, dict_sequence_info):
+        """
+        对单条序列进行引物匹配，输出(匹配到MH的起始POS, 匹配到MH的value, primer, 引物类型)，UMI由_single_match_umi依据引物类型提取
+        未匹配上引物时primer为"None"、引物类型为None
+        开启primer_reassign时，匹配到MH的起始POS可能改为引物所属MH的起始POS
+        //2026.10.18 由_single_match_extract中拆分而来
+        """
+        matched_mh_value = dict_sequence_info[matched_mh_startpos]  # 输出匹配到MH的value（即包含ID、包含SNP数目、SNPpos的列表）
+
+        """进行引物匹配，依据匹配结果进行赋值"""
+        ls_seed_hit = self.primer_index.search(sequence_seq_m) if self.primer_index else None  # 引物种子索引查找
+        ls_primer = self.dict_mh_primer[matched_mh_value[0]]  # 提取匹配到MH的MH ID所对应的引物序列，提取到的是一个二维列表
+        _ = self._single_match_extract_primer(sequence_seq_m, ls_primer, ls_seed_hit)  # 匹配的引物序列及类型
+
+        if not _ and self.primer_reassign and ls_seed_hit:  # 引物属于其他MH时改为归属该MH
+            reassigned_mh_startpos = self._single_match_reassign(ls_seed_hit, dict_sequence_info)
+            if reassigned_mh_startpos is not None:
+                matched_mh_startpos = reassigned_mh_startpos
+                matched_mh_value = dict_sequence_info[matched_mh_startpos]
+                ls_primer = self.dict_mh_primer[matched_mh_value[0]]
+                _ = self._single_match_extract_primer(sequence_seq_m, ls_primer, ls_seed_hit)
+
+        if _:  # 如果引物匹配成功，则分别赋值
+            primer, primer_kind = _
+        else:  #
+            primer, primer_kind = "None", None
+        return matched_mh_startpos, matched_mh_value, primer, primer_kind
+
     def _single_match_extract(self, sequence_startpos, sequence_seq_m, sequence_seq, sequence_len, matched_mh_startpos,
                               dict_sequence_refalt, dict_sequence_info):
         """
         对单条序列进行MH匹配：依据匹配MH的信息，提取sequence中的MH等位基因
         输出结果为该sequence中的等位基因
         //2022.03.15 复核：单条测序结果的ID、primer、UMI、allele、wrongallele提取无误
+        //2026.10.18 新增引物种子索引及引物归属其他MH时的重新归属（见__init__中primer_reassign）
         """
-        matched_mh_value = dict_sequence_info[matched_mh_startpos]  # 输出匹配到MH的value（即包含ID、包含SNP数目、SNPpos的列表）
+        matched_mh_startpos, matched_mh_value, primer, primer_kind = self._single_match_primer(sequence_seq_m,
+                                                                                               matched_mh_startpos,
+                                                                                               dict_sequence_info)
+        umi = self._single_match_umi(sequence_seq, primer_kind)
         
-        """进行引物匹配和UMI提取，依据提取结果进行赋值"""
-        ls_primer = self.dict_mh_primer[matched_mh_value[0]]  # 提取匹配到MH的MH ID所对应的引物序列，提取到的是一个二维列表
-        _ = self._single_match_extract_umi(sequence_seq, sequence_seq_m, ls_primer)  # 提取匹配的引物、UMI序列
+        seq_extract_mh, seq_extract_mh_z = self._single_match_extract_allele(sequence_startpos, sequence_seq_m,
+                                                                             sequence_len, matched_mh_startpos,
+                                                                             matched_mh_value, dict_sequence_refalt)
+        return matched_mh_value[0], primer, umi, seq_extract_mh, seq_extract_mh_z
 
-        if _:  # 如果引物匹配成功、UMI提取成功，则分别赋值
-            primer, umi = _
-        else:  #
-            primer, umi = "None", "None"
-        
-        """进行sequence中MH等位基因的提取（与primer和UMI无关）"""
+    def _single_match_extract_allele(self, sequence_startpos, sequence_seq_m, sequence_len, matched_mh_startpos,
+                                     matched_mh_value, dict_sequence_refalt):
+        """
+        进行sequence中MH等位基因的提取（与primer和UMI无关），输出(seq_extract_mh, seq_extract_mh_z)
+        //2026.10.18 由_single_match_extract中拆分而来
+        """
         array_mh_pos = np.array(matched_mh_value[2:])  # 将MH的组成SNP POS列表转化为数组
         sequence_end = sequence_startpos + int(sequence_len) - 1  # 获取sequence的末尾POS
         dif_mh_seq = matched_mh_startpos - sequence_startpos  # 计算MH起始与sequence起始之间的距离
 
         if dif_mh_seq >= 0:  # 如果测序序列起始在MH起始之前
-            seq_extract_mh, seq_extract_mh_z = self._single_match_extract_f(sequence_end, sequence_seq_m,
-                                                                            array_mh_pos, dict_sequence_refalt)
-            return matched_mh_value[0], primer, umi, seq_extract_mh, seq_extract_mh_z
+            return self._single_match_extract_f(sequence_end, sequence_seq_m, array_mh_pos, dict_sequence_refalt)
+
+        else:  # 如果测序序列起始在MH起始之后
+            return self._single_match_extract_b(sequence_startpos, sequence_end, sequence_seq_m, array_mh_pos,
+                                                dict_sequence_refalt)
+
+    def _extract_plan_compile(self, matched_mh_value, dict_sequence_refalt):
+        """
+        预先生成单个MH的等位基因提取方案：(组成SNP POS数组, 各SNP允许的碱基（布尔数组，SNP数×256，按碱基的ASCII码索引）,
+        最小的SNP POS)。允许的碱基即该SNP在vcf中的REF/ALT，不在其中的碱基替换为"Z"
+        有SNP不在dict_sequence_refalt中时输出None（该MH使用逐个SNP的提取方式，见_single_match_extract_f/_b）
+        //2026.10.18 新增
+        """
+        ls_snppos = matched_mh_value[2:]
+        if not ls_snppos or any(snppos not in dict_sequence_refalt for snppos in ls_snppos):
+            return None
+
+        array_allowed = np.zeros((len(ls_snppos), 256), dtype=bool)
+        for index, snppos in enumerate(ls_snppos):
+            refalt = dict_sequence_refalt[snppos].encode("utf-8")
+            array_allowed[index, np.frombuffer(refalt, dtype=np.uint8)] = True
+        return np.array(ls_snppos, dtype=np.int64), array_allowed, min(ls_snppos)
+
+    def _extract_plan(self, sequence_chr, matched_mh_startpos):
+        """
+        获取单个MH的等位基因提取方案（见_extract_plan_compile），首次使用时生成
+        //2026.10.18 新增
+        """
+        key = (sequence_chr, matched_mh_startpos)
+        if key not in self.dict_extract_plan:
+            self.dict_extract_plan[key] = self._extract_plan_compile(self.dict_chr_info[sequence_chr][matched_mh_startpos],
+                                                                     self.dict_chr_refalt[sequence_chr])
+        return self.dict_extract_plan[key]
+
+    def _batch_extract(self, extract_plan, ls_startpos, ls_sequence_seq_m):
+        """
+        对匹配到同一MH的一批序列同时进行等位基因提取：按各SNP在序列中的位置一次性取出所有碱基，并与允许的碱基比对
+        输出[(seq_extract_mh, seq_extract_mh_z), ...]，与_single_match_extract_f/_b的结果一致
+        POS在序列范围内（序列起始POS <= SNP POS <= 序列末尾POS）时提取碱基，否则为"N"
+        ls_sequence_seq_m中的PreProcessing.CigarWalker直接按偏移表取出SNP位置的碱基，不生成完整的sequence_m
+        //2026.10.18 新增
+        //2026.10.18 支持CigarWalker
+        """
+        array_snppos, array_allowed, _ = extract_plan
+        n_snp = len(array_snppos)
+
+        array_len = np.array([len(sequence_seq_m) for sequence_seq_m in ls_sequence_seq_m], dtype=np.int64)
+        array_dif = array_snppos[None, :] - np.array(ls_startpos, dtype=np.int64)[:, None]  # SNP在序列中的位置
+        array_in = (array_dif >= 0) & (array_dif < array_len[:, None])  # SNP是否在序列范围内
+
+        ls_index_str = [index for index, sequence_seq_m in enumerate(ls_sequence_seq_m) if isinstance(sequence_seq_m, str)]
+        if len(ls_index_str) == len(ls_sequence_seq_m):  # 均为字符串时拼接后一次性取出
+            array_base_all = np.frombuffer(("".join(ls_sequence_seq_m) + "N").encode("ascii"), dtype=np.uint8)  # 末尾占位
+            array_offset = np.cumsum(array_len) - array_len  # 每条序列在array_base_all中的起始位置
+            array_base = array_base_all[np.where(array_in, array_offset[:, None] + array_dif, 0)]
+        else:
+            array_base = np.frombuffer("".join(
+                sequence_seq_m.base_at(ls_dif) if not isinstance(sequence_seq_m, str) else
+                "".join(sequence_seq_m[dif] if 0 <= dif < len(sequence_seq_m) else "N" for dif in ls_dif)
+                for sequence_seq_m, ls_dif in zip(ls_sequence_seq_m, array_dif.tolist())).encode("ascii"),
+                dtype=np.uint8).reshape(len(ls_sequence_seq_m), n_snp)
+        array_check = array_allowed[np.arange(n_snp)[None, :], array_base]
+
+        array_mh = np.where(array_in, array_base, ord("N")).astype(np.uint8)
+        array_mh_z = np.where(array_in, np.where(array_check, array_base, ord("Z")), ord("N")).astype(np.uint8)
 
-        elif dif_mh_seq < 0:  # 如果测序序列起始在MH起始之后
-            seq_extract_mh, seq_extract_mh_z = self._single_match_extract_b(sequence_startpos, sequence_end, sequence_seq_m,
-                                                                            array_mh_pos, dict_sequence_refalt)
-            return matched_mh_value[0], primer, umi, seq_extract_mh, seq_extract_mh_z
+        str_mh = array_mh.tobytes().decode("ascii")
+        str_mh_z = array_mh_z.tobytes().decode("ascii")
+        return [(str_mh[i:i + n_snp], str_mh_z[i:i + n_snp]) for i in range(0, len(str_mh), n_snp)]
 
-    def single_match(self, sequence_single):
+    def single_match(self, sequence_single, mh_sweep=None):
         """
         对单条序列进行MH匹配
         输出结果为该sequence匹配的等位基因（包括错配替换前/后的情况（如果存在错配））、该等位基因所属MH的ID（用于字典匹配）
+        mh_sweep: 输入有序时使用的扫描线（PreProcessing.MHSweep），为None或输入实际无序时使用_single_match_mhpos
         //2022.03.15 复核：单条测序结果的ID、primer、UMI、allele、wrongallele提取无误
+        //2026.10.18 新增扫描线模式
         """
         sequence_chr = sequence_single[0]  # 提取序列的染色体信息
         sequence_startpos = int(sequence_single[1])  # 提取序列的起始POS信息
@@ -318,98 +598,314 @@ class MHMatch:
         dict_sequence_refalt = self.dict_chr_refalt[sequence_chr]  # 依据染色体信息提取dict_refalt中的子字典
         dict_sequence_info = self.dict_chr_info[sequence_chr]  # 依据染色体信息提取dict_info的子字典
 
-        matched_mh_startpos = self._single_match_mhpos(sequence_startpos, dict_sequence_info)  # 输出sequence匹配到MH的起始POS
+        matched_mh_startpos = mh_sweep.nearest(sequence_chr, sequence_startpos) if mh_sweep else None
+        if matched_mh_startpos is None:
+            matched_mh_startpos = self._single_match_mhpos(sequence_startpos, dict_sequence_info,
+                                                           sequence_chr)  # 输出sequence匹配到MH的起始POS
 
         return self._single_match_extract(sequence_startpos, sequence_seq_m, sequence_seq, sequence_len, matched_mh_startpos,
                                           dict_sequence_refalt, dict_sequence_info)
 
+    def match_batch(self, ls_sequence_single, mh_sweep=None):
+        """
+        对一批序列进行MH匹配，输出结果与逐条调用single_match一致（列表，顺序与输入一致）
+        MH匹配及引物检测逐条进行；等位基因提取按匹配到的MH分组，每组使用预先生成的提取方案（见_extract_plan）一次性完成
+        无法使用提取方案的序列（MH中有SNP不在vcf中、序列长度与记录不符等）仍逐条提取
+        存在读段缓存（ReadCache）时，与已匹配读段相同的读段（含同一批中的重复读段）直接复用匹配结果，仅重新提取UMI；
+        MH扫描线对每条读段照常推进（输入无序的判断不受缓存影响）
+        sequence_m为PreProcessing.CigarWalker时（过滤与匹配合并进行）不生成完整的sequence_m：缓存键使用CigarWalker.key()，
+        等位基因提取按偏移表取碱基（见_batch_extract）
+        //2026.10.18 新增
+        //2026.10.18 新增读段缓存
+        //2026.10.18 不再对每条读段调用str(sequence_m)
+        """
+        ls_result = [None] * len(ls_sequence_single)
+        ls_primer_kind = [None] * len(ls_sequence_single)  # 每条读段的引物类型（用于写入缓存）
+        ls_key = [None] * len(ls_sequence_single)  # 每条读段的缓存键（仅记录未命中缓存、且为该批中首次出现的读段）
+        dict_pending = {}  # 该批中未命中缓存的读段：缓存键 -> 首次出现的序号
+        ls_copy = []  # 该批中重复的读段：(序号, 首次出现的序号)
+        dict_group = {}  # (染色体, 匹配到MH的起始POS) -> [序号, ...]
+
+        for index, sequence_single in enumerate(ls_sequence_single):
+            sequence_chr = sequence_single[0]
+            sequence_startpos = int(sequence_single[1])
+            sequence_len = sequence_single[2]
+            sequence_seq_m = sequence_single[3]
+            sequence_seq = sequence_single[4]
+
+            dict_sequence_refalt = self.dict_chr_refalt[sequence_chr]
+            dict_sequence_info = self.dict_chr_info[sequence_chr]
+
+            matched_mh_startpos = mh_sweep.nearest(sequence_chr, sequence_startpos) if mh_sweep else None
+            if matched_mh_startpos is None:
+                matched_mh_startpos = self._single_match_mhpos(sequence_startpos, dict_sequence_info, sequence_chr)
+
+            """查找读段缓存"""
+            if self.read_cache is not None:
+                key = (sequence_chr, sequence_startpos, int(sequence_len),
+                       sequence_seq_m if isinstance(sequence_seq_m, str) else sequence_seq_m.key())
+                if key in dict_pending:  # 与该批中之前的读段相同，计为命中
+                    ls_copy.append((index, dict_pending[key]))
+                    self.read_cache.hit += 1
+                    continue
+                cached = self.read_cache.get(key)
+                if cached is not None:
+                    mh_id, primer, primer_kind, seq_extract_mh, seq_extract_mh_z = cached
+                    ls_result[index] = (mh_id, primer, self._single_match_umi(sequence_seq, primer_kind),
+                                        seq_extract_mh, seq_extract_mh_z)
+                    continue
+                dict_pending[key] = index
+                ls_key[index] = key
+
+            matched_mh_startpos, matched_mh_value, primer, primer_kind = self._single_match_primer(sequence_seq_m,
+                                                                                                   matched_mh_startpos,
+                                                                                                   dict_sequence_info)
+            umi = self._single_match_umi(sequence_seq, primer_kind)
+            ls_primer_kind[index] = primer_kind
+            extract_plan = self._extract_plan(sequence_chr, matched_mh_startpos)
+
+            """测序序列起始在MH起始之前、但有SNP在序列起始之前时，原提取方式的结果与按POS提取不同，逐条提取"""
+            if extract_plan is None or len(sequence_seq_m) != int(sequence_len) or \
+                    (matched_mh_startpos >= sequence_startpos and extract_plan[2] < sequence_startpos):
+                ls_result[index] = (matched_mh_value[0], primer, umi) + \
+                    self._single_match_extract_allele(sequence_startpos, sequence_seq_m, sequence_len,
+                                                      matched_mh_startpos, matched_mh_value, dict_sequence_refalt)
+                continue
+
+            ls_result[index] = (matched_mh_value[0], primer, umi, sequence_startpos, sequence_seq_m)
+            dict_group.setdefault((sequence_chr, matched_mh_startpos), []).append(index)
+
+        for key, ls_index in dict_group.items():
+            ls_allele = self._batch_extract(self.dict_extract_plan[key],
+                                            [ls_result[index][3] for index in ls_index],
+                                            [ls_result[index][4] for index in ls_index])
+            for index, (seq_extract_mh, seq_extract_mh_z) in zip(ls_index, ls_allele):
+                ls_result[index] = ls_result[index][:3] + (seq_extract_mh, seq_extract_mh_z)
+
+        """写入读段缓存，并填充该批中重复的读段"""
+        if self.read_cache is not None:
+            for index in dict_pending.values():
+                mh_id, primer, _, seq_extract_mh, seq_extract_mh_z = ls_result[index]
+                self.read_cache.put(ls_key[index],
+                                    (mh_id, primer, ls_primer_kind[index], seq_extract_mh, seq_extract_mh_z))
+            for index, index_first in ls_copy:
+                mh_id, primer, _, seq_extract_mh, seq_extract_mh_z = ls_result[index_first]
+                umi = self._single_match_umi(ls_sequence_single[index][4], ls_primer_kind[index_first])
+                ls_result[index] = (mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z)
+        return ls_result
+
     """
     //2021.11.30 对匹配后的结果进行过滤（依据purity、依据UMI绝对值、依据allele的比例）
                  匹配结果的过滤调整为可选择过滤条件
     """
-    """基于dict_for_purity的结果，对特定MH下UMI的purity进行计算"""     
-    def _purity_calc(self, dict_allele_count):
+    """基于dict_for_purity的结果，对特定MH下UMI的purity进行计算"""
+    def _purity_columns(self, dict_for_purity, id, seq_code):
         """
-        //2021.11.15 新增：对包含多个Allele的UMI进行purity计算，并输出count占比最高的等位基因名称
-        //2022.03.15 修正获取单个UMI下count占比最高等位基因的代码
+        //2026.10.18 新增：输出特定MH用于purity计算的列式结果：(UMI编码, Allele编码, count)三个数组
+                     dict_for_purity可为CountStore.PurityCount（编码表与匹配结果一致时直接输出）或嵌套字典
         """
-        ls_allele = []
-        ls_allele_count = []
-        for key, value in dict_allele_count.items():  # 对单个UMI下的每个Allele（key）-Count（value）操作
-            ls_allele.append(key)
-            ls_allele_count.append(value)
-        
-        purity = max(ls_allele_count) / sum(ls_allele_count)  # 计算purity
-        max_allele = ls_allele[ls_allele_count.index(max(ls_allele_count))]  # 获取单个UMI下Count占比最高的Allele
-        return purity, max_allele
-    
-    def _umi_judgement(self, dict_for_purity, id, purity_filter):
+        if isinstance(dict_for_purity, CountStore.PurityCount) and dict_for_purity.seq_code is seq_code:
+            return dict_for_purity.columns(id)
+
+        ls_umi, ls_allele, ls_count = [], [], []
+        for umi, dict_allele_count in dict_for_purity[id].items():
+            for allele, count in dict_allele_count.items():
+                ls_umi.append(seq_code.encode(umi))
+                ls_allele.append(seq_code.encode(allele))
+                ls_count.append(count)
+        return np.array(ls_umi, dtype=np.uint64), np.array(ls_allele, dtype=np.uint64), np.array(ls_count, dtype=np.int64)
+
+    def _umi_judgement(self, array_umi, array_allele, array_count, purity_filter):
         """
         //2021.11.15 新增：对特定MH下所有UMI中包含Allele数目进行判断及purity计算，基于purity计算结果输出用于purity过滤的内容
         //           purity < 0.8：输出UMI（特定MH下包含该UMI的结果都将删除）
         //           0.8 <= putity < 1：输出{UMI:Allele}（特定MH下，该UMI对应的特定Allele将保留）
+        //2026.10.18 改为对列式结果按UMI分组计算：单个UMI下仅有一个Allele时purity必为1，跳过；
+                     purity = 最高count / count之和，count最高的Allele有多个时取靠前的Allele
+                     输出(排除的UMI编码, 保留Allele的UMI编码, 对应保留的Allele编码)，UMI编码均已排序
         """
-        dict_spe_mh_purity = dict_for_purity[id]  # 提取特定MH的purity字典：{UMI: {allele1: count, allele2:count, ...}, ...}
-        
-        ls_umi_excluded = []  # 储存purity < 0.8的结果
-        dict_umi_max_allele = {}  # 储存0.8 <= purity < 1的结果
-        for umi, dict_allele_count in dict_spe_mh_purity.items():  # 对单个UMI进行操作：UMI（key）-{Allele: Count}（value）
-            
-            if len(dict_allele_count) == 1:  # 如果单个UMI下仅有一个Allele，则purity必为1，则跳过
-                continue
-            
-            else:  # 单个UMI下有多个Allele
-                purity, max_allele = self._purity_calc(dict_allele_count)
-                
-                if purity < purity_filter:  # <设定值，输出UMI（用于排除）
-                    ls_umi_excluded.append(umi)
-                elif purity_filter <= purity < 1:  # 设定值 <= < 1：输出{umi：max_allele}
-                    dict_umi_max_allele.update({umi: max_allele})
-        
-        return ls_umi_excluded, dict_umi_max_allele
-
-    def _allele_count_filter(self, ls_spe_mh_filter_match_results, allele_num_filter):
+        n = len(array_umi)
+        array_order = np.lexsort((np.arange(n), -array_count, array_umi))  # 按UMI分组，组内count从高到低
+        array_umi_sorted = array_umi[array_order]
+        array_start = np.flatnonzero(np.r_[True, array_umi_sorted[1:] != array_umi_sorted[:-1]]) if n else \
+            np.zeros(0, dtype=np.int64)  # 每个UMI的起始位置
+
+        array_allele_num = np.diff(np.r_[array_start, n])  # 单个UMI下Allele的数目
+        array_count_sum = np.add.reduceat(array_count[array_order], array_start) if n else array_count
+        array_count_max = array_count[array_order][array_start]
+        array_purity = array_count_max / np.maximum(array_count_sum, 1)  # 计算purity
+
+        array_multi = array_allele_num > 1  # 单个UMI下有多个Allele
+        array_excluded = array_multi & (array_purity < purity_filter)  # <设定值，输出UMI（用于排除）
+        array_max = array_multi & (array_purity >= purity_filter) & (array_purity < 1)  # 设定值 <= < 1：输出{umi：max_allele}
+        array_umi_start = array_umi_sorted[array_start]
+        array_allele_max = array_allele[array_order][array_start]  # 单个UMI下count最高的Allele
+        return array_umi_start[array_excluded], array_umi_start[array_max], array_allele_max[array_max]
+
+    def _allele_count_filter(self, array_allele, array_count, array_retain, allele_num_filter):
         """
         //2022.11.17 基于每个等位基因的绝对值进行过滤
+        //2026.10.18 改为对列式结果按等位基因分组求和：保留count之和 > 设定值的等位基因，输出过滤后的array_retain
         """
-        """提取等位基因:计数字典"""
-        dict_allele_count = {}
-        count_all = 0  # 等位基因count数之和
-        for single_match in ls_spe_mh_filter_match_results:
-
-            if single_match[2] not in dict_allele_count.keys():
-                dict_allele_count[single_match[2]] = single_match[4]
-                count_all += single_match[4]
-            else:
-                dict_allele_count[single_match[2]] += single_match[4]
-                count_all += single_match[4]
+        _, array_inverse = np.unique(array_allele, return_inverse=True)
+        array_allele_count = np.bincount(array_inverse.reshape(-1), weights=np.where(array_retain, array_count, 0))
+        return array_retain & (array_allele_count[array_inverse.reshape(-1)] > allele_num_filter)
 
-        """过滤"""
-        ls_allele_retain = [key for key, value in dict_allele_count.items() if value > allele_num_filter]
-        ls_retain_results = [line for line in ls_spe_mh_filter_match_results if line[2] in ls_allele_retain]
-        return ls_retain_results
-
-    def _allele_count_filter_ratio(self, ls_spe_mh_filter_match_results, allele_proportion_filter):
+    def _allele_count_filter_ratio(self, array_allele, array_count, array_retain, allele_proportion_filter):
         """
         //2021.11.30 基于每个等位基因占所有等位基因的比例进行过滤
+        //2026.10.18 改为对列式结果按等位基因分组求和：保留count之和 > 阈值的等位基因，输出过滤后的array_retain
         """
-        """提取等位基因:计数字典"""
-        dict_allele_count = {}
-        count_all = 0  # 等位基因count数之和
-        for single_match in ls_spe_mh_filter_match_results:
+        count_all = int(array_count[array_retain].sum())  # 等位基因count数之和
+        threshold = int(count_all * allele_proportion_filter + 0.5)  # 计算allele的阈值（+0.5是为了四舍五入）
+        return self._allele_count_filter(array_allele, array_count, array_retain, threshold)
 
-            if single_match[2] not in dict_allele_count.keys():
-                dict_allele_count[single_match[2]] = single_match[4]
-                count_all += single_match[4]
-            else:
-                dict_allele_count[single_match[2]] += single_match[4]
-                count_all += single_match[4]
+    def _match_columns(self, dict_match_results, id, seq_code):
+        """
+        //2026.10.18 新增：输出特定MH的列式匹配结果：(allele编码, UMI编码, count, 输出第i行[ID, primer, allele, UMI, count]的函数)
+                     行顺序与Toolsbox.FormatTools._match_dict_to_list一致
+                     dict_match_results可为CountStore.MatchCount或嵌套字典（嵌套字典时以seq_code编码）
+        """
+        if isinstance(dict_match_results, CountStore.MatchCount):
+            array_primer, array_allele, array_umi, array_count = dict_match_results.columns(id)
+
+            def row(index):
+                return [id, dict_match_results.ls_primer[array_primer[index]], seq_code.decode(int(array_allele[index])),
+                        seq_code.decode(int(array_umi[index])), int(array_count[index])]
+            return array_allele, array_umi, array_count, row
+
+        ls_spe_mh_results = Toolsbox.FormatTools._match_dict_to_list(dict_match_results, id)  # 提取指定MH信息（列表）
+        array_allele = np.array([seq_code.encode(line[2]) for line in ls_spe_mh_results], dtype=np.uint64)
+        array_umi = np.array([seq_code.encode(line[3]) for line in ls_spe_mh_results], dtype=np.uint64)
+        array_count = np.array([line[4] for line in ls_spe_mh_results], dtype=np.int64)
+        return array_allele, array_umi, array_count, ls_spe_mh_results.__getitem__
+
+    """UMI纠错聚类"""
+    def umi_cluster(self, dict_match_results, dict_for_purity):
+        """
+        //2026.10.18 新增：UMI纠错聚类（可选，在match_filter之前进行）
+                     对每个MH的每种primer，以UMI在各Allele下的count之和作为该UMI的count进行directional adjacency聚类
+                     （详见CountStore.umi_directional），同一簇的UMI合并至代表UMI（count相加）
+                     purity计算结果按相同的对应关系合并（UMI在多种primer下出现时采用其count最高的primer下的对应关系），
+                     合并后单个UMI下可包含多个Allele
+        dict_match_results: CountStore.MatchCount
+        dict_for_purity: CountStore.PurityCount或嵌套字典
+        输出：聚类后的dict_match_results（CountStore.MatchCount，编码表不变）、
+              dict_for_purity（嵌套字典，{mhid: {umi: {allele: count}}}）
+        """
+        seq_code = dict_match_results.seq_code
+        match_cluster = CountStore.MatchCount(self.ls_id, seq_code)
+        dict_purity_cluster = {}
+        for id in dict.fromkeys(self.ls_id):
+            array_primer, array_allele, array_umi, array_count = dict_match_results.columns(id)
+            array_root = array_umi.copy()  # 每行UMI对应的代表UMI
+            dict_umi_root = {}  # {UMI编码: (count, 代表UMI编码)}，用于purity结果的合并
+
+            """对每种primer分别聚类"""
+            for primer_index in np.unique(array_primer).tolist():
+                array_index = np.flatnonzero(array_primer == primer_index)
+                array_umi_unique, array_first, array_inverse = np.unique(array_umi[array_index], return_index=True,
+                                                                         return_inverse=True)
+                array_inverse = array_inverse.reshape(-1)
+                array_umi_count = np.bincount(array_inverse, weights=array_count[array_index]).astype(np.int64)
+                array_order = np.argsort(array_first, kind="stable")  # 按UMI首次出现的顺序
+                ls_umi_code = array_umi_unique[array_order].tolist()
+                ls_count = array_umi_count[array_order].tolist()
+                ls_root = CountStore.umi_directional(ls_umi_code, ls_count, seq_code)
+
+                array_root_unique = np.empty(len(array_umi_unique), dtype=np.uint64)
+                array_root_unique[array_order] = array_umi_unique[array_order][ls_root]
+                array_root[array_index] = array_root_unique[array_inverse]
+                for umi_code, count, index_root in zip(ls_umi_code, ls_count, ls_root):
+                    if umi_code not in dict_umi_root or count > dict_umi_root[umi_code][0]:
+                        dict_umi_root[umi_code] = (count, ls_umi_code[index_root])
+
+            """合并匹配结果及purity计算结果"""
+            for primer_index, allele_code, umi_code, count in zip(array_primer.tolist(), array_allele.tolist(),
+                                                                  array_root.tolist(), array_count.tolist()):
+                match_cluster.add_code(id, dict_match_results.ls_primer[primer_index], allele_code, umi_code, count)
+
+            dict_spe_purity = dict_purity_cluster[id] = {}
+            for umi_code, allele_code, count in zip(*(array.tolist() for array in
+                                                      self._purity_columns(dict_for_purity, id, seq_code))):
+                umi = seq_code.decode(dict_umi_root.get(umi_code, (0, umi_code))[1])
+                allele = seq_code.decode(allele_code)
+                dict_allele_count = dict_spe_purity.setdefault(umi, {})
+                dict_allele_count[allele] = dict_allele_count.get(allele, 0) + count
+        return match_cluster, dict_purity_cluster
+
+    """UMI家族的一致性等位基因"""
+    def umi_consensus(self, dict_match_results, dict_for_purity=None):
+        """
+        //2026.10.18 新增：对每个UMI家族（同一MH、primer、UMI下的全部读段）构建一致性等位基因（可选，在match_filter之前进行）
+                     将家族内各Allele按count展开为（读段数 × SNP位点数）的碱基矩阵，逐个SNP位点取count最高的碱基
+                     （count相同时优先取家族中count最高的Allele在该位点的碱基），每个UMI家族仅输出一个Allele，
+                     count为家族内count之和；单个SNP位点的测序错误不再形成新的Allele
+                     Allele长度不一致时以家族中count最高的Allele的长度为准
+        dict_match_results: CountStore.MatchCount
+        dict_for_purity: 不使用（一致性Allele的purity由输出的匹配结果重新计算），保留以与umi_cluster的输入一致
+        输出：一致性Allele的dict_match_results（CountStore.MatchCount，编码表不变）、
+              dict_for_purity（嵌套字典，{mhid: {umi: {allele: count}}}，UMI在多种primer下出现时合并计数）
+        """
+        seq_code = dict_match_results.seq_code
+        match_consensus = CountStore.MatchCount(self.ls_id, seq_code)
+        dict_purity_consensus = {}
+        for id in dict.fromkeys(self.ls_id):
+            dict_spe_purity = dict_purity_consensus[id] = {}
+            array_primer, array_allele, array_umi, array_count = dict_match_results.columns(id)
+            if len(array_count) == 0:
+                continue
 
-        """确定单MH下要保留的等位基因类型，并进行过滤"""
-        threshold = int(count_all * allele_proportion_filter + 0.5)  # 计算allele的阈值（+0.5是为了四舍五入）
-        ls_allele_retain = [key for key, value in dict_allele_count.items() if value > threshold]  # 提取count数高于阈值的等位基因
-        ls_retain_results = [line for line in ls_spe_mh_filter_match_results if line[2] in ls_allele_retain]
-        return ls_retain_results
+            """UMI家族：(primer, UMI)，按首次出现的顺序编号"""
+            _, array_first, array_family = np.unique(np.column_stack((array_primer.astype(np.uint64), array_umi)),
+                                                     axis=0, return_index=True, return_inverse=True)
+            array_rank = np.empty(len(array_first), dtype=np.int64)
+            array_rank[np.argsort(array_first, kind="stable")] = np.arange(len(array_first))
+            array_family = array_rank[array_family.reshape(-1)]
+            family_num = len(array_first)
+
+            """碱基矩阵（以0补齐长度），碱基转化为符号序号"""
+            array_allele_unique, array_allele_inverse = np.unique(array_allele, return_inverse=True)
+            ls_allele_unique = [seq_code.decode(code) for code in array_allele_unique.tolist()]
+            array_length = np.array([len(allele) for allele in ls_allele_unique], dtype=np.int64)
+            length = max(int(array_length.max()), 1)
+            array_base = np.zeros((len(ls_allele_unique), length), dtype=np.uint8)
+            for index, allele in enumerate(ls_allele_unique):
+                array_base[index, :len(allele)] = np.frombuffer(allele.encode(), dtype=np.uint8)
+            array_symbol_base, array_symbol = np.unique(array_base, return_inverse=True)
+            array_symbol = array_symbol.reshape(array_base.shape)[array_allele_inverse.reshape(-1)]  # 每行的符号矩阵
+            symbol_num = len(array_symbol_base)
+
+            """逐个UMI家族、SNP位点对各符号计数"""
+            array_flat = (array_family[:, None] * length + np.arange(length)) * symbol_num + array_symbol
+            array_symbol_count = np.bincount(array_flat.reshape(-1), weights=np.repeat(array_count, length),
+                                             minlength=family_num * length * symbol_num).reshape(
+                family_num, length, symbol_num)
+            if array_symbol_base[0] == 0:
+                array_symbol_count[:, :, 0] = -1  # 补齐位置不参与计数
+
+            """count最高的符号；count相同时优先取家族中count最高的Allele的碱基"""
+            array_order = np.lexsort((np.arange(len(array_count)), -array_count, array_family))
+            array_top = array_order[np.r_[True, array_family[array_order][1:] != array_family[array_order][:-1]]]
+            array_top_symbol = array_symbol[array_top]  # 家族中count最高的Allele（family_num × length）
+            array_max = array_symbol_count.max(axis=2)
+            array_top_count = np.take_along_axis(array_symbol_count, array_top_symbol[:, :, None], axis=2)[:, :, 0]
+            array_consensus = np.where(array_top_count == array_max, array_top_symbol,
+                                       array_symbol_count.argmax(axis=2))
+            array_consensus_base = array_symbol_base[array_consensus]
+            array_consensus_length = array_length[array_allele_inverse.reshape(-1)[array_top]]
+            array_family_count = np.bincount(array_family, weights=array_count, minlength=family_num).astype(np.int64)
+
+            """输出每个UMI家族的一致性Allele"""
+            array_primer_top, array_umi_top = array_primer[array_top], array_umi[array_top]
+            for index in range(family_num):
+                allele = array_consensus_base[index, :array_consensus_length[index]].tobytes().decode()
+                umi_code, count = int(array_umi_top[index]), int(array_family_count[index])
+                match_consensus.add_code(id, dict_match_results.ls_primer[array_primer_top[index]],
+                                         seq_code.encode(allele), umi_code, count)
+                dict_allele_count = dict_spe_purity.setdefault(seq_code.decode(umi_code), {})
+                dict_allele_count[allele] = dict_allele_count.get(allele, 0) + count
+        return match_consensus, dict_purity_consensus
 
     """基于purity和UMI-count对dict_match_results进行过滤"""
     def match_filter(self, dict_match_results, dict_for_purity,
@@ -421,82 +917,213 @@ class MHMatch:
                      只设置单类过滤，则单条结果只需要满足单类条件即可保存。在基于上述两个条件的过滤后，再进行等位基因比例
                      过滤。若无purity过滤和UMI-count条件，则直接将索引的单条match数据储存至过滤结果中进行下一步
         //2022.11.17 新增对等位基因绝对值的过滤
+        //2026.10.18 改为对每个MH的列式结果（见_match_columns）进行向量化过滤，过滤规则不变：
+                     1.purity过滤：UMI在排除列表中则删除；否则设置了UMI-count过滤时按count判断，未设置时仅保留
+                       {UMI: Allele}中UMI和Allele均匹配的结果
+                     2.仅UMI-count过滤：count >= 设定值则保留
+                     3.均不设置：全部保留
+                     随后依次进行等位基因绝对值、比例过滤，每个MH的结果按count从高到低排序（count相同时保持原顺序）
         """
+        seq_code = dict_match_results.seq_code if isinstance(dict_match_results, CountStore.MatchCount) else \
+            CountStore.SeqCode()
+
         ls_filter_match_results = []  # 储存过滤后的结果
         for id in self.ls_id:  # 对每一个MH进行操作
-            
-            ls_spe_mh_results = Toolsbox.FormatTools._match_dict_to_list(dict_match_results, id)  # 提取指定MH信息（列表）
-
-            if purity_filter:  # 如果需要进行purity过滤
-                ls_umi_excluded, dict_umi_max_allele = self._umi_judgement(dict_for_purity, id, purity_filter)  # 输出purity排除的信息
-            else:
-                pass
-
-            ls_spe_mh_filter_match_results = []
-            for single_match in ls_spe_mh_results:  # 对单条match数据进行操作
-
-                """先依据purity进行过滤"""
-                if purity_filter:
+            array_allele, array_umi, array_count, row = self._match_columns(dict_match_results, id, seq_code)
+            if len(array_count) == 0:
+                continue
 
-                    if single_match[3] in ls_umi_excluded:  # 如果UMI在排除列表中，则跳过并结束此轮循环
-                        continue
+            """先依据purity进行过滤，再依据UMI-count进行过滤"""
+            if purity_filter:
+                array_umi_excluded, array_umi_max, array_allele_max = self._umi_judgement(
+                    *self._purity_columns(dict_for_purity, id, seq_code), purity_filter)  # 输出purity排除的信息
+                array_included = ~np.isin(array_umi, array_umi_excluded)  # UMI不在排除列表中
+
+                if umi_count_filter:  # 如果有UMI过滤，则对purity过滤后的结果进行UMI判断
+                    array_retain = array_included & (array_count >= umi_count_filter)
+                elif len(array_umi_max):  # 如果没有UMI过滤，则仅保留UMI和Allele均匹配的结果
+                    array_index = np.minimum(np.searchsorted(array_umi_max, array_umi), len(array_umi_max) - 1)
+                    array_retain = array_included & (array_umi_max[array_index] == array_umi) & \
+                        (array_allele_max[array_index] == array_allele)
+                else:
+                    array_retain = np.zeros(len(array_count), dtype=bool)
 
-                    if single_match[3] in dict_umi_max_allele.keys():
+            elif umi_count_filter:  # 不存在purity过滤时，直接依据UMI-count进行过滤
+                array_retain = array_count >= umi_count_filter
 
-                        if dict_umi_max_allele[single_match[3]] == single_match[2]:  # 如果UMI和Allele均匹配，则储存并结束此轮循环
+            else:  # 如果不进行purity过滤和UMI-count过滤，则直接保留结果（用于等位基因比例过滤）
+                array_retain = np.ones(len(array_count), dtype=bool)
 
-                            if umi_count_filter:  # 如果有UMI过滤，则对purity过滤后的结果进行UMI判断，符合则储存
+            """依据等位基因绝对值或所占比例进行过滤（先绝对值，后比例）"""
+            if allele_num_filter:
+                array_retain = self._allele_count_filter(array_allele, array_count, array_retain, allele_num_filter)
 
-                                if single_match[4] >= umi_count_filter:  # 如果count>设置值，则储存并结束此轮循环
-                                    ls_spe_mh_filter_match_results.append(single_match)
-                                    continue
+            if allele_proportion_filter:
+                array_retain = self._allele_count_filter_ratio(array_allele, array_count, array_retain,
+                                                               allele_proportion_filter)
 
-                                else:  # 未达到设置值，则跳过循环
-                                    continue
+            array_index = np.flatnonzero(array_retain)
+            array_index = array_index[np.argsort(-array_count[array_index], kind="stable")]  # 按count从高到低排序
+            ls_filter_match_results.extend(row(index) for index in array_index.tolist())
+        return ls_filter_match_results
 
-                            else:  # 如果没有UMI过滤，则直接储存并跳出循环
-                                ls_spe_mh_filter_match_results.append(single_match)
-                                continue
+    def _match_iter(self, sam_filter_file, sorted_input=None, batch_size=4096):
+        """
+        对逐行读取的过滤后sam文件进行MH匹配，按原顺序逐条输出可使用序列的匹配结果：
+        (mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z)
+        满足存在引物, seq_extract_mh中无缺失（D）、seq_extract_mh非两头都是N，则认为是可使用序列
+        batch_size: 每批进行匹配的序列数目（见match_batch）
+        //2026.10.18 由match中拆分而来
+        //2026.10.18 改为按批匹配
+        """
+        mh_sweep = None if sorted_input is False else PreProcessing.MHSweep(self.mh_index, strict=bool(sorted_input))
 
-                else:
-                    pass  # 不跳出对单条match进行操作的循环，继续执行下面的代码
-            
-                """依据UMI-count进行过滤（在不存在purity过滤的情况下，直接依据UMI-count进行过滤）"""
-                if umi_count_filter:
+        for ls_sequence_single in Toolsbox.FileTools._chunk(sam_filter_file, batch_size):
+            for mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z in self.match_batch(ls_sequence_single, mh_sweep):
+                # 对一条测序信息的匹配结果进行判断，该序列是否可以被纳入结果中
+                if primer != "None" and "D" not in seq_extract_mh:
 
-                    if single_match[4] >= umi_count_filter:  # 如果count>设置值，则储存并结束此轮循环
-                        ls_spe_mh_filter_match_results.append(single_match)
+                    if seq_extract_mh.startswith("N") and seq_extract_mh.endswith("N"):
                         continue
+
                     else:
-                        continue
+                        yield mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z
 
-                else:
-                    pass
+    def _match_range(self, path, beg, end, sorted_input=None):
+        """
+        对过滤后sam文件中[beg, end)字节范围内的行进行MH匹配，以列表形式输出_match_iter的结果
+        .mhr文件（详见ReadStore）中beg、end为块序号
+        //2026.10.18 新增（用于单个文件内的分块并行）
+        //2026.10.18 新增对.mhr文件的支持
+        """
+        if path.endswith(".mhr"):
+            with ReadStore.ReadStoreReader(path) as reader:
+                return list(self._match_iter(reader.iter_rows(beg, end), sorted_input))
 
-                """如果不进行purity过滤和UMI-count过滤，则直接储存结果（用于等位基因比例过滤）"""
-                if not purity_filter and not umi_count_filter:
-                    ls_spe_mh_filter_match_results.append(single_match)
+        sam_filter_file = Toolsbox.FileTools.iter_ls_file_range(path, beg, end, comment_sym="#")
+        return list(self._match_iter(sam_filter_file, sorted_input))
 
-            """依据等位基因绝对值或所占比例进行过滤（先绝对值，后比例）"""
-            if allele_num_filter:
-                ls_spe_mh_filter_match_results = self._allele_count_filter(ls_spe_mh_filter_match_results,
-                                                                           allele_num_filter)
+    def _match_split_store(self, path, chunk_num, chunk_read=65536):
+        """
+        将.mhr文件的块按顺序分组，输出[(起始块序号, 终止块序号), ...]：至少分为chunk_num组，每组的测序结果数不超过chunk_read
+        （单个块超过chunk_read时该块单独为一组）
+        //2026.10.18 新增
+        """
+        with ReadStore.ReadStoreReader(path) as reader:
+            array_read = reader.array_block[:, 1].copy()
+        if len(array_read) == 0:
+            return []
+        chunk_read = max(1, min(chunk_read, -(-int(array_read.sum()) // chunk_num)))
+
+        ls_range = []
+        beg, read_num = 0, 0
+        for index, n_read in enumerate(array_read.tolist()):
+            if read_num and read_num + n_read > chunk_read:
+                ls_range.append((beg, index))
+                beg, read_num = index, 0
+            read_num += n_read
+        ls_range.append((beg, len(array_read)))
+        return ls_range
+
+    def _match_file_iter(self, path, sorted_input=None, chunk_jobs=1, chunk_size=1 << 26):
+        """
+        对单个过滤后sam文件进行MH匹配，按原顺序逐条输出_match_iter的结果
+        chunk_jobs: 分块并行处理的进程数，为1时不分块；文件按字节分为至少chunk_jobs块（每块不超过chunk_size字节），
+                    各块的匹配结果按原顺序输出，因此后续计数（包括purity字典）与不分块时完全一致
+        .mhr文件（详见ReadStore）以内存映射方式读取，分块时按块分组（见_match_split_store）
+        //2026.10.18 新增
+        //2026.10.18 新增对.mhr文件的支持
+        """
+        if Toolsbox.ParallelTools.jobs_num(chunk_jobs) <= 1:
+            if path.endswith(".mhr"):
+                with ReadStore.ReadStoreReader(path) as reader:
+                    yield from self._match_iter(reader.iter_rows(), sorted_input)
             else:
-                pass
+                yield from self._match_iter(Toolsbox.FileTools.iter_vcf_file(path), sorted_input)  # 逐行读取sam文件
+            return
 
-            if allele_proportion_filter:
-                ls_spe_mh_filter_match_results = self._allele_count_filter_ratio(ls_spe_mh_filter_match_results,
-                                                                                 allele_proportion_filter)
+        if path.endswith(".mhr"):
+            ls_range = self._match_split_store(path, Toolsbox.ParallelTools.jobs_num(chunk_jobs))
+        else:
+            ls_range = Toolsbox.FileTools.split_file(path, Toolsbox.ParallelTools.jobs_num(chunk_jobs), chunk_size)
+        ls_args = [(path, beg, end, sorted_input) for beg, end in ls_range]
+        for ls_match in Toolsbox.ParallelTools.iter_method(self, "_match_range", ls_args, chunk_jobs):
+            yield from ls_match
+
+    def _match_sam_range(self, sam_filepath, filename, beg, end, sorted_input=None, save_filter=False):
+        """
+        对原始sam文件中[beg, end)字节范围内的行直接进行去冗余、过滤和MH匹配，输出(过滤结果, 匹配结果)
+        过滤结果为各行以"\n"连接的字符串（save_filter为False时为空字符串），匹配结果为_match_iter结果的列表
+        //2026.10.18 新增（用于过滤与匹配合并进行时的分块并行）
+        """
+        pre_sam = PreProcessing.PreSam(sam_filepath, self.panel)
+        sam_file = Toolsbox.FileTools.iter_ls_file_range(sam_filepath + filename, beg, end)
+        sam_filter = pre_sam._sam_filter_iter(sam_file, sorted_input=sorted_input)
+
+        if save_filter:
+            sam_filter = list(sam_filter)
+            sam_filter_text = "\n".join("\t".join(str(i) for i in line) for line in sam_filter)
+        else:
+            sam_filter_text = ""
+        return sam_filter_text, list(self._match_iter(sam_filter, sorted_input))
+
+    def _match_sam_file_iter(self, sam_filepath, filename, sam_filter_filepath=None, sorted_input=None, chunk_jobs=1,
+                             chunk_size=1 << 26):
+        """
+        对单个原始样本文件直接进行去冗余、过滤和MH匹配（不经过过滤后sam文件），按原顺序逐条输出_match_iter的结果
+        sam_filter_filepath: 不为None时同时储存过滤结果（与PreSam.sam_filter的结果一致，用于核查）
+        chunk_jobs: 分块并行处理的进程数（bam文件不分块），详见_match_file_iter
+        //2026.10.18 新增
+        """
+        pre_sam = PreProcessing.PreSam(sam_filepath, self.panel)
+        save_filename = PreProcessing.PreSam._sam_save_filename(filename)
+
+        if Toolsbox.ParallelTools.jobs_num(chunk_jobs) > 1 and not filename.endswith(".bam"):
+            ls_range = Toolsbox.FileTools.split_file(sam_filepath + filename,
+                                                     Toolsbox.ParallelTools.jobs_num(chunk_jobs), chunk_size)
+            ls_args = [(sam_filepath, filename, beg, end, sorted_input, sam_filter_filepath is not None)
+                       for beg, end in ls_range]
+            ls_result = Toolsbox.ParallelTools.iter_method(self, "_match_sam_range", ls_args, chunk_jobs)
+
+            if sam_filter_filepath is None:
+                for _, ls_match in ls_result:
+                    yield from ls_match
             else:
-                pass
+                with open(sam_filter_filepath + save_filename, "w") as file:
+                    sep = ""
+                    for sam_filter_text, ls_match in ls_result:
+                        if sam_filter_text:
+                            file.write(sep + sam_filter_text)
+                            sep = "\n"
+                        yield from ls_match
+            return
+
+        sam_file, _ = pre_sam._sam_open(filename)  # 逐行读取sam文件
+        sam_filter = pre_sam._sam_filter_iter(sam_file, sorted_input=sorted_input)
 
-            ls_filter_match_results.extend(sorted(ls_spe_mh_filter_match_results, key=lambda x: x[4], reverse=True))
-        return ls_filter_match_results
+        if sam_filter_filepath is None:
+            yield from self._match_iter(sam_filter, sorted_input)
+        else:
+            with open(sam_filter_filepath + save_filename, "w") as file:
+                yield from self._match_iter(self._match_save_filter(sam_filter, file), sorted_input)
+
+    def _match_save_filter(self, sam_filter, file):
+        """
+        将逐条输出的过滤结果写入file（格式与PreSam.sam_filter的结果一致），同时原样逐条输出
+        //2026.10.18 新增
+        """
+        sep = ""
+        for sequence_single in sam_filter:
+            file.write(sep + "\t".join(str(i) for i in sequence_single))
+            sep = "\n"
+            yield sequence_single
 
     """主函数"""
     def match(self, sam_filter_filepath=None, sam_match_filepath=None, sam_mismatch_filepath=None,
               filter=False, purity_filter=False, umi_count_filter=False,
-              allele_num_filter=False, allele_proportion_filter=False):
+              allele_num_filter=False, allele_proportion_filter=False, sorted_input=None, chunk_jobs=1,
+              sam_filepath=None, jobs=1, mismatch_compress=False, mismatch_max_line=None, mismatch_sample_rate=None,
+              umi_cluster=False, umi_consensus=False, count_memory_mb=None, spill_dir=None):
         """
         sam_match_filepath: 储存匹配结果文件的路径
         sam_mismatch_filepath: 储存匹配错误结果文件、引物文件为None的filter行的路径
@@ -505,6 +1132,24 @@ class MHMatch:
         umi_count_filter: 基于单一等位基因下单个UMI下的count数进行过滤，如果为False则不进行（可选过滤），可输入整数
         allele_proportion_filter: 基于单一MH下单个allele的count数占该MH的比例进行过滤，如果为False则不进行（可选过滤），
                                   可输入浮点数
+        sorted_input: 过滤后的sam文件是否按染色体、POS排序。True：使用扫描线进行MH匹配，输入无序时报错；False：对每条序列
+                      单独匹配；None：先使用扫描线，若发现输入无序则自动改为单独匹配
+        chunk_jobs: 单个文件内分块并行匹配的进程数（详见_match_file_iter），为1时不分块
+        sam_filter_filepath中的过滤结果可为文本格式或二进制格式（.mhr，由PreSam.sam_filter(binary=True)生成）
+        sam_filepath: 储存原始sam（bam）文件的文件夹路径。不为None时对原始样本文件直接进行去冗余、过滤和匹配，不再需要预先
+                      运行PreSam.sam_filter；此时sam_filter_filepath可为None（不储存过滤结果），不为None时同时储存过滤结果
+        jobs: 同时匹配的样本数（进程数），小于1时使用全部CPU核心；各子进程直接继承INFO、vcf、引物等参考信息（支持fork时不进行
+              序列化），不逐个样本传递，结果文件命名与串行时一致；与chunk_jobs同时大于1时进程数为二者之积
+        mismatch_compress: mismatch文件及no_primer文件是否以gzip压缩（文件名后加".gz"）
+        mismatch_max_line: mismatch文件及no_primer文件最多写入的行数，为None时不限制
+        mismatch_sample_rate: mismatch文件及no_primer文件按比例抽样写入（0-1），为None时全部写入
+        umi_cluster: 是否在过滤（或储存未过滤结果）前对UMI进行纠错聚类（详见umi_cluster）
+        umi_consensus: 是否在过滤（或储存未过滤结果）前将每个UMI家族合并为一致性等位基因（详见umi_consensus），
+                       与umi_cluster同时设置时先聚类
+        count_memory_mb: 单个样本匹配结果计数表的内存上限（MB，估计值），超过时将计数排序后溢写至临时文件，过滤及储存前
+                         逐个MH归并（见CountStore），结果与不溢写时完全一致；为None时不溢写
+        spill_dir: 溢写临时文件的储存文件夹，为None时使用系统临时文件夹
+        输出：匹配失败的样本及其错误信息（字典，{filename: traceback}），单个样本失败时其余样本照常匹配
         用于抓取匹配结果，进行计数并输出（嵌套字典）：
         dict_match_results: {mhid1: {primer1: {allele1: {umi1: count, umi2: count, ...}, allele2: ...}, primer2: ...},
                              mhid2: {primer1: {allele1: {umi1: count, umi2: count, ...}, allele2: ...}, primer2: ...}, ...}
@@ -516,47 +1161,129 @@ class MHMatch:
         //2021.11.30 将Match文件的过滤更改为可选
         //2022.03.01 将NNNNATNNN类似的等位基因剔除
         //2022.11.17 新增通过等位基因绝对值的过滤
+        //2026.10.18 新增对有序输入的扫描线匹配
+        //2026.10.18 新增单个文件内的分块并行匹配。原先primer为None时在判断处已跳过，_save_no_primer不会被执行，
+                     拆分后不再调用，no_primer文件仍照常储存
+        //2026.10.18 新增sam_filepath参数，过滤与匹配合并进行
+        //2026.10.18 dict_match_results、dict_for_purity改为紧凑计数表（见CountStore），按MH ID取值时格式不变
+        //2026.10.18 新增jobs参数，多个样本并行匹配
+        //2026.10.18 mismatch文件及no_primer文件改为边匹配边写入（Toolsbox.LineWriter），新增压缩、限制行数、抽样参数
+        //2026.10.18 新增umi_cluster参数，可选的UMI纠错聚类
+        //2026.10.18 新增umi_consensus参数，可选的UMI家族一致性等位基因
+        //2026.10.18 新增count_memory_mb、spill_dir参数，计数表超过内存上限时溢写至临时文件
+        //2026.10.18 样本的子进程异常终止（如内存不足被系统终止）时同样记为匹配失败，其余样本在重建的进程池中继续匹配
         """
-        if sam_filter_filepath is None:
+        if sam_filter_filepath is None and sam_filepath is None:
             raise ValueError('"sam_filter_filepath" is None')
         if sam_match_filepath is None:
             raise ValueError('"sam_match_filepath" is None')
         if sam_mismatch_filepath is None:
             raise ValueError('"sam_mismatch_filepath" is None')
 
-        """列出储存去冗余及过滤后的sam文件名"""
-        sam_filter_filename = Toolsbox.FileTools.ls_directory(sam_filter_filepath)
-
-        """对每一个sam文件进行操作"""
-        for filename in sam_filter_filename:
-            sam_filter_file = Toolsbox.FileTools.open_vcf_file(sam_filter_filepath + filename)  # 打开sam文件
-
-            dict_match_results = {id: {} for id in self.ls_id}  # 储存匹配结果（即1）
-            dict_for_purity = {id: {} for id in self.ls_id}  # 储存用于purity计算的结果（即2）
-            ls_mismatch = []  # 储存有碱基不匹配情况的等位基因（即3）
-            ls_no_primer = []  # 储存primer值为None的filter行（即4）
-
-            for sequence_single in sam_filter_file:  # 对一条测序信息进行操作，并判断该序列是否可以被纳入结果中
-                mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z = self.single_match(sequence_single)
-
-                """储存结果
-                满足存在引物, seq_extract_mh中无缺失（D）、seq_extract_mh非两头都是N，则认为是可使用序列
-                """
-                if primer != "None" and "D" not in seq_extract_mh:
-
-                    if seq_extract_mh.startswith("N") and seq_extract_mh.endswith("N"):
-                        continue
-
-                    else:
-                        self._save_match(dict_match_results, mh_id, primer, umi, seq_extract_mh)  # 储存match结果
-                        self._save_for_purity(dict_for_purity, mh_id, umi, seq_extract_mh)  # 储存purity计算和过滤相关结果
-                        self._save_mismatch(ls_mismatch, mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z)  # 储存mismatch结果
+        """列出储存去冗余及过滤后的sam文件名（过滤与匹配合并进行时为原始样本文件名，跳过bam索引文件）"""
+        if sam_filepath is None:
+            sam_filter_filename = Toolsbox.FileTools.ls_directory(sam_filter_filepath)
+        else:
+            sam_filter_filename = [filename for filename in Toolsbox.FileTools.ls_directory(sam_filepath)
+                                   if not filename.endswith(".bai")]
+
+        """对每一个sam文件进行操作（jobs大于1时多个样本并行；单个样本出错或其子进程异常终止时记录错误信息，不影响其他样本）"""
+        ls_args = [(filename, sam_filter_filepath, sam_match_filepath, sam_mismatch_filepath,
+                    filter, purity_filter, umi_count_filter, allele_num_filter, allele_proportion_filter,
+                    sorted_input, chunk_jobs, sam_filepath, mismatch_compress, mismatch_max_line, mismatch_sample_rate,
+                    umi_cluster, umi_consensus, count_memory_mb, spill_dir)
+                   for filename in sam_filter_filename]
+        ls_error = Toolsbox.ParallelTools.iter_method(self, "_match_file_report", ls_args, jobs,
+                                                      crash_result=self._match_file_crash)
+
+        dict_failure = {}  # 储存匹配失败的样本及错误信息
+        for filename, error in zip(sam_filter_filename, ls_error):
+            if error is not None:
+                dict_failure[filename] = error
+                print("{}匹配失败：{}".format(filename, error.strip().split("\n")[-1]))
+
+        if dict_failure:
+            print("共{}个样本匹配失败：{}".format(len(dict_failure), ", ".join(dict_failure)))
+        return dict_failure
+
+    @staticmethod
+    def _match_file_crash(args):
+        """
+        样本的子进程异常终止时输出的错误信息（args为该样本_match_file_report的参数）
+        //2026.10.18 新增
+        """
+        return "BrokenProcessPool: {}匹配时子进程异常终止（可能因内存不足被系统终止）".format(args[0])
 
-                else:
-                    continue
+    def _match_file_report(self, filename, *args):
+        """
+        对单个样本进行匹配（见_match_file），出错时不抛出异常，而是输出错误信息（traceback），成功时输出None
+        //2026.10.18 新增
+        """
+        try:
+            self._match_file(filename, *args)
+        except Exception:
+            return traceback.format_exc()
+
+    def _match_file(self, filename, sam_filter_filepath, sam_match_filepath, sam_mismatch_filepath,
+                    filter, purity_filter, umi_count_filter, allele_num_filter, allele_proportion_filter,
+                    sorted_input, chunk_jobs, sam_filepath, mismatch_compress=False, mismatch_max_line=None,
+                    mismatch_sample_rate=None, umi_cluster=False, umi_consensus=False, count_memory_mb=None,
+                    spill_dir=None, spill_check=65536):
+        """
+        对单个样本进行匹配、过滤并储存结果，参数详见match
+        //2026.10.18 由match中拆分而来
+        //2026.10.18 存在读段缓存时输出该样本的缓存命中率（分块并行时各子进程分别缓存，不计入）
+        //2026.10.18 设置count_memory_mb时每spill_check条结果估计一次计数表的内存，超过上限时两个计数表同时溢写
+        """
+        cache_hit, cache_miss = (self.read_cache.hit, self.read_cache.miss) if self.read_cache else (0, 0)
 
-                """储存结果（primer == "None"）"""
-                self._save_no_primer(ls_no_primer, primer, sequence_single)  # 储存no_primer结果
+        if sam_filepath is None:
+            sam_filter_match = self._match_file_iter(sam_filter_filepath + filename, sorted_input, chunk_jobs)
+            if filename.endswith(".mhr"):
+                filename = filename[:-4]  # 结果文件以原文件名命名
+        else:
+            sam_filter_match = self._match_sam_file_iter(sam_filepath, filename, sam_filter_filepath, sorted_input,
+                                                         chunk_jobs)
+            filename = PreProcessing.PreSam._sam_save_filename(filename)  # 结果文件以过滤结果的文件名命名
+
+        seq_code = CountStore.SeqCode()  # allele、UMI的编码表（两个计数表共用）
+        dict_match_results = CountStore.MatchCount(self.ls_id, seq_code, spill_dir)  # 储存匹配结果（即1）
+        dict_for_purity = CountStore.PurityCount(self.ls_id, seq_code, spill_dir)  # 储存用于purity计算的结果（即2）
+        ls_count_store = [dict_match_results, dict_for_purity]  # 用于溢写及删除临时文件
+        ls_mismatch = Toolsbox.LineWriter(sam_mismatch_filepath+filename, mismatch_compress, mismatch_max_line,
+                                          mismatch_sample_rate)  # 边匹配边写入有碱基不匹配情况的等位基因（即3）
+        ls_no_primer = Toolsbox.LineWriter(sam_mismatch_filepath+"_No_Primer_"+filename, mismatch_compress,
+                                           mismatch_max_line, mismatch_sample_rate)  # 边匹配边写入primer值为None的filter行（即4）
+
+        """储存结果（仅可使用序列，详见_match_iter）"""
+        try:
+            for index, (mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z) in enumerate(sam_filter_match, 1):
+                self._save_match(dict_match_results, mh_id, primer, umi, seq_extract_mh)  # 储存match结果
+                self._save_for_purity(dict_for_purity, mh_id, umi, seq_extract_mh)  # 储存purity计算和过滤相关结果
+                self._save_mismatch(ls_mismatch, mh_id, primer, umi, seq_extract_mh, seq_extract_mh_z)  # 储存mismatch结果
+                if count_memory_mb and index % spill_check == 0 and \
+                        sum(count_store.memory_size() for count_store in ls_count_store) > count_memory_mb * 1024 ** 2:
+                    for count_store in ls_count_store:
+                        count_store.spill()  # 超过内存上限，溢写至临时文件
+        except BaseException:
+            for count_store in ls_count_store:
+                count_store.close()
+            raise
+        finally:
+            ls_mismatch.close()  # 储存错误匹配文件
+            ls_no_primer.close()  # 储存引物为None的文件
+
+        for writer in (ls_mismatch, ls_no_primer):
+            if writer.line_written < writer.line_num:
+                print("{}：共{}行，写入{}行".format(writer.path, writer.line_num, writer.line_written))
+        if dict_match_results.ls_run:
+            print("{}匹配结果溢写{}次".format(filename, len(dict_match_results.ls_run)))
+
+        try:
+            if umi_cluster:  # UMI纠错聚类
+                dict_match_results, dict_for_purity = self.umi_cluster(dict_match_results, dict_for_purity)
+            if umi_consensus:  # UMI家族一致性等位基因
+                dict_match_results, dict_for_purity = self.umi_consensus(dict_match_results, dict_for_purity)
 
             """过滤"""
             if filter:  # 如果要进行过滤
@@ -567,8 +1294,12 @@ class MHMatch:
                                              sam_match_filepath+"_Filter_"+filename)
             else:  # 如果不进行过滤
                 Toolsbox.FileTools.save_file_match(dict_match_results, sam_match_filepath+"_No_Filter_"+filename)
-
-            """储存文件(mismatch和no_primer)"""
-            Toolsbox.FileTools.save_file(ls_mismatch, sam_mismatch_filepath+filename)  # 储存错误匹配文件
-            Toolsbox.FileTools.save_file(ls_no_primer, sam_mismatch_filepath+"_No_Primer_"+filename)  # 储存引物为None的文件
-            print("{}已匹配完成".format(filename))
\ No newline at end of file
+        finally:
+            for count_store in ls_count_store:
+                count_store.close()  # 删除溢写的临时文件
+        if self.read_cache is not None:
+            hit = self.read_cache.hit - cache_hit
+            lookup = hit + self.read_cache.miss - cache_miss
+            if lookup:
+                print("{}读段缓存命中率：{:.1%}（{}/{}）".format(filename, hit / lookup, hit, lookup))
+        print("{}已匹配完成".format(filename))
\ No newline at end of file
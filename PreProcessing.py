@@ -6,8 +6,15 @@
 # @desc    :
 
 
+import os
 import re
+import bisect
+import pickle
+import hashlib
+import numpy as np
 import Toolsbox
+import BamTools
+import ReadStore
 
 
 class Extract_INFO:
@@ -87,14 +94,23 @@ class PreVcf:
     //pre_vcf = PreVcf("C:/Users/Hao_Yu/Desktop/CHB/")
     //dict_chr_refalt = pre_vcf.vcf_filter()
     //>>> {'1': {4658311(int): 'TC', 4658339: 'TA', 4658346: 'TA', ...}, ...}
+    //2026.10.18 新增panel限定模式：传入dict_chr_info后仅保留INFO中MH所包含SNP的REF/ALT；若vcf文件存在索引（bgzip压缩+
+                 tabix索引的"xx.vcf.gz.tbi"，或由vcf_index生成的"xx.vcf.pidx"），则直接定位读取这些SNP，不再逐行扫描
+    //pre_vcf = PreVcf("C:/Users/Hao_Yu/Desktop/CHB/", dict_chr_info)
     """
 
-    def __init__(self, vcf_filepath):
+    def __init__(self, vcf_filepath, dict_chr_info=None):
         """
         vcf_filepath: 储存vcf文件的文件夹路径
+        dict_chr_info: 由PreInfo得到的结果（嵌套字典），为None时保留vcf中所有SNP
         """
         self.vcf_filepath = vcf_filepath
 
+        self.dict_chr_pos = None  # panel中各染色体上所有SNP的POS（已排序的列表）
+        if dict_chr_info is not None:
+            self.dict_chr_pos = {chrname: sorted({snppos for mh in dict_info.values() for snppos in mh[2:]})
+                                 for chrname, dict_info in dict_chr_info.items()}
+
     def _vcf_ref_alt(self, ls_vcf_snp):
         """
         用于判断单条SNP共需要保留几项REF和ALT，并进行相应去尾处理：
@@ -107,29 +123,130 @@ class PreVcf:
         else:
             return "".join(ls_vcf_snp)
 
-    def vcf_filter(self):
+    def _vcf_is_index(self, filename):
+        """
+        判断文件是否为索引文件（不作为vcf读取）
+        """
+        return filename.endswith((".tbi", ".csi", ".pidx"))
+
+    def _vcf_iter_tabix(self, path, ls_pos):
+        """
+        依据tabix索引读取指定POS处的SNP：将相距较近的POS合并为区间后按区间读取
+        """
+        tabix_reader = BamTools.TabixReader(path)
+
+        ls_region = []
+        for pos in ls_pos:
+            if ls_region and pos - ls_region[-1][1] <= 16384:  # 与上一区间相距不超过一个线性索引窗口时合并
+                ls_region[-1][1] = pos
+            else:
+                ls_region.append([pos, pos])
+
+        set_pos = set(ls_pos)
+        for ref_name in tabix_reader.ls_ref_name:
+            for beg, end in ls_region:
+                for line in tabix_reader.fetch_lines(ref_name, beg - 1, end):
+                    snp = line.split("\t")
+                    if int(snp[1]) in set_pos:
+                        yield snp
+        tabix_reader.close()
+
+    def _vcf_iter_pidx(self, path, ls_pos):
+        """
+        依据vcf_index生成的位置索引（按POS排序的[POS, 行在文件中的字节偏移]）读取指定POS处的SNP
+        """
+        array_pidx = np.load(path + ".pidx", mmap_mode="r")
+        array_pos = np.asarray(ls_pos, dtype=np.int64)
+        array_left = np.searchsorted(array_pidx[:, 0], array_pos, side="left")
+        array_right = np.searchsorted(array_pidx[:, 0], array_pos, side="right")
+
+        with open(path, "rb") as file:
+            for left, right in zip(array_left, array_right):
+                for offset in array_pidx[left:right, 1]:  # 同一POS存在多行时按文件顺序读取
+                    file.seek(int(offset))
+                    yield list(file.readline().decode("utf-8").strip("\n").split("\t"))
+
+    def _vcf_iter(self, chrname, path):
+        """
+        逐行输出vcf文件中需保留的SNP（列表形式）
+        非panel限定模式下输出所有SNP；panel限定模式下依次尝试tabix索引、位置索引，均不存在时逐行扫描并只保留panel中的POS
+        """
+        if self.dict_chr_pos is None:
+            yield from Toolsbox.FileTools.iter_vcf_file(path)
+            return
+
+        ls_pos = self.dict_chr_pos.get(chrname, [])
+        if not ls_pos:
+            return
+
+        if path.endswith(".gz") and os.path.exists(path + ".tbi"):
+            yield from self._vcf_iter_tabix(path, ls_pos)
+        elif os.path.exists(path + ".pidx") and os.path.getmtime(path + ".pidx") >= os.path.getmtime(path):
+            yield from self._vcf_iter_pidx(path, ls_pos)
+        else:
+            set_pos = set(ls_pos)
+            for snp in Toolsbox.FileTools.iter_vcf_file(path):
+                if int(snp[1]) in set_pos:
+                    yield snp
+
+    def _vcf_filter_single(self, filename):
+        """
+        对单个vcf文件进行过滤操作，输出(chrname, dict_pos_refalt)
+        //2026.10.18 由vcf_filter中拆分而来
+        """
+        chrname = filename.split(".")[0][3:]  # 提取当前vcf文件的染色体号
+        vcf_file = self._vcf_iter(chrname, self.vcf_filepath + filename)  # 以去掉注释行的形式逐行读取vcf文件
+
+        dict_pos_refalt = {}
+        for snp in vcf_file:
+            pos = int(snp[1])  # 提取pos时使用int的方式，方便后续sam与info文件计算后直接进行检索
+            str_vcf_ref_alt = self._vcf_ref_alt(snp[3:7])  # 提取该SNP的REF和ALT分型
+            dict_pos_refalt.update({pos: str_vcf_ref_alt})
+        return chrname, dict_pos_refalt
+
+    def vcf_index(self):
+        """
+        为文件夹中所有未压缩的vcf文件生成位置索引"xx.vcf.pidx"（按POS排序的[POS, 行在文件中的字节偏移]，numpy格式），
+        供panel限定模式直接定位读取。vcf文件更新后需重新生成（索引早于vcf文件时将不被使用）
+        //2026.10.18 新增
+        """
+        for filename in Toolsbox.FileTools.ls_directory(self.vcf_filepath):
+            if self._vcf_is_index(filename) or filename.endswith(".gz"):
+                continue
+            path = self.vcf_filepath + filename
+
+            ls_pos_offset = []
+            with open(path, "rb") as file:
+                offset = 0
+                for line in file:
+                    if not line.startswith(b"#"):
+                        ls_pos_offset.append((int(line.split(b"\t", 2)[1]), offset))
+                    offset += len(line)
+
+            array_pidx = np.array(sorted(ls_pos_offset), dtype=np.int64).reshape(-1, 2)
+            with open(path + ".pidx", "wb") as file:
+                np.save(file, array_pidx)
+        print("vcf索引已生成")
+
+    def vcf_filter(self, jobs=1):
         """
         主函数
         用于输出最终的结果（以嵌套字典形式）：
         {1: {pos1: refalt1, pos2: refalt2, ...},
         2: {pos1: refalt1, pos2: refalt2, ...}, ...}
+        jobs: 并行读取vcf文件的进程数（每个染色体为一个任务），小于1时使用全部CPU核心
+        //2026.10.18 新增jobs参数
         """
         dict_chr_refalt = {}  # 储存最终结果的字典
 
         """列出文件夹中所有vcf文件的名字"""
-        vcf_filename = Toolsbox.FileTools.ls_directory(self.vcf_filepath)
+        vcf_filename = [filename for filename in Toolsbox.FileTools.ls_directory(self.vcf_filepath)
+                        if not self._vcf_is_index(filename)]
 
         """对单个vcf文件进行过滤操作"""
-        for filename in vcf_filename:
-            chrname = filename.split(".")[0][3:]  # 提取当前vcf文件的染色体号
-            vcf_file = Toolsbox.FileTools.open_vcf_file(self.vcf_filepath + filename)  # 以去掉注释行的形式打开vcf文件
-
-            dict_pos_refalt = {}
-            for snp in vcf_file:
-                pos = int(snp[1])  # 提取pos时使用int的方式，方便后续sam与info文件计算后直接进行检索
-                str_vcf_ref_alt = self._vcf_ref_alt(snp[3:7])  # 提取该SNP的REF和ALT分型
-                dict_pos_refalt.update({pos: str_vcf_ref_alt})
-
+        ls_chr_refalt = Toolsbox.ParallelTools.map_method(self, "_vcf_filter_single",
+                                                          [(filename,) for filename in vcf_filename], jobs)
+        for chrname, dict_pos_refalt in ls_chr_refalt:
             dict_chr_refalt.update({chrname: dict_pos_refalt})
         print("vcf已过滤")
         return dict_chr_refalt
@@ -190,6 +307,108 @@ class PreInfo:
         return dict_chr_info, ls_id
 
 
+class Panel:
+    """
+    以数组储存的MH panel（与dict_chr_info内容一致）：每个MH对应一个整数序号（即在dict_chr_info中的遍历顺序），
+    ID通过哈希表直接查找序号，各MH的组成SNP POS以CSR形式（偏移数组+POS数组）连续储存，并按染色体保留按起始POS排序的序号
+    可代替dict_chr_info传入PreSam、MHIndex，也可传入MHMatch、SingleCall用于按ID查找MH
+    //2026.10.18 新增
+    //panel = Panel(dict_chr_info)
+    //panel.info_id("CHBCHR01_0674112")
+    //>>> ['CHBCHR01_0674112', 12, 247032240, 247032247, 247032249, ...]
+    """
+    __slots__ = ("ls_id", "dict_id_index", "ls_chr", "array_chr", "dict_chr_range", "array_key", "array_snp_num",
+                 "array_snp_offset", "array_snp_pos", "array_start", "array_end", "dict_chr_order")
+
+    def __init__(self, dict_chr_info):
+        """
+        dict_chr_info: 由PreInfo得到的结果（嵌套字典，详细格式见PreProcessing_PreInfo）
+        """
+        self.ls_id = []  # 各MH的ID
+        self.ls_chr = list(dict_chr_info.keys())  # 染色体名称（包含无MH的染色体）
+        self.dict_chr_range = {}  # 各染色体上MH序号的范围[beg, end)
+        ls_chr_code, ls_key, ls_snp_num, ls_snp_len, ls_snp_pos = [], [], [], [], []
+
+        for chr_code, (chrname, dict_info) in enumerate(dict_chr_info.items()):
+            beg = len(self.ls_id)
+            for key, mh in dict_info.items():
+                self.ls_id.append(mh[0])
+                ls_chr_code.append(chr_code)
+                ls_key.append(key)
+                ls_snp_num.append(mh[1])
+                ls_snp_len.append(len(mh) - 2)
+                ls_snp_pos.extend(mh[2:])
+            self.dict_chr_range[chrname] = (beg, len(self.ls_id))
+
+        self.dict_id_index = {}  # ID -> 序号（ID重复时保留靠前的MH，与逐一遍历的结果一致）
+        for index, id in enumerate(self.ls_id):
+            self.dict_id_index.setdefault(id, index)
+
+        self.array_chr = np.array(ls_chr_code, dtype=np.int32)  # 各MH所在染色体的编号（ls_chr中的序号）
+        self.array_key = np.array(ls_key, dtype=np.int64)  # 各MH在dict_chr_info中的key（即第一个SNP的POS）
+        self.array_snp_num = np.array(ls_snp_num, dtype=np.int64)  # 各MH的SNP数目（INFO中记录的数值）
+        self.array_snp_offset = np.zeros(len(self.ls_id) + 1, dtype=np.int64)  # 各MH的SNP POS在array_snp_pos中的起始
+        np.cumsum(ls_snp_len, out=self.array_snp_offset[1:])
+        self.array_snp_pos = np.array(ls_snp_pos, dtype=np.int64)  # 所有MH的组成SNP POS
+
+        self.array_start = np.zeros(len(self.ls_id), dtype=np.int64)  # 各MH的起始POS（最小的SNP POS）
+        self.array_end = np.zeros(len(self.ls_id), dtype=np.int64)  # 各MH的终止POS（最大的SNP POS）
+        array_nonempty = np.diff(self.array_snp_offset) > 0
+        if array_nonempty.any():
+            array_offset = self.array_snp_offset[:-1][array_nonempty]
+            self.array_start[array_nonempty] = np.minimum.reduceat(self.array_snp_pos, array_offset)
+            self.array_end[array_nonempty] = np.maximum.reduceat(self.array_snp_pos, array_offset)
+
+        self.dict_chr_order = {}  # 各染色体上按起始POS排序的MH序号（起始POS相同时保持原顺序）
+        for chrname, (beg, end) in self.dict_chr_range.items():
+            self.dict_chr_order[chrname] = beg + np.argsort(self.array_start[beg:end], kind="stable")
+
+    def __len__(self):
+        return len(self.ls_id)
+
+    def index(self, id):
+        """
+        输出MH ID对应的序号，不存在时输出None
+        """
+        return self.dict_id_index.get(id)
+
+    def chrname(self, index):
+        """
+        输出第index个MH所在的染色体
+        """
+        return self.ls_chr[self.array_chr[index]]
+
+    def snppos(self, index):
+        """
+        输出第index个MH的组成SNP POS（数组）
+        """
+        return self.array_snp_pos[self.array_snp_offset[index]:self.array_snp_offset[index + 1]]
+
+    def info(self, index):
+        """
+        输出第index个MH的INFO信息，格式同dict_chr_info中的value：[id, snp_num, pos1, pos2, ...]
+        """
+        return [self.ls_id[index], int(self.array_snp_num[index])] + self.snppos(index).tolist()
+
+    def info_id(self, id, chrname=None):
+        """
+        按ID输出MH的INFO信息（格式同info）；ID不存在，或chrname不为None且MH不在该染色体上时输出None
+        """
+        index = self.dict_id_index.get(id)
+        if index is None or (chrname is not None and self.chrname(index) != chrname):
+            return None
+        return self.info(index)
+
+    def chr_sorted(self, chrname):
+        """
+        输出该染色体上按起始POS排序的(MH序号数组, 起始POS数组, 终止POS数组)；该染色体不在panel中时输出None
+        """
+        array_order = self.dict_chr_order.get(chrname)
+        if array_order is None:
+            return None
+        return array_order, self.array_start[array_order], self.array_end[array_order]
+
+
 class PrePrimer:
     """
     用于对引物文件进行预处理：输出MH ID、引物序列信息
@@ -225,6 +444,606 @@ class PrePrimer:
         return dict_mh_primer
 
 
+class PreCache:
+    """
+    用于缓存预处理结果（dict_chr_info、ls_id、dict_chr_refalt、dict_mh_primer），避免每次运行都重新读取INFO、vcf和primer文件
+    缓存文件为二进制格式：先储存各输入文件的签名（大小、修改时间、内容哈希），再储存预处理结果；
+    输入文件的大小或内容发生变化时缓存自动失效并重新生成（仅修改时间变化时会重新计算哈希，内容未变则继续使用缓存）
+    //2026.10.18 新增
+    //pre_cache = PreCache("C:/Users/Hao_Yu/Desktop/use/reference.cache")
+    //dict_chr_info, ls_id, dict_chr_refalt, dict_mh_primer = pre_cache.cache_load(info_filepath, vcf_filepath, primer_filepath)
+    """
+
+    version = 1  # 缓存格式版本，格式变化时递增以使旧缓存失效
+
+    def __init__(self, cache_filepath):
+        """
+        cache_filepath: 缓存文件的绝对路径
+        """
+        self.cache_filepath = cache_filepath
+
+    def _cache_file_hash(self, path):
+        """
+        计算单个文件内容的哈希值
+        """
+        file_hash = hashlib.sha1()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def _cache_source(self, info_filepath, vcf_filepath, primer_filepath):
+        """
+        列出生成缓存所依赖的所有输入文件（vcf文件夹中包括索引文件在内的所有文件）
+        """
+        ls_source = [info_filepath, primer_filepath]
+        ls_source.extend(vcf_filepath + filename
+                         for filename in sorted(Toolsbox.FileTools.ls_directory(vcf_filepath)))
+        return [os.path.abspath(path) for path in ls_source]
+
+    def _cache_signature(self, ls_source, dict_signature_old=None):
+        """
+        生成输入文件的签名：{path: (size, mtime, hash)}
+        若旧签名中该文件的大小和修改时间均未变化，则直接沿用旧的哈希值，不再重新读取文件
+        """
+        dict_signature_old = dict_signature_old or {}
+        dict_signature = {}
+        for path in ls_source:
+            stat = os.stat(path)
+            signature_old = dict_signature_old.get(path)
+            if signature_old is not None and signature_old[:2] == (stat.st_size, stat.st_mtime_ns):
+                dict_signature[path] = signature_old
+            else:
+                dict_signature[path] = (stat.st_size, stat.st_mtime_ns, self._cache_file_hash(path))
+        return dict_signature
+
+    def _cache_read_signature(self):
+        """
+        读取缓存文件中储存的签名，缓存不存在或无法读取时返回None
+        """
+        try:
+            with open(self.cache_filepath, "rb") as file:
+                version, panel, dict_signature = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        if version != self.version:
+            return None
+        return panel, dict_signature
+
+    def _cache_check(self, ls_source, panel, cache_signature):
+        """
+        判断缓存是否可用：运行模式一致，输入文件列表一致，且各文件的大小和内容（哈希）均未变化
+        可用时输出当前的签名（仅修改时间变化、内容未变的文件更新为新的修改时间），不可用时输出None
+        """
+        if cache_signature is None:
+            return None
+        cache_panel, dict_signature_old = cache_signature
+        if cache_panel != panel or list(dict_signature_old.keys()) != ls_source:
+            return None
+        dict_signature = {}
+        for path, (size, mtime, file_hash) in dict_signature_old.items():
+            stat = os.stat(path)
+            if stat.st_size != size:
+                return None
+            if stat.st_mtime_ns != mtime and self._cache_file_hash(path) != file_hash:
+                return None
+            dict_signature[path] = (size, stat.st_mtime_ns, file_hash)
+        return dict_signature
+
+    def _cache_save(self, panel, dict_signature, reference):
+        """
+        储存缓存文件：先写入临时文件再替换，避免中断时留下不完整的缓存
+        """
+        tmp_filepath = self.cache_filepath + ".tmp"
+        with open(tmp_filepath, "wb") as file:
+            pickle.dump((self.version, panel, dict_signature), file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(reference, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, self.cache_filepath)
+
+    def cache_load(self, info_filepath, vcf_filepath, primer_filepath, panel=True, jobs=1):
+        """
+        主函数
+        缓存可用时直接读取缓存，否则依次调用PreInfo、PreVcf、PrePrimer进行预处理并更新缓存
+        输出：dict_chr_info, ls_id, dict_chr_refalt, dict_mh_primer（格式同PreInfo、PreVcf、PrePrimer）
+        panel: 是否仅保留INFO中MH所包含SNP的REF/ALT（见PreVcf）
+        jobs: 读取vcf文件的进程数（见PreVcf.vcf_filter）
+        //2026.10.18 缓存可用但有文件仅修改时间变化时，以新的修改时间更新缓存中的签名
+        """
+        ls_source = self._cache_source(info_filepath, vcf_filepath, primer_filepath)
+        cache_signature = self._cache_read_signature()
+
+        dict_signature = self._cache_check(ls_source, panel, cache_signature)
+        if dict_signature is not None:
+            with open(self.cache_filepath, "rb") as file:
+                pickle.load(file)  # 跳过签名部分
+                reference = pickle.load(file)
+            if dict_signature != cache_signature[1]:  # 重新计算过哈希（仅修改时间变化），更新签名，下次运行不再重复计算
+                self._cache_save(panel, dict_signature, reference)
+            print("参考缓存已载入")
+            return reference
+
+        """签名在预处理之前生成，预处理期间输入文件发生变化时下次运行将重新生成缓存"""
+        dict_signature = self._cache_signature(ls_source, cache_signature[1] if cache_signature else None)
+
+        dict_chr_info, ls_id = PreInfo(info_filepath).info_filter()
+        dict_chr_refalt = PreVcf(vcf_filepath, dict_chr_info if panel else None).vcf_filter(jobs=jobs)
+        dict_mh_primer = PrePrimer(primer_filepath, ls_id).primer_load()
+        reference = (dict_chr_info, ls_id, dict_chr_refalt, dict_mh_primer)
+
+        self._cache_save(panel, dict_signature, reference)
+        print("参考缓存已更新")
+        return reference
+
+
+class MHIndex:
+    """
+    基于dict_chr_info构建的MH区间索引：每条染色体上的MH按起始POS排序，用于以对数时间判断序列是否与某一MH重叠
+    //2026.10.18 新增：MH的起止POS由INFO中的SNP列表得到（第一个SNP至最后一个SNP），不再使用固定的200bp跨度
+    //pre_index = MHIndex(dict_chr_info)
+    //pre_index.overlap("1", 247032100, 247032249)
+    //>>> True
+    """
+
+    def __init__(self, dict_chr_info):
+        """
+        dict_chr_info: 由PreInfo得到的结果（嵌套字典，详细格式见PreProcessing_PreInfo），或由其构建的Panel
+        //2026.10.18 改为由Panel的数组构建
+        """
+        panel = dict_chr_info if isinstance(dict_chr_info, Panel) else Panel(dict_chr_info)
+
+        self.dict_chr_start = {}  # 各染色体上按起始POS排序的MH起始POS（列表，用于单条检索）
+        self.dict_chr_array_start = {}  # 同上（数组，用于批量检索）
+        self.dict_chr_array_end = {}  # 与起始POS一一对应的MH终止POS（数组）
+        self.dict_chr_array_maxend = {}  # 终止POS的前缀最大值（数组），用于判断前k个MH中是否有MH覆盖到指定POS
+        self.dict_chr_key = {}  # 各染色体上按大小排序的dict_chr_info的key（即MH第一个SNP的POS，用于MH匹配）
+        self.dict_chr_key_rank = {}  # 与key一一对应的、该key在dict_chr_info中的原始顺序（用于距离相同时的取舍）
+        self.dict_chr_array_key = {}  # 同dict_chr_key（数组，用于批量匹配）
+        self.dict_chr_array_key_rank = {}  # 同dict_chr_key_rank（数组，用于批量匹配）
+
+        for chrname, (beg, end) in panel.dict_chr_range.items():
+            array_key = panel.array_key[beg:end]
+            array_key_rank = np.argsort(array_key, kind="stable")
+            self.dict_chr_array_key[chrname] = array_key[array_key_rank]
+            self.dict_chr_array_key_rank[chrname] = array_key_rank
+            self.dict_chr_key[chrname] = self.dict_chr_array_key[chrname].tolist()
+            self.dict_chr_key_rank[chrname] = array_key_rank.tolist()
+
+            _, array_start, array_end = panel.chr_sorted(chrname)  # 按MH起始POS排序
+
+            self.dict_chr_start[chrname] = array_start.tolist()
+            self.dict_chr_array_start[chrname] = array_start
+            self.dict_chr_array_end[chrname] = array_end
+            self.dict_chr_array_maxend[chrname] = np.maximum.accumulate(array_end) if len(array_end) else array_end
+
+    def overlap(self, chrname, startpos, endpos):
+        """
+        判断单条序列（[startpos, endpos]，闭区间）是否与该染色体上的某一MH存在重叠
+        起始POS不大于序列终止POS的MH中，只要有一个MH的终止POS不小于序列起始POS，则存在重叠
+        """
+        ls_start = self.dict_chr_start.get(chrname)
+        if not ls_start:  # 该染色体上无MH
+            return False
+
+        index = bisect.bisect_right(ls_start, endpos)  # 起始POS <= 序列终止POS的MH数目
+        return index > 0 and self.dict_chr_array_maxend[chrname][index - 1] >= startpos
+
+    def overlap_batch(self, chrname, array_startpos, array_endpos):
+        """
+        对同一染色体上的一批序列同时进行重叠判断（向量化检索），输出与输入等长的布尔数组
+        """
+        array_startpos = np.asarray(array_startpos, dtype=np.int64)
+        array_endpos = np.asarray(array_endpos, dtype=np.int64)
+
+        array_start = self.dict_chr_array_start.get(chrname)
+        if array_start is None or len(array_start) == 0:  # 该染色体上无MH
+            return np.zeros(len(array_startpos), dtype=bool)
+
+        array_index = np.searchsorted(array_start, array_endpos, side="right")
+        array_maxend = self.dict_chr_array_maxend[chrname][np.maximum(array_index - 1, 0)]
+        return (array_index > 0) & (array_maxend >= array_startpos)
+
+    def nearest(self, chrname, startpos):
+        """
+        输出与序列起始POS距离最近的MH的key（二分查找；距离相同时取在dict_chr_info中靠前的MH，与np.argmin一致）
+        该染色体上无MH时输出None
+        //2026.10.18 新增
+        """
+        ls_key = self.dict_chr_key.get(chrname)
+        if not ls_key:
+            return None
+
+        index = bisect.bisect_left(ls_key, startpos)  # 第一个不小于序列起始POS的key
+        return self._nearest_at(chrname, startpos, index)
+
+    def _nearest_at(self, chrname, startpos, index):
+        """
+        已知第一个不小于序列起始POS的key的序号index时，在其与前一个key中取距离较近者（距离相同时取在dict_chr_info中靠前的MH）
+        供nearest与MHSweep.nearest共用，保证两者的取舍规则一致
+        //2026.10.18 由nearest中拆分而来
+        """
+        ls_key = self.dict_chr_key[chrname]
+        if index == 0:
+            return ls_key[0]
+        if index == len(ls_key):
+            return ls_key[-1]
+
+        dif_b = startpos - ls_key[index - 1]
+        dif_f = ls_key[index] - startpos
+        if dif_b < dif_f:
+            return ls_key[index - 1]
+        elif dif_b > dif_f:
+            return ls_key[index]
+        else:  # 距离相同时按在dict_chr_info中的顺序取舍
+            ls_key_rank = self.dict_chr_key_rank[chrname]
+            return ls_key[index - 1] if ls_key_rank[index - 1] < ls_key_rank[index] else ls_key[index]
+
+    def nearest_batch(self, chrname, array_startpos):
+        """
+        对同一染色体上的一批序列同时进行MH匹配（向量化），输出与输入等长的key数组，规则同nearest
+        该染色体上无MH时输出None
+        //2026.10.18 新增
+        """
+        array_key = self.dict_chr_array_key.get(chrname)
+        if array_key is None or len(array_key) == 0:
+            return None
+        array_startpos = np.asarray(array_startpos, dtype=np.int64)
+        array_rank = self.dict_chr_array_key_rank[chrname]
+
+        array_index = np.searchsorted(array_key, array_startpos, side="left")
+        array_b = np.maximum(array_index - 1, 0)  # 前一个key
+        array_f = np.minimum(array_index, len(array_key) - 1)  # 后一个key
+        array_dif_b = array_startpos - array_key[array_b]
+        array_dif_f = array_key[array_f] - array_startpos
+
+        array_choose_b = (array_dif_b < array_dif_f) | \
+                         ((array_dif_b == array_dif_f) & (array_rank[array_b] < array_rank[array_f]))
+        array_choose_b = (array_index == len(array_key)) | ((array_index > 0) & array_choose_b)
+        return array_key[np.where(array_choose_b, array_b, array_f)]
+
+
+class MHSweep:
+    """
+    针对按染色体、POS排序（coordinate-sorted）的测序结果，与MH区间进行线性归并（扫描线）
+    序列与MH均只需向前扫描一次，已被扫过的MH不再保留
+    //2026.10.18 新增：与MHIndex的检索结果一致；若发现输入并非有序（同一染色体POS回退，或已扫过的染色体再次出现），
+                 strict为True时报错，否则对之后的所有序列返回None，由调用方改用MHIndex/原有方式检索
+    """
+
+    def __init__(self, mh_index, strict=False):
+        """
+        mh_index: 由dict_chr_info构建的MHIndex
+        strict: 是否要求输入必须有序
+        """
+        self.mh_index = mh_index
+        self.strict = strict
+        self.is_sorted = True  # 目前为止输入是否有序
+
+        self.ls_state_overlap = [None, 0, 0, 0, []]  # 重叠判断的扫描状态：染色体、上一条序列起始POS、MH指针、MH数目、未扫过的MH
+        self.set_chr_done_overlap = set()  # 重叠判断中已扫描完成的染色体
+        self.ls_state_nearest = [None, 0, 0]  # MH匹配的扫描状态：染色体、上一条序列起始POS、key指针
+        self.set_chr_done_nearest = set()  # MH匹配中已扫描完成的染色体
+
+    def _check_order(self, ls_state, set_chr_done, chrname, startpos):
+        """
+        判断当前序列是否仍满足有序；切换染色体时重置扫描状态，输出是否为新染色体
+        """
+        if chrname == ls_state[0]:
+            if startpos < ls_state[1]:
+                self._unsorted("{}:{}".format(chrname, startpos))
+            return False
+
+        if chrname in set_chr_done:
+            self._unsorted(chrname)
+        if ls_state[0] is not None:
+            set_chr_done.add(ls_state[0])
+        return True
+
+    def _unsorted(self, where):
+        """
+        输入无序时的处理
+        """
+        if self.strict:
+            raise ValueError('input is not sorted by chromosome and position (at {})'.format(where))
+        self.is_sorted = False
+
+    def overlap(self, chrname, startpos, endpos):
+        """
+        判断单条序列（[startpos, endpos]）是否与该染色体上的某一MH存在重叠，输出True/False；输入无序时输出None
+        """
+        ls_state = self.ls_state_overlap
+        if self._check_order(ls_state, self.set_chr_done_overlap, chrname, startpos):
+            ls_start = self.mh_index.dict_chr_start.get(chrname, [])
+            ls_state[:] = [chrname, startpos, 0, len(ls_start), []]
+        if not self.is_sorted:
+            return None
+        ls_state[1] = startpos
+
+        """将起始POS不大于序列终止POS的MH纳入扫描，并去除终止POS已在序列起始POS之前的MH（之后的序列也不可能再覆盖）"""
+        ls_active = ls_state[4]
+        if ls_state[2] < ls_state[3]:
+            ls_start = self.mh_index.dict_chr_start[chrname]
+            array_end = self.mh_index.dict_chr_array_end[chrname]
+            while ls_state[2] < ls_state[3] and ls_start[ls_state[2]] <= endpos:
+                ls_active.append((ls_start[ls_state[2]], int(array_end[ls_state[2]])))
+                ls_state[2] += 1
+
+        if ls_active and min(end for start, end in ls_active) < startpos:
+            ls_active[:] = [(start, end) for start, end in ls_active if end >= startpos]
+
+        for start, end in ls_active:
+            if start <= endpos:
+                return True
+        return False
+
+    def nearest(self, chrname, startpos):
+        """
+        输出与序列起始POS距离最近的MH的key（距离相同时取在dict_chr_info中靠前的MH，与np.argmin一致）；输入无序时输出None
+        """
+        ls_state = self.ls_state_nearest
+        if self._check_order(ls_state, self.set_chr_done_nearest, chrname, startpos):
+            ls_state[:] = [chrname, startpos, 0]
+        if not self.is_sorted:
+            return None
+        ls_state[1] = startpos
+
+        ls_key = self.mh_index.dict_chr_key.get(chrname)
+        if not ls_key:
+            return None
+
+        while ls_state[2] < len(ls_key) and ls_key[ls_state[2]] < startpos:  # 指针指向第一个不小于序列起始POS的key
+            ls_state[2] += 1
+
+        return self.mh_index._nearest_at(chrname, startpos, ls_state[2])
+
+
+class PrimerIndex:
+    """
+    基于dict_mh_primer构建的引物种子索引：以每条引物两段检测序列（0引物为正向，1引物为反向互补，取法同
+    Match.MHMatch._single_match_extract_umi_primer_check）的前k个碱基（0引物）或后k个碱基（1引物）为种子，
+    在序列起始（0引物）或末尾（1引物）处逐个滑窗查找种子，并核对整个滑窗与检测序列完全一致
+    完全一致的滑窗在容错检测中不匹配碱基数为0，必然匹配成功，因此种子命中的引物无需再进行容错检测
+    //2026.10.18 新增
+    //primer_index = PrimerIndex(dict_mh_primer)
+    //primer_index.search(sequence_m)
+    //>>> [(MHID, "0", primer)]
+    """
+
+    def __init__(self, dict_mh_primer, k=12):
+        """
+        dict_mh_primer: 由PrePrimer得到的结果
+        k: 种子长度，检测长度（引物长度-3）小于k的引物不纳入索引
+        """
+        self.k = k
+        self.dict_seed_0 = {}  # 0引物：检测序列前k个碱基 -> [(MHID, 引物种类, 引物序列, 检测序列), ...]
+        self.dict_seed_1 = {}  # 1引物：检测序列后k个碱基 -> [(MHID, 引物种类, 引物序列, 检测序列), ...]
+        self.max_len_primer = 0  # 最长的检测长度
+
+        for mh_id, ls_primer in dict_mh_primer.items():
+            for primer in ls_primer:
+                len_primer = len(primer[1]) - 3
+                if len_primer < k or primer[0] not in ("0", "1"):
+                    continue
+                self.max_len_primer = max(self.max_len_primer, len_primer)
+
+                if primer[0] == "0":
+                    primer_seq = primer[1]
+                else:
+                    primer_seq = Toolsbox.FormatTools.convert_base(primer[1][::-1])
+
+                for primer_check in dict.fromkeys([primer_seq[:len_primer], primer_seq[-len_primer:]]):
+                    if primer[0] == "0":
+                        self.dict_seed_0.setdefault(primer_check[:k], []).append((mh_id, "0", primer[1], primer_check))
+                    else:
+                        self.dict_seed_1.setdefault(primer_check[-k:], []).append((mh_id, "1", primer[1], primer_check))
+
+    def search(self, sequence_seq_m):
+        """
+        在序列两端查找与某条引物检测序列完全一致的滑窗（0引物滑窗起始于序列第i个碱基，1引物滑窗终止于序列倒数第i个碱基，
+        i小于该引物的检测长度），输出[(MHID, 引物种类, 引物序列), ...]
+        依次检测序列起始和末尾，在首个存在命中的滑窗处结束查找；无命中时输出空列表
+        sequence_seq_m: 测序序列（仅保留M+填充缺失），可为字符串或CigarWalker
+        """
+        if not self.max_len_primer:
+            return []
+        k = self.k
+        len_check = 2 * self.max_len_primer - 1
+        len_sequence = len(sequence_seq_m)
+
+        sequence_head = str(sequence_seq_m[:len_check])
+        for i in range(min(self.max_len_primer, len_sequence - k + 1)):
+            ls_candidate = self.dict_seed_0.get(sequence_head[i:i + k])
+            if ls_candidate:
+                ls_hit = [candidate[:3] for candidate in ls_candidate
+                          if i < len(candidate[3]) and sequence_head[i:i + len(candidate[3])] == candidate[3]]
+                if ls_hit:
+                    return ls_hit
+
+        sequence_tail = str(sequence_seq_m[-len_check:]) if len_sequence else ""
+        len_tail = len(sequence_tail)
+        for i in range(min(self.max_len_primer, len_sequence - k + 1)):
+            ls_candidate = self.dict_seed_1.get(sequence_tail[len_tail - i - k:len_tail - i])
+            if ls_candidate:
+                ls_hit = [candidate[:3] for candidate in ls_candidate
+                          if i < len(candidate[3]) <= len_tail - i and
+                          sequence_tail[len_tail - i - len(candidate[3]):len_tail - i] == candidate[3]]
+                if ls_hit:
+                    return ls_hit
+        return []
+
+
+class CigarWalker:
+    """
+    依据序列信息（eg. 22S17M1I112M43S）对原始序列进行一次性解析，得到sequence_m（去除S、去I补D后的序列）中每一段与原始序列
+    之间的对应关系（偏移表），可依据sequence_m中的位置（即参考POS-序列起始POS）直接查找碱基，而无需反复切片拼接出sequence_m
+    可像字符串一样使用len()、索引（含负索引）、切片和str()
+    //2026.10.18 新增：S/H的截取规则、I的去除与D的填充与PreSam._sam_del_redundancy_sequence原有规则完全一致
+    //walker = CigarWalker("2S5M1D3M", "TTACGTAGGC")
+    //str(walker), len(walker), walker[5]
+    //>>> 'ACGTADGGC', 9, 'D'
+    """
+
+    __slots__ = ("sequence", "ls_block_start", "ls_block_src", "ls_block_len", "len_sequence_m")
+
+    def __init__(self, sequence_info, sequence):
+        """
+        sequence_info: 序列信息（CIGAR）
+        sequence: 原始测序序列
+        """
+        self.sequence = sequence
+
+        find = re.findall(r'[0-9]+|[A-Z]+', sequence_info)  # 匹配序列信息中的数字和字母
+        num = [int(i) for i in find[::2]]  # 提取序列信息中的数字
+        type_str = find[1::2]  # 提取序列信息中的字母
+
+        ls_piece = [[0, len(sequence)]]  # 当前序列由原始序列片段组成：[片段在原始序列中的起始, 片段长度]，起始为-1时为D填充
+        if type_str[0] == "S" or type_str[-1] == "S":  # 如果序列以S开头或结尾（序列中有S）
+            self._walk(ls_piece, num, type_str, 0)
+
+            if type_str[0] == "S" and type_str[-1] == "S":  # 去头去尾
+                ls_piece = self._slice(ls_piece, num[0], -num[-1])
+            elif type_str[0] == "S" and type_str[-1] != "S":  # 去头留尾
+                ls_piece = self._slice(ls_piece, num[0], None)
+            elif type_str[0] != "S" and type_str[-1] == "S":  # 留头去尾
+                ls_piece = self._slice(ls_piece, 0, -num[-1])
+
+        elif type_str[0] == "H" or type_str[-1] == "H":  # 如果序列以H开头或结尾，只需去I补D（以H开头时，检索位置不计入H）
+            self._walk(ls_piece, num, type_str, 1 if type_str[0] == "H" else 0)
+
+        else:  # 序列不以S或H开头、结尾，不输出sequence_m
+            ls_piece = []
+
+        """将片段转化为偏移表：各片段在sequence_m中的起始位置、在原始序列中的起始位置（-1为D填充）、长度"""
+        self.ls_block_start = []
+        self.ls_block_src = []
+        self.ls_block_len = []
+        len_sequence_m = 0
+        for src, length in ls_piece:
+            self.ls_block_start.append(len_sequence_m)
+            self.ls_block_src.append(src)
+            self.ls_block_len.append(length)
+            len_sequence_m += length
+        self.len_sequence_m = len_sequence_m
+
+    @staticmethod
+    def _cut(ls_piece, pos):
+        """
+        在当前序列的pos处（超出序列长度时取序列末尾）切分片段，输出切分点之后第一个片段的序号
+        """
+        off = 0
+        for i, (src, length) in enumerate(ls_piece):
+            if off >= pos:
+                return i
+            if off + length > pos:
+                k = pos - off
+                ls_piece[i:i + 1] = [[src, k], [src + k if src >= 0 else -1, length - k]]
+                return i + 1
+            off += length
+        return len(ls_piece)
+
+    @classmethod
+    def _walk(cls, ls_piece, num, type_str, first):
+        """
+        依次处理序列信息中的I和D：I对应的碱基从序列中去除，D对应的位置以"D"填充
+        检索位置为first起至当前项之前的所有项长度之和（I去除后长度计为0）
+        """
+        off = 0
+        for i in range(first, len(num)):
+
+            if type_str[i] == "I":  # 如果类型是插入
+                index_start = cls._cut(ls_piece, off)
+                index_end = cls._cut(ls_piece, off + num[i])
+                del ls_piece[index_start:index_end]
+            elif type_str[i] == "D":  # 如果类型是缺失
+                if num[i] > 0:
+                    ls_piece.insert(cls._cut(ls_piece, off), [-1, num[i]])
+                off += num[i]
+            else:
+                off += num[i]
+
+    @classmethod
+    def _slice(cls, ls_piece, start, stop):
+        """
+        以与字符串切片相同的规则截取当前序列
+        """
+        start, stop, _ = slice(start, stop).indices(sum(length for src, length in ls_piece))
+        if stop <= start:
+            return []
+        index_start = cls._cut(ls_piece, start)
+        index_end = cls._cut(ls_piece, stop)
+        return ls_piece[index_start:index_end]
+
+    def __len__(self):
+        return self.len_sequence_m
+
+    def __str__(self):
+        return self._substring(0, self.len_sequence_m)
+
+    def __repr__(self):
+        return "CigarWalker({!r})".format(str(self))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.len_sequence_m)
+            if step != 1:
+                return str(self)[index]
+            return self._substring(start, stop)
+
+        if index < 0:
+            index += self.len_sequence_m
+        if not 0 <= index < self.len_sequence_m:
+            raise IndexError("sequence_m index out of range")
+
+        i = bisect.bisect_right(self.ls_block_start, index) - 1
+        src = self.ls_block_src[i]
+        if src < 0:
+            return "D"
+        return self.sequence[src + index - self.ls_block_start[i]]
+
+    def base_at(self, ls_index, default="N"):
+        """
+        依次输出sequence_m中各位置的碱基（字符串），位置超出序列范围（含负数）时为default
+        //2026.10.18 新增（用于批量提取等位基因）
+        """
+        ls_base = []
+        for index in ls_index:
+            if 0 <= index < self.len_sequence_m:
+                i = bisect.bisect_right(self.ls_block_start, index) - 1
+                src = self.ls_block_src[i]
+                ls_base.append("D" if src < 0 else self.sequence[src + index - self.ls_block_start[i]])
+            else:
+                ls_base.append(default)
+        return "".join(ls_base)
+
+    def key(self):
+        """
+        可哈希的键（原始序列及偏移表），键相同时sequence_m必然相同，用于读段缓存而无需生成完整的sequence_m
+        //2026.10.18 新增
+        """
+        return self.sequence, tuple(self.ls_block_src), tuple(self.ls_block_len)
+
+    def _substring(self, start, stop):
+        """
+        输出sequence_m[start:stop]（start、stop均为非负且不超过序列长度）
+        """
+        if stop <= start:
+            return ""
+
+        ls_str = []
+        i = bisect.bisect_right(self.ls_block_start, start) - 1
+        while i < len(self.ls_block_start) and self.ls_block_start[i] < stop:
+            block_start = self.ls_block_start[i]
+            src = self.ls_block_src[i]
+            k_start = max(start, block_start) - block_start
+            k_stop = min(stop, block_start + self.ls_block_len[i]) - block_start
+
+            if src < 0:
+                ls_str.append("D" * (k_stop - k_start))
+            else:
+                ls_str.append(self.sequence[src + k_start:src + k_stop])
+            i += 1
+        return "".join(ls_str)
+
+
 class PreSam:
     """
     用于对sam文件进行预处理：保留染色体、起始POS、原始序列信息
@@ -235,10 +1054,12 @@ class PreSam:
     def __init__(self, sam_filepath, dict_chr_info):
         """
         sam_filepath: 储存sam文件的文件夹路径（对测序得到的多个样本文件均进行处理）
-        dict_chr_info: 由PreInfo得到的结果（嵌套字典）
+        dict_chr_info: 由PreInfo得到的结果（嵌套字典），或由其构建的Panel
+        //2026.10.18 dict_chr_info可为Panel
         """
         self.sam_filepath = sam_filepath
         self.dict_chr_info = dict_chr_info
+        self.mh_index = MHIndex(dict_chr_info)  # MH区间索引（用于判断序列是否覆盖MH）
 
     def _sam_del_redundancy_chr(self, chrname):
         """
@@ -259,133 +1080,224 @@ class PreSam:
         //2022.03.14 复核：I与D的添加、删除问题。在原始序列中，包含标记为I的碱基，不包含标记为D的碱基。若要想测序序列碱基的pos与
                      参考序列的pos一致（此处pos指的是M部分的pos），则需要去除序列中I对应的部分，补全D对应的部分
         //2022.03.18 新增S在前或在后均进行输出的判断；新增纳入序列信息中包含H的序列提取
+        //2026.10.18 改由CigarWalker对序列信息进行一次性解析后输出，规则不变，不再对每个I/D重复切片拼接序列
         """
-        find = re.findall(r'[0-9]+|[A-Z]+', sequence_info)  # 匹配序列信息中的数字和字母
+        sequence_m = str(CigarWalker(sequence_info, sequence))
+        return sequence_m if sequence_m else None
 
-        num = [int(i) for i in find[::2]]  # 提取序列信息中的数字，储存在列表中（eg. [22, 17, 1, 112, 43]）
-        type_str = find[1::2]  # 提取序列信息中的字母，储存在列表中（eg. [S, M, I, M, S]）
-        len_num = len(num)
+    def _sam_filter_single(self, sequence_single):
+        """
+        依据单条测序结果的起始POS和dict_chr_info中的信息，去除冗余的测序结果
+        sequence_single: 去除冗余信息后的单条sequence结果，包括[chrname, startpos, len_sequence_m, sequence_m, sequence]
+        //2021.09.11  panel中最大MH的长度可依据所使用panel的不同而进行更改
+        //2022.03.14  复核：预过滤sam文件中判断序列是否覆盖MH无问题。同时简化了输入参数。此外注意序列的startpos对应sequence_m
+        //2026.10.18  改为使用MHIndex进行检索：序列[startpos, startpos+len-1]与MH[首个SNP, 最后一个SNP]存在重叠即保留，
+                      不再逐一遍历该染色体上所有MH的起始POS，也不再使用固定的200bp MH长度
+        """
+        sequence_endpos = sequence_single[1] + sequence_single[2] - 1  # 序列末尾POS
 
-        if type_str[0] == "S" or type_str[-1] == "S":  # 如果序列以S开头或结尾（序列中有S）
+        if self.mh_index.overlap(sequence_single[0], sequence_single[1], sequence_endpos):  # 如果序列与某一MH有重叠
+            return sequence_single
 
-            for i in range(len_num):
+    def _sam_filter_batch(self, ls_sequence_single):
+        """
+        对一批去冗余后的测序结果同时进行判断（按染色体分组后向量化检索），按原顺序输出与MH有重叠的测序结果
+        ls_sequence_single: 去除冗余信息后的测序结果列表，每一项格式同_sam_filter_single
+        //2026.10.18 新增
+        """
+        dict_chr_index = {}  # 按染色体对测序结果的序号进行分组
+        for index, sequence_single in enumerate(ls_sequence_single):
+            dict_chr_index.setdefault(sequence_single[0], []).append(index)
 
-                if type_str[i] == "I":  # 如果类型是插入
-                    sequence = sequence[:sum(num[:i])] + sequence[sum(num[:i + 1]):]
-                    num[i] = 0
-                elif type_str[i] == "D":  # 如果类型是缺失
-                    sequence = sequence[:sum(num[:i])] + num[i] * "D" + sequence[sum(num[:i]):]
+        array_retain = np.zeros(len(ls_sequence_single), dtype=bool)
+        for chrname, ls_index in dict_chr_index.items():
+            array_startpos = np.array([ls_sequence_single[i][1] for i in ls_index], dtype=np.int64)
+            array_len = np.array([ls_sequence_single[i][2] for i in ls_index], dtype=np.int64)
+            array_retain[ls_index] = self.mh_index.overlap_batch(chrname, array_startpos, array_startpos + array_len - 1)
 
-            if type_str[0] == "S" and type_str[-1] == "S":  # 去头去尾
-                return sequence[num[0]:-num[-1]]
-            elif type_str[0] == "S" and type_str[-1] != "S":  # 去头留尾
-                return sequence[num[0]:]
-            elif type_str[0] != "S" and type_str[-1] == "S":  # 留头去尾
-                return sequence[0:-num[-1]]
+        return [sequence_single for sequence_single, retain in zip(ls_sequence_single, array_retain) if retain]
 
-        elif type_str[0] == "H" or type_str[-1] == "H":  # 如果序列与以H开头或结尾，则序列本身就是要输出的序列，只需去I补D即可
+    def _sam_del_redundancy(self, sequence_single):
+        """
+        对单条sam记录去冗余，输出[chrname, startpos, len_sequence_m, sequence_m, sequence]；无法转化时输出None
+        其中sequence_m为CigarWalker（可按位置直接查找碱基，仅在需要时才通过str()生成完整序列）
+        //2026.10.18 由_sam_filter中拆分而来
+        """
+        chrname = self._sam_del_redundancy_chr(sequence_single[2])  # 提取染色体信息
 
-            if type_str[0] != "H":  # 如果头部无H，检索位置无需改动
+        if chrname:
+            startpos = int(sequence_single[3])  # 提取序列起始POS信息
+            sequence_info = sequence_single[5]  # 提取序列的INFO信息（eg. 22S17M1I112M43S）
+            sequence = sequence_single[9]  # 提取序列信息
 
-                for i in range(len_num):
+            sequence_m = CigarWalker(sequence_info, sequence)  # 将序列信息转化(仅保留M部分)
+            if sequence_m:  # 如果序列能依据序列信息提取出sequence_m则继续操作
+                return [chrname, startpos, len(sequence_m), sequence_m, sequence]  # 去冗余信息后的单条测序结果
 
-                    if type_str[i] == "I":  # 如果类型是插入
-                        sequence = sequence[:sum(num[:i])] + sequence[sum(num[:i + 1]):]
-                        num[i] = 0
-                    elif type_str[i] == "D":  # 如果类型是缺失
-                        sequence = sequence[:sum(num[:i])] + num[i] * "D" + sequence[sum(num[:i]):]
-                return sequence
+    def _sam_filter(self, sam_file, batch_size=10000, sorted_input=None):
+        """
+        依据每条测序结果的起始POS和dict_chr_info中的信息，去除冗余的测序结果
+        sam_file: 导入的sam文件
+        batch_size: 每批次进行向量化判断的测序结果数目
+        sorted_input: 输入是否按染色体、POS排序。True：使用扫描线（MHSweep）与MH进行线性归并，输入无序时报错；
+                      False：按批次检索；None：依据sam头文件（@HD SO:coordinate）自动判断，若实际无序则自动改为按批次检索
+        //2026.10.18 去冗余后的测序结果按批次交由_sam_filter_batch判断
+        //2026.10.18 新增对有序输入的扫描线模式
+        """
+        return list(self._sam_filter_iter(sam_file, batch_size, sorted_input))
 
-            elif type_str[0] == "H":
+    def _sam_filter_iter(self, sam_file, batch_size=10000, sorted_input=None):
+        """
+        _sam_filter的生成器形式：sam_file可为逐行读取的生成器，过滤后的结果逐条输出，内存占用仅与batch_size有关
+        //2026.10.18 新增
+        """
+        mh_sweep = MHSweep(self.mh_index, strict=True) if sorted_input else None
 
-                for i in range(1, len_num):
+        ls_batch = []
+        for sequence_single in sam_file:  # 对每一条测序结果进行操作
 
-                    if type_str[i] == "I":  # 如果类型是插入
-                        sequence = sequence[:sum(num[1:i])] + sequence[sum(num[1:i + 1]):]
-                        num[i] = 0
-                    elif type_str[i] == "D":  # 如果类型是缺失
-                        sequence = sequence[:sum(num[1:i])] + num[i] * "D" + sequence[sum(num[1:i]):]
-                return sequence
+            if sequence_single[0].startswith("@"):  # 头文件行：依据@HD行判断是否有序
+                if sequence_single[0] == "@HD" and sorted_input is None and "SO:coordinate" in sequence_single:
+                    mh_sweep = MHSweep(self.mh_index)
+                continue
 
-        else:  # 如果序列以除开头、结尾
-            return None
+            ls_sequence_single = self._sam_del_redundancy(sequence_single)
 
-    def _sam_filter_single(self, sequence_single):
-        """
-        依据单条测序结果的起始POS和dict_chr_info中的信息，去除冗余的测序结果
-        sequence_single: 去除冗余信息后的单条sequence结果，包括[chrname, startpos, len_sequence_m, sequence_m, sequence]
-        //2021.09.11  panel中最大MH的长度可依据所使用panel的不同而进行更改
-        //2022.03.14  复核：预过滤sam文件中判断序列是否覆盖MH无问题。同时简化了输入参数。此外注意序列的startpos对应sequence_m
-        """
-        ls_mh_startpos = self.dict_chr_info[sequence_single[0]].keys()  # 依据测序结果的染色体信息，提取该染色体上所有MH的起始POS
+            if ls_sequence_single:
 
-        for snppos in ls_mh_startpos:  # 对每一个MH的起始POS进行操作，直到有一个MH的起始POS能与该序列匹配才输出结果
+                if mh_sweep and mh_sweep.is_sorted:  # 扫描线模式
+                    sequence_endpos = ls_sequence_single[1] + ls_sequence_single[2] - 1
+                    overlap = mh_sweep.overlap(ls_sequence_single[0], ls_sequence_single[1], sequence_endpos)
 
-            if snppos - sequence_single[1] > 0:  # 如果测序序列在MH的“前面”
+                    if overlap:
+                        yield ls_sequence_single
+                    if overlap is not None:
+                        continue
 
-                if snppos - sequence_single[1] > sequence_single[2]:  # 如果测序序列起始与MH的距离超过测序序列长度，则测序序列未测到当前MH
-                    continue
-                elif snppos - sequence_single[1] <= sequence_single[2]:  # 如果测序序列起始与MH的距离小于测序序列长度，则测序序列测到了当前MH（至少测到第一个SNP）
-                    return sequence_single
+                ls_batch.append(ls_sequence_single)
 
-            elif snppos - sequence_single[1] <= 0:  # 如果测序序列在MH的“后面”（包含测序序列起始与MH起始重叠的情况）
+                if len(ls_batch) >= batch_size:
+                    yield from self._sam_filter_batch(ls_batch)
+                    ls_batch = []
 
-                if sequence_single[1] - snppos > 200:  # 如果测序序列起始与MH的距离超过panel中MH的最大长度，则测序序列未测到当前MH
-                    continue
-                elif sequence_single[1] - snppos <= 200:  # 如果测序序列起始与MH的距离小于panel中MH的最大长度，则测序序列测到了当前MH（至少测到最后一个SNP）
-                    return sequence_single
+        if ls_batch:
+            yield from self._sam_filter_batch(ls_batch)
 
-    def _sam_filter(self, sam_file):
+    def _bam_region(self, ls_ref_name):
         """
-        依据每条测序结果的起始POS和dict_chr_info中的信息，去除冗余的测序结果
-        sam_file: 导入的sam文件
+        依据MH区间生成BAM文件中需读取的区间：{参考序列名称: [(beg, end), ...]}（0起始、左闭右开）
+        //2026.10.18 新增
         """
-        ls_sam_filter = []
-        for sequence_single in sam_file:  # 对每一条测序结果进行操作
-            chrname = self._sam_del_redundancy_chr(sequence_single[2])  # 提取染色体信息
+        dict_ref_region = {}
+        for ref_name in ls_ref_name:
+            chrname = self._sam_del_redundancy_chr(ref_name)
 
-            if chrname:
-                startpos = int(sequence_single[3])  # 提取序列起始POS信息
-                sequence_info = sequence_single[5]  # 提取序列的INFO信息（eg. 22S17M1I112M43S）
-                sequence = sequence_single[9]  # 提取序列信息
+            if chrname in self.mh_index.dict_chr_array_start:
+                array_start = self.mh_index.dict_chr_array_start[chrname]
+                array_end = self.mh_index.dict_chr_array_end[chrname]
+                dict_ref_region[ref_name] = [(int(start) - 1, int(end)) for start, end in zip(array_start, array_end)]
+        return dict_ref_region
 
-                sequence_m = self._sam_del_redundancy_sequence(sequence_info, sequence)  # 将序列信息转化(仅保留M部分)
-                if sequence_m:  # 如果序列能依据序列信息提取出sequence_m则继续操作
-                    len_sequence_m = len(sequence_m)
-                    ls_sequence_single = [chrname, startpos, len_sequence_m, sequence_m, sequence]  # 去冗余信息后的单条测序结果
+    def _sam_open(self, filename):
+        """
+        逐行读取单个样本文件，输出(逐行读取的生成器, 过滤结果的文件名)
+        sam文件：直接逐行读取，过滤结果仍以原文件名命名
+        bam文件：直接解压读取，若存在.bai索引则仅读取与MH区间重叠的记录；过滤结果以".sam"替换".bam"命名
+        //2026.10.18 新增对bam文件的支持
+        """
+        if filename.endswith(".bam"):
+            bam_reader = BamTools.BamReader(self.sam_filepath + filename)
 
-                    sequence_filter = self._sam_filter_single(ls_sequence_single)  # 对单一测序结果进行判断
+            if bam_reader.index:  # 存在索引，仅读取MH区间
+                sam_file = bam_reader.fetch_regions(self._bam_region(bam_reader.ls_ref_name))
+            else:
+                sam_file = bam_reader.iter_records()
+            return sam_file, self._sam_save_filename(filename)
 
-                    if sequence_filter:  # 如果单一测序结果可与某一MH有重叠，则将其保留
-                        ls_sam_filter.append(sequence_filter)
-                    else:
-                        continue
-                else:
-                    continue
+        return Toolsbox.FileTools.iter_ls_file(self.sam_filepath + filename), filename
+
+    @staticmethod
+    def _sam_save_filename(filename):
+        """
+        样本文件过滤结果的文件名：sam文件仍以原文件名命名，bam文件以".sam"替换".bam"
+        //2026.10.18 新增
+        """
+        return filename[:-4] + ".sam" if filename.endswith(".bam") else filename
+
+    def _sam_filter_range(self, filename, beg, end, sorted_input=None, binary=False):
+        """
+        对sam文件中[beg, end)字节范围内的行进行去冗余、过滤，输出过滤结果（各行以"\n"连接的字符串；
+        binary为True时输出列表，其中sequence_m已转化为字符串）
+        //2026.10.18 新增（用于单个文件内的分块并行）
+        """
+        sam_file = Toolsbox.FileTools.iter_ls_file_range(self.sam_filepath + filename, beg, end)
+        sam_filter = self._sam_filter_iter(sam_file, sorted_input=sorted_input)
+        if binary:
+            return [line[:3] + [str(line[3]), line[4]] for line in sam_filter]
+        return "\n".join("\t".join(str(i) for i in line) for line in sam_filter)
+
+    def _sam_filter_file(self, filename, sam_filter_filepath, sorted_input=None, chunk_jobs=1, binary=False,
+                         chunk_size=1 << 26):
+        """
+        对单个样本文件进行去冗余、过滤，并将结果逐行写入sam_filter_filepath中（以原文件名命名，bam文件详见_sam_open）
+        chunk_jobs: 单个sam文件内分块并行处理的进程数，为1时不分块；文件按字节分为至少chunk_jobs块（每块不超过chunk_size
+                    字节），各块的过滤结果按原顺序写入，与不分块时完全一致（bam文件不分块）
+        binary: 是否以二进制列式格式储存（详见ReadStore），文件名在原文件名后追加".mhr"
+        //2026.10.18 由sam_filter中拆分而来
+        //2026.10.18 新增单个文件内的分块并行
+        //2026.10.18 新增二进制格式
+        """
+        if Toolsbox.ParallelTools.jobs_num(chunk_jobs) > 1 and not filename.endswith(".bam"):
+            ls_range = Toolsbox.FileTools.split_file(self.sam_filepath + filename,
+                                                     Toolsbox.ParallelTools.jobs_num(chunk_jobs), chunk_size)
+            ls_args = [(filename, beg, end, sorted_input, binary) for beg, end in ls_range]
+            ls_result = Toolsbox.ParallelTools.iter_method(self, "_sam_filter_range", ls_args, chunk_jobs)
+
+            if binary:
+                with ReadStore.ReadStoreWriter(sam_filter_filepath + filename + ".mhr") as writer:
+                    for sam_filter in ls_result:
+                        writer.write_rows(sam_filter)
             else:
-                continue
+                Toolsbox.FileTools.save_file_text_iter(ls_result, sam_filter_filepath + "{}".format(filename))
+            print("{}文件已过滤".format(filename))
+            return
 
-        return ls_sam_filter
+        sam_file, save_filename = self._sam_open(filename)  # 逐行读取sam文件
 
-    def sam_filter(self, sam_filter_filepath):
+        sam_filter = self._sam_filter_iter(sam_file, sorted_input=sorted_input)
+
+        """储存临时结果文件（逐行写入）"""
+        save_path = sam_filter_filepath + "{}".format(save_filename)  # 储存临时结果文件的路径（仍以原文件名命名）
+        if binary:
+            with ReadStore.ReadStoreWriter(save_path + ".mhr") as writer:
+                writer.write_rows(sam_filter)
+        else:
+            Toolsbox.FileTools.save_file_iter(([str(i) for i in line] for line in sam_filter), save_path)
+        print("{}文件已过滤".format(filename))
+
+    def sam_filter(self, sam_filter_filepath, sorted_input=None, jobs=1, chunk_jobs=1, binary=False):
         """
         主函数
         用于输出最终的去冗余、过滤结果（以列表的形式）：
         [[chr, start_pos, len_sequence, sequence],
         [chr, start_pos, len_sequence, sequence], ...]
+        sorted_input: sam文件是否按染色体、POS排序（详见_sam_filter），默认依据头文件自动判断
+        jobs: 同时处理的样本数（进程数），小于1时使用全部CPU核心；各子进程直接继承dict_chr_info与MH区间索引，不逐个样本传递
+        chunk_jobs: 单个sam文件内分块并行处理的进程数（详见_sam_filter_file），适用于样本数少而单个文件很大的情况；
+                    与jobs同时大于1时进程数为二者之积
+        binary: 是否以二进制列式格式（.mhr，详见ReadStore）储存过滤结果，体积约为文本格式的1/4，MHMatch.match可直接读取
+        //2026.10.18 sam文件改为逐行读取，过滤结果逐行写入，内存占用不再随文件大小增长
+        //2026.10.18 文件夹中可直接放入bam文件（及其.bai索引），详见_sam_open
+        //2026.10.18 新增jobs参数，多个样本并行处理，结果文件命名与串行时一致
+        //2026.10.18 新增chunk_jobs参数
+        //2026.10.18 新增binary参数
         """
 
         """列出文件夹中所有sam文件的名字"""
         sam_filename = Toolsbox.FileTools.ls_directory(self.sam_filepath)
         print(sam_filename)
 
-        """对每一个sam文件进行操作"""
-        for filename in sam_filename:
-            sam_file = Toolsbox.FileTools.open_ls_file(self.sam_filepath + filename)  # 打开sam文件
-
-            sam_filter = self._sam_filter(sam_file)
-
-            """储存临时结果文件"""
-            save_path = sam_filter_filepath + "{}".format(filename)  # 储存临时结果文件的路径（仍以原文件名命名）
-            Toolsbox.FileTools.save_file(Toolsbox.FormatTools.str_ls(sam_filter), save_path)
-            print("{}文件已过滤".format(filename))
\ No newline at end of file
+        """对每一个sam文件进行操作（跳过bam索引文件）"""
+        ls_args = [(filename, sam_filter_filepath, sorted_input, chunk_jobs, binary) for filename in sam_filename
+                   if not filename.endswith(".bai")]
+        Toolsbox.ParallelTools.map_method(self, "_sam_filter_file", ls_args, jobs)
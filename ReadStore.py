@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026
+# @Author  : WangHaoyu
+# @E-mail  : wanghy0707@gmail.com
+# @Github  :
+# @desc    :
+
+
+import mmap
+import struct
+import numpy as np
+
+
+"""
+过滤后测序结果的二进制列式储存格式（.mhr）
+文件结构：文件头（MAGIC + 版本号） | 块1 | 块2 | ... | 索引 | 文件尾（索引偏移 + MAGIC）
+每个块仅包含同一染色体上连续的测序结果，块内按列储存：
+    块头: n_read, n_base, n_escape（均为int64）
+    startpos: int32[n_read]
+    len_sequence_m: int32[n_read]
+    len_sequence: int32[n_read]
+    碱基池: uint8[(n_base+3)//4]，依次为每条测序结果的sequence_m和sequence，A/C/G/T以2bit编码（每字节4个碱基，高位在前）
+    转义位置: int64[n_escape]，碱基池中非A/C/G/T（如N、D）的位置
+    转义字符: uint8[n_escape]
+    各列均以8字节对齐
+索引: n_chr, n_block（int64）；染色体名称（以"\0"连接）；每个块的[染色体编号, n_read, 块偏移]（int64[n_block, 3]）
+块的顺序即测序结果的原顺序；索引中可按染色体直接定位到对应的块
+//2026.10.18 新增
+"""
+
+MAGIC = b"MHRS"
+VERSION = 1
+
+_ENCODE = np.full(256, 255, dtype=np.uint8)  # 碱基编码表，非A/C/G/T为255（转义）
+for _code, _base in enumerate(b"ACGT"):
+    _ENCODE[_base] = _code
+_DECODE = np.frombuffer(b"ACGT", dtype=np.uint8)  # 碱基解码表
+_SHIFT = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def _pad(size):
+    """
+    对齐至8字节所需的填充字节数
+    """
+    return -size % 8
+
+
+class ReadStoreWriter:
+    """
+    写入.mhr文件：逐条写入[chrname, startpos, len_sequence_m, sequence_m, sequence]
+    //2026.10.18 新增
+    //with ReadStoreWriter("xx.sam.mhr") as writer:
+    //    writer.write_rows(sam_filter)
+    """
+
+    def __init__(self, path, block_size=65536):
+        """
+        path: 输出文件的路径
+        block_size: 每个块最多包含的测序结果数目
+        """
+        self.path = path
+        self.block_size = block_size
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", VERSION))
+
+        self.ls_chr = []  # 染色体名称（按首次出现的顺序编号）
+        self.dict_chr_code = {}
+        self.ls_block = []  # 每个块的[染色体编号, n_read, 块偏移]
+
+        self.block_chr = None  # 当前块的染色体
+        self.ls_row = []  # 当前块中的测序结果
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, sequence_single):
+        """
+        写入单条测序结果（sequence_m可为字符串或PreProcessing.CigarWalker）
+        """
+        if sequence_single[0] != self.block_chr or len(self.ls_row) >= self.block_size:
+            self._flush()
+            self.block_chr = sequence_single[0]
+        self.ls_row.append(sequence_single)
+
+    def write_rows(self, sam_filter):
+        """
+        逐条写入可迭代的测序结果
+        """
+        for sequence_single in sam_filter:
+            self.write(sequence_single)
+
+    def _write_array(self, array):
+        """
+        写入单列（以8字节对齐）
+        """
+        data = array.tobytes()
+        self.file.write(data + b"\x00" * _pad(len(data)))
+
+    def _flush(self):
+        """
+        将当前块写入文件
+        """
+        if not self.ls_row:
+            return
+
+        if self.block_chr not in self.dict_chr_code:
+            self.dict_chr_code[self.block_chr] = len(self.ls_chr)
+            self.ls_chr.append(self.block_chr)
+
+        ls_sequence = []
+        for sequence_single in self.ls_row:
+            ls_sequence.append(str(sequence_single[3]))
+            ls_sequence.append(sequence_single[4])
+        array_base = np.frombuffer("".join(ls_sequence).encode("utf-8"), dtype=np.uint8)
+        array_code = _ENCODE[array_base]
+
+        array_escape_pos = np.flatnonzero(array_code == 255)
+        array_escape_char = array_base[array_escape_pos]
+        array_code[array_escape_pos] = 0
+
+        n_base = len(array_code)
+        array_code = np.concatenate([array_code, np.zeros(-n_base % 4, dtype=np.uint8)]).reshape(-1, 4)
+        array_packed = (array_code << _SHIFT).sum(axis=1, dtype=np.uint8)
+
+        self.ls_block.append([self.dict_chr_code[self.block_chr], len(self.ls_row), self.file.tell()])
+        self.file.write(struct.pack("<3q", len(self.ls_row), n_base, len(array_escape_pos)))
+        self._write_array(np.array([int(sequence_single[1]) for sequence_single in self.ls_row], dtype=np.int32))
+        self._write_array(np.array([int(sequence_single[2]) for sequence_single in self.ls_row], dtype=np.int32))
+        self._write_array(np.array([len(sequence_single[4]) for sequence_single in self.ls_row], dtype=np.int32))
+        self._write_array(array_packed)
+        self._write_array(array_escape_pos.astype(np.int64))
+        self._write_array(array_escape_char)
+        self.ls_row = []
+
+    def close(self):
+        """
+        写入剩余的测序结果及索引，并关闭文件
+        """
+        if self.file.closed:
+            return
+        self._flush()
+
+        index_offset = self.file.tell()
+        self.file.write(struct.pack("<2q", len(self.ls_chr), len(self.ls_block)))
+        name = "\0".join(self.ls_chr).encode("utf-8")
+        self.file.write(struct.pack("<q", len(name)) + name + b"\x00" * _pad(len(name)))
+        self._write_array(np.array(self.ls_block, dtype=np.int64).reshape(-1, 3))
+        self.file.write(struct.pack("<q", index_offset) + MAGIC)
+        self.file.close()
+
+
+class ReadStoreReader:
+    """
+    以内存映射的方式读取.mhr文件：数值列直接映射为numpy数组（不复制），碱基以2bit储存，需按块解码为字符串
+    逐条输出时（iter_block、iter_rows）每个块的数值列在输出第一条结果前即转化为列表并释放映射，关闭文件时映射可正常关闭
+    //2026.10.18 新增
+    //reader = ReadStoreReader("xx.sam.mhr")
+    //for sequence_single in reader.iter_rows():
+    //    >>> ['1', 4658200, 151, 'ACGT...', 'ACGT...']
+    """
+
+    def __init__(self, path):
+        """
+        path: .mhr文件的路径
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC or self.mm[-4:] != MAGIC:
+            raise ValueError('"{}" is not a read store file'.format(path))
+        if struct.unpack_from("<I", self.mm, 4)[0] != VERSION:
+            raise ValueError('"{}" has an unsupported version'.format(path))
+
+        offset = struct.unpack_from("<q", self.mm, len(self.mm) - 12)[0]
+        n_chr, n_block, len_name = struct.unpack_from("<3q", self.mm, offset)
+        offset += 24
+        name = bytes(self.mm[offset:offset + len_name]).decode("utf-8")
+        self.ls_chr = name.split("\0") if n_chr else []
+        offset += len_name + _pad(len_name)
+        self.array_block = np.frombuffer(self.mm, dtype=np.int64, count=n_block * 3, offset=offset).reshape(-1, 3)
+
+        self.dict_chr_block = {chrname: [] for chrname in self.ls_chr}  # 每条染色体对应的块序号
+        for index, chr_code in enumerate(self.array_block[:, 0]):
+            self.dict_chr_block[self.ls_chr[chr_code]].append(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def block_num(self):
+        """
+        块的数目
+        """
+        return len(self.array_block)
+
+    def _array(self, dtype, count, offset):
+        """
+        从offset处映射一列，输出(数组, 下一列的偏移)
+        """
+        array = np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset)
+        return array, offset + array.nbytes + _pad(array.nbytes)
+
+    def block_columns(self, index):
+        """
+        输出第index个块的各列：(chrname, startpos, len_sequence_m, len_sequence, 碱基池（已解码的字符串）)
+        其中数值列为映射至文件的只读数组（不复制），调用方需在关闭文件前释放（否则映射无法关闭，见close）
+        """
+        chr_code, _, offset = (int(i) for i in self.array_block[index])
+        n_read, n_base, n_escape = struct.unpack_from("<3q", self.mm, offset)
+        offset += 24
+
+        array_startpos, offset = self._array(np.int32, n_read, offset)
+        array_len_m, offset = self._array(np.int32, n_read, offset)
+        array_len_seq, offset = self._array(np.int32, n_read, offset)
+        array_packed, offset = self._array(np.uint8, (n_base + 3) // 4, offset)
+        array_escape_pos, offset = self._array(np.int64, n_escape, offset)
+        array_escape_char, offset = self._array(np.uint8, n_escape, offset)
+
+        array_base = _DECODE[((array_packed[:, None] >> _SHIFT) & 3).reshape(-1)[:n_base]]
+        array_base[array_escape_pos] = array_escape_char
+        return self.ls_chr[chr_code], array_startpos, array_len_m, array_len_seq, array_base.tobytes().decode("utf-8")
+
+    def iter_block(self, index):
+        """
+        逐条输出第index个块中的测序结果：[chrname, startpos, len_sequence_m, sequence_m, sequence]
+        """
+        chrname, array_startpos, array_len_m, array_len_seq, str_base = self.block_columns(index)
+        ls_row_len = list(zip(array_startpos.tolist(), array_len_m.tolist(), array_len_seq.tolist()))
+        del array_startpos, array_len_m, array_len_seq  # 输出前释放映射的数组：生成器暂停或中断时不再引用映射
+
+        offset = 0
+        for startpos, len_m, len_seq in ls_row_len:
+            sequence_m = str_base[offset:offset + len_m]
+            sequence = str_base[offset + len_m:offset + len_m + len_seq]
+            offset += len_m + len_seq
+            yield [chrname, startpos, len_m, sequence_m, sequence]
+
+    def iter_rows(self, block_beg=0, block_end=None, chrname=None):
+        """
+        按原顺序逐条输出第[block_beg, block_end)个块中的测序结果；chrname不为None时仅输出该染色体上的测序结果
+        """
+        if block_end is None:
+            block_end = self.block_num()
+        if chrname is None:
+            ls_index = range(block_beg, block_end)
+        else:
+            ls_index = [index for index in self.dict_chr_block.get(chrname, []) if block_beg <= index < block_end]
+
+        for index in ls_index:
+            yield from self.iter_block(index)
+
+    def close(self):
+        """
+        关闭文件（映射仍被引用时不强制关闭，交由垃圾回收释放，以免掩盖正在处理的异常）
+        """
+        self.array_block = None
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+        self.file.close()
@@ -7,8 +7,11 @@
 
 
 import os
+import gzip
 import collections
 import copy
+import multiprocessing
+import concurrent.futures
 
 
 class FileTools:
@@ -24,21 +27,35 @@ class FileTools:
         return os.listdir(path)
 
     @classmethod
-    def open_ls_file(cls, path, separate_sym="\t", type="str"):
+    def iter_ls_file(cls, path, separate_sym="\t", type="str"):
         """
-        依据文件的行分隔符，以列表形式打开文件（一行为一个列表）
+        依据文件的行分隔符，以生成器形式逐行读取文件（一行为一个列表），内存占用与文件大小无关
+        //2026.10.18 新增
         """
-        ls_file = []
         with open(path, "r", encoding="utf-8") as file:
             if type == "str":
-                for line in file.readlines():
-                    ls_file.append(list(line.strip("\n").split(separate_sym)))
+                for line in file:
+                    yield list(line.strip("\n").split(separate_sym))
             elif type == "float":
-                for line in file.readlines():
+                for line in file:
                     line_str = list(line.strip("\n").split(separate_sym))
-                    line_float = [float(i) for i in line_str]
-                    ls_file.append(line_float)
-        return ls_file
+                    yield [float(i) for i in line_str]
+
+    @classmethod
+    def chunk_ls_file(cls, path, chunk_size=100000, separate_sym="\t", type="str"):
+        """
+        依据文件的行分隔符，以生成器形式按批次读取文件，每批次为包含chunk_size行的二维列表（最后一批可不足chunk_size行）
+        //2026.10.18 新增
+        """
+        return cls._chunk(cls.iter_ls_file(path, separate_sym, type), chunk_size)
+
+    @classmethod
+    def open_ls_file(cls, path, separate_sym="\t", type="str"):
+        """
+        依据文件的行分隔符，以列表形式打开文件（一行为一个列表）
+        //2026.10.18 改为对iter_ls_file的包装
+        """
+        return list(cls.iter_ls_file(path, separate_sym, type))
 
     @classmethod
     def open_dict_file(cls, path, separate_sym="\t"):
@@ -64,18 +81,95 @@ class FileTools:
         return ls_allele
 
     @classmethod
-    def open_vcf_file(cls, path, separate_sym="\t"):
+    def iter_vcf_file(cls, path, separate_sym="\t"):
         """
-        打开vcf文件（不包括注释行）
+        以生成器形式逐行读取vcf文件（不包括注释行），内存占用与文件大小无关；文件名以".gz"结尾时按gzip格式读取
+        //2026.10.18 新增
         """
-        ls_vcf = []
-        with open(path, "r") as file:
-            for line in file.readlines():
+        with (gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")) as file:
+            for line in file:
                 if line.startswith("#"):
                     pass
                 else:
-                    ls_vcf.append(list(line.strip("\n").split(separate_sym)))
-        return ls_vcf
+                    yield list(line.strip("\n").split(separate_sym))
+
+    @classmethod
+    def chunk_vcf_file(cls, path, chunk_size=100000, separate_sym="\t"):
+        """
+        以生成器形式按批次读取vcf文件（不包括注释行），每批次为包含chunk_size行的二维列表
+        //2026.10.18 新增
+        """
+        return cls._chunk(cls.iter_vcf_file(path, separate_sym), chunk_size)
+
+    @classmethod
+    def open_vcf_file(cls, path, separate_sym="\t"):
+        """
+        打开vcf文件（不包括注释行）
+        //2026.10.18 改为对iter_vcf_file的包装
+        """
+        return list(cls.iter_vcf_file(path, separate_sym))
+
+    @classmethod
+    def _chunk(cls, iter_line, chunk_size):
+        """
+        将逐行读取的生成器转化为按批次输出的生成器
+        """
+        if chunk_size < 1:
+            raise ValueError('"chunk_size" must be a positive integer')
+
+        ls_chunk = []
+        for line in iter_line:
+            ls_chunk.append(line)
+
+            if len(ls_chunk) == chunk_size:
+                yield ls_chunk
+                ls_chunk = []
+
+        if ls_chunk:
+            yield ls_chunk
+
+    @classmethod
+    def split_file(cls, path, chunk_num=1, chunk_size=None):
+        """
+        将文件按字节大小近似均分为若干块，分界点对齐至行首，输出[(起始字节, 终止字节), ...]
+        chunk_num: 分块数目；chunk_size: 每块的最大字节数（不为None时，分块数目至少为文件大小/chunk_size）
+        //2026.10.18 新增
+        """
+        size = os.path.getsize(path)
+        if chunk_size:
+            chunk_num = max(chunk_num, -(-size // chunk_size))
+
+        ls_offset = [0]
+        with open(path, "rb") as file:
+            for i in range(1, chunk_num):
+                offset = size * i // chunk_num
+                if offset <= ls_offset[-1]:
+                    continue
+                file.seek(offset - 1)
+                file.readline()  # 移动至下一行的行首
+                ls_offset.append(file.tell())
+        ls_offset.append(size)
+        return [(beg, end) for beg, end in zip(ls_offset[:-1], ls_offset[1:]) if beg < end]
+
+    @classmethod
+    def iter_ls_file_range(cls, path, beg, end, separate_sym="\t", comment_sym=None):
+        """
+        以生成器形式逐行读取文件中起始于[beg, end)字节范围内的行（一行为一个列表），beg需位于行首（见split_file）
+        comment_sym: 注释行的起始字符，不为None时跳过注释行
+        //2026.10.18 新增
+        """
+        with open(path, "rb") as file:
+            file.seek(beg)
+            offset = beg
+            for line in file:
+                if offset >= end:
+                    break
+                offset += len(line)
+
+                line = line.decode("utf-8").rstrip("\r\n")
+                if comment_sym is not None and line.startswith(comment_sym):
+                    continue
+                yield list(line.split(separate_sym))
 
     @classmethod
     def save_file(cls, output_file, output_path):
@@ -88,6 +182,31 @@ class FileTools:
             file.write(str_file)
             file.close()
 
+    @classmethod
+    def save_file_iter(cls, output_file, output_path):
+        """
+        以"\t"为分隔符，逐行储存生成的文件（可迭代的二维列表，如生成器），输出格式与save_file一致
+        //2026.10.18 新增
+        """
+        with open(output_path, "w") as file:
+            sep = ""
+            for ls in output_file:
+                file.write(sep + "\t".join(ls))
+                sep = "\n"
+
+    @classmethod
+    def save_file_text_iter(cls, output_text, output_path):
+        """
+        逐段储存已转化为字符串的文件内容（可迭代，每段为以"\n"连接的多行），段与段之间以"\n"连接，空段跳过
+        //2026.10.18 新增
+        """
+        with open(output_path, "w") as file:
+            sep = ""
+            for text in output_text:
+                if text:
+                    file.write(sep + text)
+                    sep = "\n"
+
     @classmethod
     def save_file_match(cls, output_file, output_path):
         """
@@ -113,6 +232,239 @@ class FileTools:
         cls.save_file(ls_mh_match_all_sorted_str, output_path)
 
 
+class LineWriter:
+    """
+    以"\t"为分隔符逐行写入文件（缓冲写入，不在内存中保留全部内容），未压缩、未限制行数时输出格式与FileTools.save_file一致
+    可选gzip压缩（文件名后加".gz"）、最多写入的行数、按比例抽样写入（等间隔抽样，结果可重复）
+    //2026.10.18 新增
+    //with LineWriter("xx.sam", compress=True, sample_rate=0.1) as writer:
+    //    writer.append(["CHBCHR01_0674112", "ACGT...", "ACGTACGTACGT", "ACGTAC", "ACGZAC"])
+    """
+
+    def __init__(self, path, compress=False, max_line=None, sample_rate=None, buffer_line=10000):
+        """
+        path: 输出文件的路径
+        compress: 是否以gzip压缩
+        max_line: 最多写入的行数，为None时不限制
+        sample_rate: 抽样写入的比例（0-1），为None时全部写入
+        buffer_line: 缓冲的行数，达到后写入文件
+        """
+        if sample_rate is not None and not 0 < sample_rate <= 1:
+            raise ValueError('"sample_rate" must between 0 and 1')
+        if max_line is not None and max_line < 0:
+            raise ValueError('"max_line" must be a non-negative integer')
+
+        self.path = path + ".gz" if compress else path
+        self.file = gzip.open(self.path, "wt") if compress else open(self.path, "w")
+        self.max_line = max_line
+        self.sample_rate = sample_rate
+        self.buffer_line = buffer_line
+
+        self.line_num = 0  # 输入的行数
+        self.line_written = 0  # 写入的行数
+        self.ls_buffer = []
+        self.sep = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, ls):
+        """
+        写入单行（列表，各项均为字符串）
+        """
+        self.line_num += 1
+        if self.sample_rate is not None and \
+                int(self.line_num * self.sample_rate) == int((self.line_num - 1) * self.sample_rate):
+            return  # 未被抽中
+        if self.max_line is not None and self.line_written >= self.max_line:
+            return
+
+        self.ls_buffer.append("\t".join(ls))
+        self.line_written += 1
+        if len(self.ls_buffer) >= self.buffer_line:
+            self.flush()
+
+    def flush(self):
+        """
+        将缓冲的内容写入文件
+        """
+        if self.ls_buffer:
+            self.file.write(self.sep + "\n".join(self.ls_buffer))
+            self.sep = "\n"
+            self.ls_buffer = []
+
+    def close(self):
+        """
+        写入剩余内容并关闭文件
+        """
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+class ParallelTools:
+    """
+    多进程并行相关工具
+    //2026.10.18 新增
+    """
+
+    @classmethod
+    def jobs_num(cls, jobs):
+        """
+        确定实际使用的进程数：jobs为None时为1，jobs小于1时为CPU核心数
+        """
+        if jobs is None:
+            return 1
+        if jobs < 1:
+            return os.cpu_count() or 1
+        return jobs
+
+    @classmethod
+    def map_method(cls, obj, method_name, ls_args, jobs=1):
+        """
+        以多进程的方式对ls_args中的每一组参数调用obj的method_name方法，按ls_args的顺序返回结果
+        obj在每个子进程启动时仅传递一次：支持fork的系统上子进程直接继承（写时复制，不进行序列化），
+        其余系统上在子进程初始化时序列化一次，而非每个任务都传递一次
+        jobs: 进程数，为1时（或任务数不超过1时）在当前进程中依次执行
+        """
+        return list(cls.iter_method(obj, method_name, ls_args, jobs))
+
+    @classmethod
+    def iter_method(cls, obj, method_name, ls_args, jobs=1, crash_result=None):
+        """
+        map_method的生成器形式：按ls_args的顺序逐个输出结果，同一时间最多保留2*jobs个未输出的任务，
+        结果较大时内存占用不随任务数增长
+        crash_result: 子进程异常终止（如内存不足被系统终止、段错误）时的处理。为None时抛出BrokenProcessPool；
+                      否则将未完成的任务逐个在单独的进程中重新执行（见_isolate），仍异常终止的任务以crash_result(args)
+                      作为结果，其余任务在重建的进程池中继续执行（输出结果时、提交任务时发现进程池异常终止均如此处理）
+        //2026.10.18 新增
+        //2026.10.18 新增crash_result参数
+        """
+        ls_args = list(ls_args)
+        jobs = min(cls.jobs_num(jobs), len(ls_args))
+        if jobs <= 1:
+            method = getattr(obj, method_name)
+            for args in ls_args:
+                yield method(*args)
+            return
+
+        executor = cls._executor(obj, method_name, jobs)
+        queue_task = collections.deque()  # [args, future]
+        try:
+            for args in ls_args:
+                executor = cls._submit(queue_task, executor, args, obj, method_name, jobs, crash_result)
+
+                if len(queue_task) >= 2 * jobs:
+                    result, executor = cls._pop_result(queue_task, executor, obj, method_name, jobs, crash_result)
+                    yield result
+
+            while queue_task:
+                result, executor = cls._pop_result(queue_task, executor, obj, method_name, jobs, crash_result)
+                yield result
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @classmethod
+    def _executor(cls, obj, method_name, jobs):
+        """
+        创建进程池（支持fork时子进程直接继承obj）
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("fork")
+        else:
+            mp_context = multiprocessing.get_context()
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                      mp_context=mp_context,
+                                                      initializer=_parallel_init,
+                                                      initargs=(obj, method_name))
+
+    @classmethod
+    def _submit(cls, queue_task, executor, args, obj, method_name, jobs, crash_result):
+        """
+        提交单个任务并加入queue_task，输出继续使用的进程池（提交时进程池已异常终止则先恢复，见_recover）
+        """
+        try:
+            future = executor.submit(_parallel_call, args)
+        except concurrent.futures.process.BrokenProcessPool:
+            if crash_result is None:
+                raise
+            executor = cls._recover(queue_task, executor, obj, method_name, jobs, crash_result)
+            future = executor.submit(_parallel_call, args)
+        queue_task.append([args, future])
+        return executor
+
+    @classmethod
+    def _recover(cls, queue_task, executor, obj, method_name, jobs, crash_result):
+        """
+        进程池异常终止后：关闭原进程池，将未完成的任务逐个重新执行（见_isolate），输出重建的进程池
+        """
+        executor.shutdown()
+        cls._isolate(queue_task, obj, method_name, jobs, crash_result)
+        return cls._executor(obj, method_name, jobs)
+
+    @classmethod
+    def _pop_result(cls, queue_task, executor, obj, method_name, jobs, crash_result):
+        """
+        输出最早提交的任务的结果，以及继续使用的进程池（进程池异常终止时重建）
+        """
+        try:
+            result = queue_task[0][1].result()
+        except concurrent.futures.process.BrokenProcessPool:
+            if crash_result is None:
+                raise
+            executor = cls._recover(queue_task, executor, obj, method_name, jobs, crash_result)
+            result = queue_task[0][1].result()
+        queue_task.popleft()
+        return result, executor
+
+    @classmethod
+    def _isolate(cls, queue_task, obj, method_name, jobs, crash_result):
+        """
+        进程池异常终止后，无法确定是哪个任务导致的，将因此未完成的任务各自在单独的进程中重新执行（同时最多jobs个），
+        仍异常终止的任务以crash_result(args)作为结果；执行后的结果替换至queue_task中
+        """
+        ls_task = [task for task in queue_task
+                   if isinstance(task[1].exception(), concurrent.futures.process.BrokenProcessPool)]
+        for beg in range(0, len(ls_task), jobs):
+            ls_run = []
+            for task in ls_task[beg:beg + jobs]:
+                executor = cls._executor(obj, method_name, 1)
+                ls_run.append((task, executor, executor.submit(_parallel_call, task[0])))
+
+            for task, executor, future in ls_run:
+                future_isolated = concurrent.futures.Future()
+                try:
+                    future_isolated.set_result(future.result())
+                except concurrent.futures.process.BrokenProcessPool:
+                    future_isolated.set_result(crash_result(task[0]))
+                except Exception as error:
+                    future_isolated.set_exception(error)
+                executor.shutdown()
+                task[1] = future_isolated
+
+
+_parallel_method = None  # 子进程中待调用的方法（由_parallel_init设置）
+
+
+def _parallel_init(obj, method_name):
+    """
+    ParallelTools子进程的初始化函数
+    """
+    global _parallel_method
+    _parallel_method = getattr(obj, method_name)
+
+
+def _parallel_call(args):
+    """
+    ParallelTools子进程中执行单个任务
+    """
+    return _parallel_method(*args)
+
+
 class FormatTools:
     """
     格式处理相关小工具
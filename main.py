@@ -6,6 +6,7 @@
 # @desc    :
 
 
+import sys
 import PreProcessing
 import Match
 import MHCalling
@@ -29,40 +30,55 @@ if __name__ == "__main__":
     sam_match_filepath = "C:/Users/Hao_Yu/Desktop/use/sam_match/"  # 储存匹配结果文件的路径
     sam_mismatch_filepath = "C:/Users/Hao_Yu/Desktop/use/sam_mismatch/"  # 储存匹配错误结果文件的路径
 
+    """预处理缓存储存路径"""
+    reference_cache_filepath = "C:/Users/Hao_Yu/Desktop/use/reference.cache"  # 储存INFO、vcf、primer预处理结果的缓存文件路径
+
     """MH Calling相关储存路径"""
     mh_calling_single_filepath = "C:/Users/Hao_Yu/Desktop/use/result/MH calling (single)/"  # 储存mh calling(single)结果
 
+    """【运行设置】"""
+    jobs = 1  # 并行进程数（小于1时使用全部CPU核心）
+
     """
     具体函数
     """
     """文件预处理（必须）"""
-    dict_chr_info, ls_id = PreProcessing.PreInfo(info_filepath).info_filter()
-    dict_chr_relalt = PreProcessing.PreVcf(vcf_filepath).vcf_filter()
-    dict_mh_primer = PreProcessing.PrePrimer(primer_filepath,
-                                             ls_id).primer_load()
+    """输入文件未变化时直接读取缓存，否则依次调用PreInfo、PreVcf（仅保留INFO中MH所包含SNP的REF/ALT）、PrePrimer并更新缓存"""
+    dict_chr_info, ls_id, dict_chr_relalt, dict_mh_primer = PreProcessing.PreCache(
+        reference_cache_filepath).cache_load(info_filepath,
+                                             vcf_filepath,
+                                             primer_filepath,
+                                             jobs=jobs)
+    panel = PreProcessing.Panel(dict_chr_info)  # 以数组储存的MH panel（PreSam、MHMatch、SingleCall共用）
 
     """Sam文件过滤"""
     PreProcessing.PreSam(sam_filepath,
-                         dict_chr_info).sam_filter(sam_filter_filepath)  # 由于SAM文件预处理会储存处理后的文件，故不必赋值
+                         panel).sam_filter(sam_filter_filepath,
+                                           jobs=jobs)  # 由于SAM文件预处理会储存处理后的文件，故不必赋值
 
-    """MH匹配"""
-    Match.MHMatch(dict_chr_info,
-                  ls_id,
-                  dict_chr_relalt,
-                  dict_mh_primer).match(sam_filter_filepath,
-                                        sam_match_filepath,
-                                        sam_mismatch_filepath,
-                                        filter=False,
-                                        purity_filter=0.9,
-                                        umi_count_filter=10,
-                                        allele_num_filter=10,
-                                        allele_proportion_filter=0.01)
+    """MH匹配（存在匹配失败的样本时不进行MH Calling，以非0状态退出）"""
+    dict_match_failure = Match.MHMatch(dict_chr_info,
+                                       ls_id,
+                                       dict_chr_relalt,
+                                       dict_mh_primer,
+                                       panel=panel).match(sam_filter_filepath,
+                                                          sam_match_filepath,
+                                                          sam_mismatch_filepath,
+                                                          filter=False,
+                                                          purity_filter=0.9,
+                                                          umi_count_filter=10,
+                                                          allele_num_filter=10,
+                                                          allele_proportion_filter=0.01,
+                                                          jobs=jobs)
+    if dict_match_failure:
+        sys.exit("{}个样本匹配失败，未进行MH Calling：{}".format(len(dict_match_failure), ", ".join(dict_match_failure)))
 
     """MH Calling"""
     MHCalling.SingleCall(sam_match_filepath,
                          info_ref_filepath,
                          dict_chr_info,
                          ls_id,
-                         dict_chr_relalt).singlecall(peak_height_ratio=0.3,
-                                                     save=True,
-                                                     save_path=mh_calling_single_filepath)
\ No newline at end of file
+                         dict_chr_relalt,
+                         panel=panel).singlecall(peak_height_ratio=0.3,
+                                                 save=True,
+                                                 save_path=mh_calling_single_filepath)
\ No newline at end of file